@@ -0,0 +1,72 @@
+"""
+Throughput of evaluation/analysis_pipeline.py against the local stub of the Gemini API.
+
+The stub answers every request after a random latency around --latency seconds and allows
+--rate requests per minute per key. The pipeline limits every key to --client-rate requests
+per minute, by default the same, so a higher --client-rate shows how the keys rotate on 429s. The pipeline runs on the first --limit entities of every
+type, once with one request at a time (like the sequential pipeline) and once per concurrency
+given, each time into a new temporary output folder.
+
+Usage (from the root of the repository):
+    python -m benchmarks.bench_analysis_pipeline [--latency 0.2] [--rate 600] [--client-rate 600] [--limit 3] [--concurrency 8 32]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+
+from evaluation import analysis_pipeline
+from evaluation.stub_llm_server import serve
+
+KEYS = ["key-a", "key-b", "key-c", "key-d"]
+
+
+def run_once(base_url, concurrency, rate, limit):
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        data_points, key_summary = asyncio.run(
+            analysis_pipeline.run(
+                KEYS,
+                dt=directory,
+                base_url=base_url,
+                concurrency=concurrency,
+                requests_per_minute=rate,
+                limit=limit,
+            )
+        )
+        seconds = time.perf_counter() - start
+
+    requests = sum(key["requests"] for key in key_summary.values())
+    rate_limited = sum(key["rate_limited"] for key in key_summary.values())
+    responses = sum(data_points.values())
+    return seconds, requests, rate_limited, responses
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rate", type=int, default=600, help="requests per minute per key")
+    parser.add_argument("--client-rate", type=int, default=None)
+    parser.add_argument("--limit", type=int, default=3, help="entities per type")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32])
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.rate)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    print(
+        f"{'concurrency':>11} {'time (s)':>9} {'requests':>9} {'429s':>5} {'responses':>10} {'req/s':>7}"
+    )
+    try:
+        for concurrency in [1] + args.concurrency:
+            seconds, requests, rate_limited, responses = run_once(
+                base_url, concurrency, args.client_rate or args.rate, args.limit
+            )
+            print(
+                f"{concurrency:>11} {seconds:>9.2f} {requests:>9} {rate_limited:>5}"
+                f" {responses:>10} {requests / seconds:>7.1f}"
+            )
+    finally:
+        server.shutdown()
@@ -0,0 +1,254 @@
+"""
+Compare utils/events/metrics.py with the functions of data/events/plot_RadarPlot.py, which
+calculate every metric with another pass over the events.
+
+The Wyscout events are not in the repository, so random events are made for the games of
+data/events/minutes_played_per_game_England.json, repeated as several leagues with new match
+ids, with the players of data/events/players.json. The same events are written to a parquet
+file in the format of utils/events/ingest.py for forwards_per90. The functions of the radar plot
+run on a DataFrame of the events in the json format, with possession_per_player for the
+possession (the loop of the radar plot is compared in bench_possession.py) and fit_logistic
+instead of the GLM of statsmodels. Both must give the same Forwards.csv.
+
+Usage (from the root of the repository):
+    python -m benchmarks.bench_metrics [--leagues 3] [--events 1700] [--workers 1 4]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from benchmarks.bench_possession import load_minutes_per_game
+from utils.events import ingest
+from utils.events.metrics import fit_logistic, forwards_per90
+from utils.events.possession import adjust_per90, possession_per_player
+
+SUB_EVENTS = {
+    "Pass": ["Simple pass", "Smart pass", "High pass", "Cross"],
+    "Duel": [
+        "Air duel",
+        "Ground attacking duel",
+        "Ground defending duel",
+        "Ground loose ball duel",
+    ],
+    "Shot": ["Shot"],
+    "Free Kick": ["Free Kick", "Corner", "Penalty"],
+    "Others on the ball": ["Touch"],
+}
+# Probability of every tag per event
+TAGS = {
+    "Pass": {1801: 0.8, 301: 0.01, 302: 0.03},
+    "Duel": {703: 0.5, 701: 0.4},
+    "Shot": {403: 0.2, 1801: 0.3},
+    "Free Kick": {1801: 0.7},
+    "Others on the ball": {},
+}
+
+
+def make_events(minutes_per_game, events_per_match, seed=0):
+    """
+    Random events of the players in minutes_per_game, as columns in the format of ingest.py.
+    """
+    rng = np.random.default_rng(seed)
+    games = minutes_per_game.groupby(["matchId", "teamId"])["playerId"].unique()
+    matches = games.index.get_level_values("matchId").unique()
+    n = events_per_match * len(matches)
+
+    match_ids = np.repeat(matches.to_numpy(), events_per_match)
+    first_half = np.tile(np.arange(events_per_match) < events_per_match // 2, len(matches))
+    seconds = np.where(first_half, rng.uniform(0, 2900, n), rng.uniform(0, 2950, n))
+    order = np.lexsort([seconds, ~first_half, match_ids])
+    seconds = seconds[order]
+
+    team_index = rng.integers(0, 2, n)
+    team_ids = np.empty(n, dtype=np.int64)
+    player_ids = np.empty(n, dtype=np.int64)
+    for i, match_id in enumerate(matches):
+        rows = slice(i * events_per_match, (i + 1) * events_per_match)
+        teams = games.loc[match_id]
+        team = team_index[rows] % len(teams)
+        team_ids[rows] = teams.index.to_numpy()[team]
+        for j, players in enumerate(teams):
+            in_team = np.flatnonzero(team == j) + i * events_per_match
+            player_ids[in_team] = rng.choice(players, len(in_team))
+
+    event_names = rng.choice(list(SUB_EVENTS), n, p=[0.5, 0.25, 0.02, 0.08, 0.15])
+    # The radar plot counts a reception across matches, the engine does not, so every match
+    # ends with another event
+    event_names[events_per_match - 1 :: events_per_match] = "Others on the ball"
+    sub_event_names = np.empty(n, dtype=object)
+    tags = [[] for _ in range(n)]
+    positions = rng.integers(0, 101, (n, 4))
+    for event_name, sub_events in SUB_EVENTS.items():
+        rows = np.flatnonzero(event_names == event_name)
+        sub_event_names[rows] = rng.choice(sub_events, len(rows))
+        for tag_id, probability in TAGS[event_name].items():
+            for row in rows[rng.random(len(rows)) < probability]:
+                tags[row].append(tag_id)
+
+    # Shots near the goal, more goals closer to it
+    shots = np.flatnonzero(event_names == "Shot")
+    positions[shots, 0] = rng.integers(70, 100, len(shots))
+    positions[shots, 1] = rng.integers(20, 81, len(shots))
+    goal = rng.random(len(shots)) < 1 / (1 + np.exp((100 - positions[shots, 0]) / 6 - 1))
+    for row in shots[goal]:
+        tags[row].append(101)
+
+    return {
+        "matchId": match_ids,
+        "matchPeriod": np.where(first_half, "1H", "2H"),
+        "eventSec": seconds,
+        "teamId": team_ids,
+        "playerId": player_ids,
+        "eventName": event_names,
+        "subEventName": sub_event_names,
+        "tags": tags,
+        "x_start": positions[:, 0],
+        "y_start": positions[:, 1],
+        "x_end": positions[:, 2],
+        "y_end": positions[:, 3],
+    }
+
+
+def to_json_events(columns):
+    # The events as in the json files, for the functions of the radar plot
+    events = pd.DataFrame(dict((name, columns[name]) for name in ingest.EVENT_FIELDS))
+    events["eventId"] = np.arange(len(events))
+    events["tags"] = [[{"id": tag_id} for tag_id in tags] for tags in columns["tags"]]
+    events["positions"] = [
+        [{"y": y, "x": x}, {"y": end_y, "x": end_x}]
+        for x, y, end_x, end_y in zip(
+            columns["x_start"].tolist(),
+            columns["y_start"].tolist(),
+            columns["x_end"].tolist(),
+            columns["y_end"].tolist(),
+        )
+    ]
+    return events
+
+
+def calulatexG(df):
+    # From the radar plot, with fit_logistic for P(goal) instead of the GLM, so 1/(1+exp(-...))
+    shots = df.loc[df["eventName"] == "Shot"].copy()
+    shots["X"] = shots.positions.apply(lambda cell: (100 - cell[0]["x"]) * 105 / 100)
+    shots["C"] = shots.positions.apply(lambda cell: abs(cell[0]["y"] - 50) * 68 / 100)
+    shots["Distance"] = np.sqrt(shots["X"] ** 2 + shots["C"] ** 2)
+    angle = np.arctan(7.32 * shots["X"] / (shots["X"] ** 2 + shots["C"] ** 2 - (7.32 / 2) ** 2))
+    shots["Angle"] = np.where(angle > 0, angle, angle + np.pi)
+    shots["Goal"] = shots.tags.apply(lambda x: 1 if {"id": 101} in x else 0)
+    headers = shots.loc[shots.apply(lambda x: {"id": 403} in x.tags, axis=1)]
+    non_headers = shots.drop(headers.index)
+
+    xg = []
+    for model_shots in [headers, non_headers]:
+        b = fit_logistic(model_shots[["Distance", "Angle"]].to_numpy(), model_shots["Goal"])
+        xG = 1 / (1 + np.exp(-b[0] - b[1] * model_shots["Distance"] - b[2] * model_shots["Angle"]))
+        xg.append(model_shots.assign(npxG=xG)[["playerId", "npxG"]])
+    return pd.concat(xg).groupby(["playerId"])["npxG"].sum().reset_index()
+
+
+def FinalThird(df):
+    df = df.copy()
+    df["nextPlayerId"] = df["playerId"].shift(-1)
+    passes = df.loc[df["eventName"] == "Pass"].copy()
+    passes["end_x"] = passes.positions.apply(lambda cell: (cell[1]["x"]) * 105 / 100)
+    accurate_passes = passes.loc[passes.apply(lambda x: {"id": 1801} in x.tags, axis=1)]
+    final_third_passes = accurate_passes.loc[accurate_passes["end_x"] > 2 * 105 / 3]
+    ftp_player = final_third_passes.groupby(["playerId"]).end_x.count().reset_index()
+    ftp_player.rename(columns={"end_x": "final_third_passes"}, inplace=True)
+    rtp_player = final_third_passes.groupby(["nextPlayerId"]).end_x.count().reset_index()
+    rtp_player.rename(
+        columns={"end_x": "final_third_receptions", "nextPlayerId": "playerId"}, inplace=True
+    )
+    return ftp_player.merge(rtp_player, how="outer", on=["playerId"])
+
+
+def wonDuels(df):
+    air_duels = df.loc[df["subEventName"] == "Air duel"]
+    won_air_duels = air_duels.loc[air_duels.apply(lambda x: {"id": 703} in x.tags, axis=1)]
+    wad_player = won_air_duels.groupby(["playerId"]).eventId.count().reset_index()
+    wad_player.rename(columns={"eventId": "air_duels_won"}, inplace=True)
+    ground_duels = df.loc[df["subEventName"].isin(["Ground attacking duel"])]
+    won_ground_duels = ground_duels.loc[ground_duels.apply(lambda x: {"id": 703} in x.tags, axis=1)]
+    wgd_player = won_ground_duels.groupby(["playerId"]).eventId.count().reset_index()
+    wgd_player.rename(columns={"eventId": "ground_duels_won"}, inplace=True)
+    return wgd_player.merge(wad_player, how="outer", on=["playerId"])
+
+
+def smartPasses(df):
+    smart_passes = df.loc[df["subEventName"] == "Smart pass"]
+    smart_passes_made = smart_passes.loc[
+        smart_passes.apply(lambda x: {"id": 1801} in x.tags, axis=1)
+    ]
+    sp_player = smart_passes_made.groupby(["playerId"]).eventId.count().reset_index()
+    sp_player.rename(columns={"eventId": "smart_passes"}, inplace=True)
+    return sp_player
+
+
+def GoalsAssistsKeyPasses(df):
+    shots = df.loc[df["subEventName"] == "Shot"]
+    goals = shots.loc[shots.apply(lambda x: {"id": 101} in x.tags, axis=1)]
+    passes = df.loc[df["eventName"] == "Pass"]
+    assists = passes.loc[passes.apply(lambda x: {"id": 301} in x.tags, axis=1)]
+    key_passes = passes.loc[passes.apply(lambda x: {"id": 302} in x.tags, axis=1)]
+    data = None
+    for events, name in [(goals, "goals"), (assists, "assists"), (key_passes, "key_passes")]:
+        counts = events.groupby(["playerId"]).eventId.count().reset_index()
+        counts.rename(columns={"eventId": name}, inplace=True)
+        data = counts if data is None else data.merge(counts, how="outer", on=["playerId"])
+    return data
+
+
+def forwards_multi_pass(train, minutes_per_game, players):
+    # The summary of the radar plot
+    summary = pd.DataFrame(train["playerId"].unique(), columns=["playerId"])
+    for metrics in [calulatexG, FinalThird, wonDuels, smartPasses, GoalsAssistsKeyPasses]:
+        summary = summary.merge(metrics(train), how="left", on=["playerId"])
+    minutes = minutes_per_game.groupby(["playerId"]).minutesPlayed.sum().reset_index()
+    summary = minutes.merge(summary, how="left", on=["playerId"]).fillna(0)
+    summary = summary.loc[summary["minutesPlayed"] > 400]
+    forwards = players.loc[players["role"] == "Forward", ["playerId", "shortName"]]
+    summary = summary.merge(forwards, how="inner", on=["playerId"])
+    return adjust_per90(summary, possession_per_player(train, minutes_per_game))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--leagues", type=int, default=3)
+    parser.add_argument("--events", type=int, default=1700, help="events per match")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    minutes_per_game = load_minutes_per_game(args.leagues)
+    columns = make_events(minutes_per_game, args.events)
+
+    with tempfile.TemporaryDirectory() as directory:
+        events_path = os.path.join(directory, "events.parquet")
+        pq.write_table(
+            ingest.to_table(columns, ingest.EVENT_SCHEMA),
+            events_path,
+            row_group_size=ingest.BATCH_SIZE,
+        )
+        players_path = os.path.join(directory, "players.parquet")
+        ingest.convert_players("data/events/players.json", players_path)
+        players = pd.read_parquet(players_path)
+        print(f"{len(columns['matchId'])} events, {minutes_per_game['matchId'].nunique()} matches")
+
+        train = to_json_events(columns)
+        start = time.perf_counter()
+        expected = forwards_multi_pass(train, minutes_per_game, players)
+        print(f"{'multi-pass':>16} {time.perf_counter() - start:>7.2f}s")
+        del train
+
+        for workers in args.workers:
+            start = time.perf_counter()
+            forwards = forwards_per90([events_path], minutes_per_game, players, workers=workers)
+            print(f"{f'{workers} workers':>16} {time.perf_counter() - start:>7.2f}s")
+
+            pd.testing.assert_frame_equal(forwards, expected, check_dtype=False, rtol=1e-9)
+    print(f"{len(expected)} forwards, the same for all")
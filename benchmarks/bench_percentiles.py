@@ -0,0 +1,57 @@
+"""
+Compare the PercentileTable of utils/stats_utils.py with a percentileofscore call per metric
+and player, like plot_RadarPlot.py, for the radar plots of every player.
+
+The players of data/events/Forwards.csv are repeated to the requested number of rows. The
+percentiles of every player are calculated both ways and must be equal. percentileofscore
+only runs on the first players and its time is scaled to all of them.
+
+Usage (from the root of the repository):
+    python -m benchmarks.bench_percentiles [rows ...]
+
+Without arguments 1k, 10k and 100k rows are used.
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from utils.partition_players import METRICS
+from utils.stats_utils import PercentileTable
+
+SAMPLE = 200
+
+
+def get_table(rows):
+    df = pd.read_csv("data/events/Forwards.csv", encoding="unicode_escape")[METRICS]
+    return pd.concat([df] * -(-rows // len(df)), ignore_index=True).iloc[:rows]
+
+
+if __name__ == "__main__":
+    sizes = [int(rows) for rows in sys.argv[1:]] or [1_000, 10_000, 100_000]
+
+    print(f"{'rows':>8} {'percentileofscore (s)':>22} {'table (s)':>10} {'speedup':>8}")
+    for rows in sizes:
+        df = get_table(rows)
+        sample = min(SAMPLE, rows)
+
+        start = time.perf_counter()
+        expected = np.array(
+            [
+                [stats.percentileofscore(df[column], df[column].iloc[i]) for column in METRICS]
+                for i in range(sample)
+            ]
+        )
+        scipy_time = (time.perf_counter() - start) * rows / sample
+
+        start = time.perf_counter()
+        percentiles = PercentileTable(df).percentiles(df)
+        table_time = time.perf_counter() - start
+
+        assert np.array_equal(percentiles.to_numpy()[:sample], expected)
+        print(
+            f"{rows:>8} {scipy_time:>22.3f} {table_time:>10.4f} {scipy_time / table_time:>7.0f}x"
+        )
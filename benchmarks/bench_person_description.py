@@ -0,0 +1,71 @@
+"""
+Time the description of every person in the personality dataset.
+
+Compares the lookup of the most and least agreed with question of each trait in the
+precomputed PersonStat.salient_questions table with the previous approach, which reloaded
+the dataset with PersonStat() for every description and searched the answers with idxmax.
+
+Usage (from the root of the repository):
+    python -m benchmarks.bench_person_description [repeat]
+"""
+
+import copy
+import sys
+import time
+
+from classes.data_source import PersonStat, TRAIT_QUESTIONS
+from classes.description import PersonDescription
+
+
+def reload_and_search(person):
+    # What every description used to do
+    PersonStat().get_questions()
+    salient_questions = {}
+    for i, trait in enumerate(TRAIT_QUESTIONS):
+        answers = person.ser_metrics[i * 10 : (i + 1) * 10]
+        salient_questions[trait + "_max"] = answers.idxmax()
+        salient_questions[trait + "_min"] = answers.idxmin()
+    return salient_questions
+
+
+def timed(function, persons, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for person in persons:
+            function(person)
+    return (time.perf_counter() - start) / (repeat * len(persons))
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    start = time.perf_counter()
+    person_stat = PersonStat()
+    person_stat.calculate_statistics(
+        metrics=[
+            "extraversion",
+            "neuroticism",
+            "agreeableness",
+            "conscientiousness",
+            "openness",
+        ]
+    )
+    print(f"PersonStat() with salient questions: {time.perf_counter() - start:.4f} s")
+
+    persons = []
+    for name in person_stat.df["name"]:
+        person = copy.deepcopy(person_stat)
+        person.df = person.df[person.df["name"] == name]
+        persons.append(person.to_data_point())
+
+    # Both approaches must pick the same questions
+    for person in persons:
+        assert reload_and_search(person) == person.salient_questions
+
+    description = PersonDescription.__new__(PersonDescription)
+    old = timed(reload_and_search, persons, 1)
+    new = timed(description.get_description, persons, repeat)
+    print(f"{len(persons)} persons")
+    print(f"reload and idxmax per description: {old * 1000:.3f} ms")
+    print(f"get_description with lookups:      {new * 1000:.3f} ms")
+    print(f"speedup: {old / new:.0f}x")
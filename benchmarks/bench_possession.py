@@ -0,0 +1,156 @@
+"""
+Compare utils/events/possession.py with the loop over the minutes per game of plot_RadarPlot.py.
+
+The Wyscout events are not in the repository, so random events are made for the games of
+data/events/minutes_played_per_game_England.json, repeated as several leagues with new match ids.
+The loop, which filters the events of the match again for every row, runs on the first
+--sample matches and must give the same possession as possession_per_player.
+
+Usage (from the root of the repository):
+    python -m benchmarks.bench_possession [--leagues 5] [--events 1700] [--sample 20]
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.events.possession import possession_per_player
+
+EVENT_NAMES = ["Pass", "Duel", "Shot", "Free Kick", "Others on the ball"]
+DUELS = ["Air duel", "Ground defending duel", "Ground loose ball duel", "Ground attacking duel"]
+TAGS = [[], [{"id": 701}], [{"id": 703}], [{"id": 1801}], [{"id": 701}, {"id": 1801}]]
+
+
+def load_minutes_per_game(leagues):
+    with open("data/events/minutes_played_per_game_England.json") as f:
+        minutes_per_game = pd.DataFrame(json.load(f))
+    offset = minutes_per_game["matchId"].max() + 1
+    return pd.concat(
+        [
+            minutes_per_game.assign(matchId=minutes_per_game["matchId"] + league * offset)
+            for league in range(leagues)
+        ],
+        ignore_index=True,
+    )
+
+
+def make_events(minutes_per_game, events_per_match, seed=0):
+    rng = np.random.default_rng(seed)
+    teams = minutes_per_game.groupby("matchId")["teamId"].unique()
+    n = events_per_match * len(teams)
+
+    match_ids = np.repeat(teams.index.to_numpy(), events_per_match)
+    # One of the two teams of the match
+    team_ids = np.array(
+        [
+            match_teams[i % len(match_teams)]
+            for match_teams, i in zip(teams.repeat(events_per_match), rng.integers(0, 2, n))
+        ]
+    )
+    first_half = np.tile(np.arange(events_per_match) < events_per_match // 2, len(teams))
+    seconds = np.where(first_half, rng.uniform(0, 2900, n), rng.uniform(0, 2950, n))
+    # Also events on the minute a player comes in or goes out
+    on_minute = rng.random(n) < 0.01
+    seconds[on_minute] = rng.integers(0, 48, on_minute.sum()) * 60.0
+
+    event_names = rng.choice(EVENT_NAMES, n, p=[0.5, 0.25, 0.05, 0.1, 0.1])
+    events = pd.DataFrame(
+        {
+            "matchId": match_ids,
+            "teamId": team_ids,
+            "matchPeriod": np.where(first_half, "1H", "2H"),
+            "eventSec": seconds,
+            "eventName": event_names,
+            "subEventName": np.where(event_names == "Duel", rng.choice(DUELS, n), "Simple pass"),
+            "tags": [TAGS[i] for i in rng.integers(0, len(TAGS), n)],
+        }
+    )
+    return events.sort_values(["matchId", "matchPeriod", "eventSec"], ignore_index=True)
+
+
+def possession_loop(train, minutes_per_game):
+    # The loop of data/events/plot_RadarPlot.py
+    possesion_dict = {}
+    for i, row in minutes_per_game.iterrows():
+        player_id, team_id, match_id = row["playerId"], row["teamId"], row["matchId"]
+        if not str(player_id) in possesion_dict.keys():
+            possesion_dict[str(player_id)] = {"team_passes": 0, "all_passes": 0}
+        min_in = row["player_in_min"] * 60
+        min_out = row["player_out_min"] * 60
+
+        match_df = train.loc[train["matchId"] == match_id].copy()
+        match_df.loc[match_df["matchPeriod"] == "2H", "eventSec"] = (
+            match_df.loc[match_df["matchPeriod"] == "2H", "eventSec"]
+            + match_df.loc[match_df["matchPeriod"] == "1H"]["eventSec"].iloc[-1]
+        )
+        player_in_match_df = match_df.loc[match_df["eventSec"] > min_in].loc[
+            match_df["eventSec"] <= min_out
+        ]
+        all_passes = player_in_match_df.loc[
+            player_in_match_df["eventName"].isin(["Pass", "Duel"])
+        ]
+        if len(all_passes) > 0:
+            no_contact = all_passes.loc[
+                all_passes["subEventName"].isin(
+                    ["Air duel", "Ground defending duel", "Ground loose ball duel"]
+                )
+            ].loc[all_passes.apply(lambda x: {"id": 701} in x.tags, axis=1)]
+            all_passes = all_passes.drop(no_contact.index)
+        team_passes = all_passes.loc[all_passes["teamId"] == team_id]
+        possesion_dict[str(player_id)]["team_passes"] += len(team_passes)
+        possesion_dict[str(player_id)]["all_passes"] += len(all_passes)
+
+    percentage_dict = {
+        key: value["team_passes"] / value["all_passes"] if value["all_passes"] > 0 else 0
+        for key, value in possesion_dict.items()
+    }
+    percentage_df = pd.DataFrame(percentage_dict.items(), columns=["playerId", "possesion"])
+    percentage_df["playerId"] = percentage_df["playerId"].astype(int)
+    return percentage_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--leagues", type=int, default=5)
+    parser.add_argument("--events", type=int, default=1700, help="events per match")
+    parser.add_argument("--sample", type=int, default=20, help="matches for the loop")
+    args = parser.parse_args()
+
+    minutes_per_game = load_minutes_per_game(args.leagues)
+    events = make_events(minutes_per_game, args.events)
+    print(
+        f"{len(events)} events, {len(minutes_per_game)} player games,"
+        f" {minutes_per_game['matchId'].nunique()} matches"
+    )
+
+    sample_matches = minutes_per_game["matchId"].unique()[: args.sample]
+    sample_games = minutes_per_game.loc[minutes_per_game["matchId"].isin(sample_matches)]
+    sample_events = events.loc[events["matchId"].isin(sample_matches)]
+
+    start = time.perf_counter()
+    expected = possession_loop(sample_events, sample_games)
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    possession = possession_per_player(sample_events, sample_games)
+    sample_seconds = time.perf_counter() - start
+
+    merged = expected.merge(possession, on="playerId", suffixes=("_loop", ""))
+    assert len(merged) == len(expected) == len(possession)
+    assert np.allclose(merged["possesion_loop"], merged["possesion"], rtol=0, atol=1e-12)
+
+    start = time.perf_counter()
+    possession_per_player(events, minutes_per_game)
+    seconds = time.perf_counter() - start
+
+    print(
+        f"{len(sample_matches)} matches: loop {loop_seconds:.2f}s,"
+        f" possession_per_player {sample_seconds:.3f}s (same possession)"
+    )
+    estimate = loop_seconds * len(minutes_per_game) / len(sample_games)
+    print(
+        f"all matches: possession_per_player {seconds:.2f}s, loop estimated {estimate:.0f}s"
+    )
@@ -0,0 +1,123 @@
+"""
+Compare the load time and peak memory of the csv backends in utils/readers.py.
+
+The tables read by PersonStat (data/data_raw.csv, escaped and tab separated, only the answers
+are read) and PlayerStats (data/events/Forwards.csv) are repeated to the requested number of
+rows in a temporary directory. Every backend reads every table in a fresh process, so the
+peak resident memory of one read is measured, and the dataframes are checked to be equal.
+
+Usage (from the root of the repository):
+    python -m benchmarks.bench_readers [rows ...]
+
+Without arguments tables of 100k and 1M rows are used.
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from classes.data_source import QUESTIONS
+from utils.datalib.polars_helper import HAS_POLARS
+
+TABLES = {
+    "persons": dict(
+        path="data/data_raw.csv",
+        columns=list(QUESTIONS),
+        sep="\t",
+        unicode_escape=True,
+        # Rows end with an escaped line break
+        line_end=b"\\r\\n",
+    ),
+    "players": dict(
+        path="data/events/Forwards.csv",
+        columns=None,
+        sep=",",
+        unicode_escape=True,
+        line_end=b"\n",
+    ),
+}
+
+
+def write_table(table, rows, directory):
+    with open(table["path"], "rb") as f:
+        header, body = f.read().split(table["line_end"], 1)
+
+    lines = body.rstrip(table["line_end"]).split(table["line_end"])
+    repeats = -(-rows // len(lines))
+    path = os.path.join(directory, f"{rows}_" + os.path.basename(table["path"]))
+    with open(path, "wb") as f:
+        f.write(header + table["line_end"])
+        for _ in range(repeats):
+            f.write(table["line_end"].join(lines) + table["line_end"])
+    return path
+
+
+def peak_memory():
+    """
+    Peak resident memory of this process in MB.
+    """
+    # ru_maxrss is inherited from the parent process on Linux, VmHWM starts again at exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def read_in_process(path, name, backend, output_path):
+    """
+    Read the table in a new process and return the seconds it took and its peak memory in MB.
+    """
+    code = (
+        "import sys, time\n"
+        "from benchmarks.bench_readers import TABLES, peak_memory\n"
+        "from utils.readers import read_csv\n"
+        "path, name, backend, output_path = sys.argv[1:]\n"
+        "table = TABLES[name]\n"
+        "start = time.perf_counter()\n"
+        "df = read_csv(path, backend=backend, columns=table['columns'], sep=table['sep'],"
+        " unicode_escape=table['unicode_escape'])\n"
+        "seconds, peak = time.perf_counter() - start, peak_memory()\n"
+        "df.to_pickle(output_path)\n"
+        "print(seconds, peak)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code, path, name, backend, output_path],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    seconds, peak = output.split()
+    return float(seconds), float(peak)
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    sizes = [int(rows) for rows in sys.argv[1:]] or [100_000, 1_000_000]
+    backends = ["pandas", "arrow"] + (["polars"] if HAS_POLARS else [])
+
+    print(f"{'table':>8} {'rows':>10} {'backend':>8} {'time (s)':>10} {'peak (MB)':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, table in TABLES.items():
+            for rows in sizes:
+                path = write_table(table, rows, directory)
+                expected = None
+                for backend in backends:
+                    output_path = os.path.join(directory, f"{backend}.pkl")
+                    seconds, peak = read_in_process(path, name, backend, output_path)
+
+                    df = pd.read_pickle(output_path)
+                    if expected is None:
+                        expected = df
+                    else:
+                        pd.testing.assert_frame_equal(expected, df)
+
+                    print(
+                        f"{name:>8} {len(df):>10} {backend:>8} {seconds:>10.3f} {peak:>10.0f}"
+                    )
@@ -0,0 +1,99 @@
+"""
+Compare the single pass statistics kernel with the pandas path it replaced.
+
+The pandas path is Stats.get_metric_zscores, get_ranks and get_pct_ranks followed by a concat.
+The kernel is utils.stats_utils.statistics_block. Both run on synthetic tables with 9 metrics,
+rounded values (so there are ties) and 5% missing values, and the results are checked to match.
+
+Usage (from the root of the repository):
+    python -m benchmarks.bench_stats_kernel [rows ...]
+
+Without arguments tables of 10k, 100k and 1M rows are used.
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from classes.data_source import Stats
+from utils.stats_utils import statistics_block
+
+N_METRICS = 9
+
+
+class SyntheticStats(Stats):
+    def __init__(self, df):
+        self.df = df
+        self.metrics = list(df.columns)
+        self.negative_metrics = []
+
+
+def get_table(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.gamma(2.0, 0.5, size=(rows, N_METRICS)), 2)
+    values[rng.random(values.shape) < 0.05] = np.nan
+    return pd.DataFrame(values, columns=[f"metric_{i}" for i in range(N_METRICS)])
+
+
+def pandas_path(stats):
+    df = stats.df
+    return pd.concat(
+        [
+            df,
+            stats.get_metric_zscores(df),
+            stats.get_ranks(df),
+            stats.get_pct_ranks(df),
+        ],
+        axis=1,
+    )
+
+
+def kernel_path(stats):
+    df = stats.df
+    block = statistics_block(df.to_numpy(dtype=np.float64))
+    return pd.concat(
+        [
+            df,
+            pd.DataFrame(
+                block,
+                index=df.index,
+                columns=[f"{metric}_Z" for metric in df.columns]
+                + [f"{metric}_Ranks" for metric in df.columns]
+                + [f"{metric}_Pct_Ranks" for metric in df.columns],
+            ),
+        ],
+        axis=1,
+    )
+
+
+def timed(function, stats, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(stats)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__ == "__main__":
+    sizes = [int(rows) for rows in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+
+    print(f"{'rows':>10} {'pandas (s)':>12} {'kernel (s)':>12} {'speedup':>8}")
+    for rows in sizes:
+        stats = SyntheticStats(get_table(rows))
+        repeat = 5 if rows <= 100_000 else 2
+
+        pandas_time, expected = timed(pandas_path, stats, repeat)
+        kernel_time, result = timed(kernel_path, stats, repeat)
+
+        # Same columns and values, up to floating point rounding in the z-scores
+        assert list(expected.columns) == list(result.columns)
+        assert np.allclose(
+            expected.to_numpy(), result.to_numpy(), rtol=1e-12, atol=1e-12, equal_nan=True
+        )
+
+        print(
+            f"{rows:>10} {pandas_time:>12.4f} {kernel_time:>12.4f} {pandas_time / kernel_time:>7.1f}x"
+        )
@@ -0,0 +1,90 @@
+"""
+Compare Stats.update_rows with calculate_statistics on the updated data.
+
+PlayerStats is read with the default reader backend of Data, so the check also covers the frames
+that backend returns. Some players get new minutes and metric values and copies of other players
+are added, then the _Z and _Ranks columns of update_rows must equal a full recalculation.
+Forwards.csv only has a few players, so the times show the fixed cost of update_rows, which
+includes building the running sums on the first call, rather than its scaling.
+
+Usage (from the root of the repository):
+    python -m benchmarks.bench_update_rows [changed rows ...]
+
+Without arguments 1, 10 and 50 rows are changed.
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from classes.data_source import PlayerStats
+
+METRICS = [
+    "npxG_adjusted_per90",
+    "goals_adjusted_per90",
+    "assists_adjusted_per90",
+    "key_passes_adjusted_per90",
+    "smart_passes_adjusted_per90",
+    "final_third_passes_adjusted_per90",
+    "final_third_receptions_adjusted_per90",
+    "ground_duels_won_adjusted_per90",
+    "air_duels_won_adjusted_per90",
+]
+
+
+def get_rows(stats, k, seed=0):
+    """
+    k changed rows of stats.df, half of them existing players and half new ones.
+    """
+    rng = np.random.default_rng(seed)
+    columns = ["Minutes"] + METRICS
+    positions = rng.choice(len(stats.df), size=k, replace=False)
+    df_rows = stats.df.iloc[positions][columns].copy()
+    df_rows["Minutes"] += 90
+    df_rows[METRICS] = np.round(df_rows[METRICS] * rng.uniform(0.5, 1.5, size=(k, 1)), 3)
+
+    # The second half are added as new players
+    index = df_rows.index.to_numpy().copy()
+    index[k // 2 :] = stats.df.index.max() + 1 + np.arange(k - k // 2)
+    df_rows.index = index
+    return df_rows
+
+
+if __name__ == "__main__":
+    sizes = [int(rows) for rows in sys.argv[1:]] or [1, 10, 50]
+    columns = [f"{metric}_Z" for metric in METRICS] + [f"{metric}_Ranks" for metric in METRICS]
+
+    print(f"{'rows':>6} {'recalculate (s)':>16} {'update_rows (s)':>16} {'speedup':>8}")
+    for k in sizes:
+        stats = PlayerStats(minimal_minutes=300)
+        stats.calculate_statistics(METRICS)
+        df_rows = get_rows(stats, k)
+
+        # The same rows written into a fresh table, which is then calculated from scratch
+        expected = PlayerStats(minimal_minutes=300)
+        existing = df_rows.index.isin(expected.df.index)
+        df = expected.df.copy()
+        df.loc[df_rows.index[existing], df_rows.columns] = df_rows[existing]
+        expected.df = pd.concat([df, df_rows[~existing]])
+        start = time.perf_counter()
+        expected.calculate_statistics(METRICS)
+        recalculate_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stats.update_rows(df_rows)
+        update_time = time.perf_counter() - start
+
+        result = stats.df.loc[expected.df.index, columns]
+        assert np.allclose(
+            expected.df[columns].to_numpy(dtype=float),
+            result.to_numpy(dtype=float),
+            rtol=1e-9,
+            atol=1e-9,
+            equal_nan=True,
+        )
+        print(
+            f"{k:>6} {recalculate_time:>16.4f} {update_time:>16.4f} "
+            f"{recalculate_time / update_time:>7.1f}x"
+        )
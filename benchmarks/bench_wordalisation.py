@@ -0,0 +1,104 @@
+"""
+Compare the batch wordalisation of the descriptions with synthesize_text per entity.
+
+The players, countries and persons of the app are repeated to the requested number of rows,
+then all texts are made with PlayerDescription, CountryDescription and PersonDescription
+.synthesize_texts, and a sample of them with synthesize_text on a data point, which must give
+the same text.
+
+Usage (from the root of the repository):
+    python -m benchmarks.bench_wordalisation [rows]
+
+Without arguments 10k rows are used.
+"""
+
+import copy
+import json
+import sys
+import time
+
+import pandas as pd
+
+from classes.data_source import PlayerStats, CountryStats, PersonStat
+from classes.description import (
+    PlayerDescription,
+    CountryDescription,
+    PersonDescription,
+)
+from utils.partition_players import METRICS as PLAYER_METRICS
+
+SAMPLE = 200
+
+
+def repeat_rows(stats, rows):
+    # Stats.load returns a shared object, so its dataframe is not replaced
+    stats = copy.copy(stats)
+    repeats = -(-rows // len(stats.df))
+    stats.df = pd.concat([stats.df] * repeats, ignore_index=True).iloc[:rows]
+    return stats
+
+
+def get_players(rows):
+    players = repeat_rows(PlayerStats.load(metrics=PLAYER_METRICS), rows)
+    return (
+        players,
+        lambda: PlayerDescription.synthesize_texts(players, "male", "Forward"),
+        lambda row: PlayerDescription(
+            players.to_data_point("male", "Forward", row=row)
+        ).synthesize_text(),
+    )
+
+
+def get_countries(rows):
+    metrics = list(pd.read_csv("data/wvs/wave_7.csv", nrows=0).columns.drop("country"))
+    countries = repeat_rows(CountryStats.load(metrics=metrics), rows)
+    with open("data/wvs/description_dict.json", "r") as f:
+        description_dict = json.load(f)
+    thresholds_dict = dict((metric, [2, 1, -1, -2]) for metric in metrics)
+    return (
+        countries,
+        lambda: CountryDescription.synthesize_texts(
+            countries, description_dict, thresholds_dict
+        ),
+        lambda row: CountryDescription(
+            countries.to_data_point(row=row), description_dict, thresholds_dict
+        ).synthesize_text(),
+    )
+
+
+def get_persons(rows):
+    people = PersonStat.load(metrics=list(PersonDescription.trait_phrases))
+    people = repeat_rows(people, rows)
+    # The salient questions are looked up by index
+    people.salient_questions = people.get_salient_questions(people.df)
+    return (
+        people,
+        lambda: PersonDescription.synthesize_texts(people),
+        lambda row: PersonDescription(people.to_data_point(row=row)).synthesize_text(),
+    )
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+
+    print(f"{'entity':>10} {'rows':>8} {'batch (s)':>10} {'per text (s)':>13} {'speedup':>8}")
+    for name, get in [
+        ("players", get_players),
+        ("countries", get_countries),
+        ("persons", get_persons),
+    ]:
+        stats, batch, single = get(rows)
+
+        start = time.perf_counter()
+        texts = batch()
+        batch_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for row in range(SAMPLE):
+            assert texts.iloc[row] == single(row)
+        single_time = (time.perf_counter() - start) / SAMPLE
+
+        print(
+            f"{name:>10} {len(texts):>8} {batch_time:>10.4f} {single_time:>13.5f}"
+            f" {single_time * len(texts) / batch_time:>7.0f}x"
+        )
@@ -1,5 +1,4 @@
 import streamlit as st
-from openai import OpenAI
 from itertools import groupby
 from types import GeneratorType
 import pandas as pd
@@ -8,13 +7,11 @@ import json
 from settings import USE_GEMINI, USE_LM_STUDIO
 
 if USE_GEMINI:
-    from settings import GEMINI_API_KEY, GEMINI_CHAT_MODEL
+    from settings import GEMINI_CHAT_MODEL
 elif USE_LM_STUDIO:
-    from settings import LM_STUDIO_API_KEY, LM_STUDIO_CHAT_MODEL, LM_STUDIO_API_BASE
+    from settings import LM_STUDIO_CHAT_MODEL
 else:
     from settings import (
-        GPT_BASE,
-        GPT_KEY,
         GPT_CHAT_MODEL,
         GPT_SUPPORTS_REASONING,
         GPT_AVAILABLE_REASONING_EFFORTS,
@@ -32,6 +29,7 @@ from classes.visual import Visual, DistributionPlot, DistributionPlotPersonality
 
 import utils.sentences as sentences
 from utils.gemini import convert_messages_format
+from utils.llm_clients import get_client, configure_gemini, measure
 
 
 class Chat:
@@ -120,7 +118,7 @@ class Chat:
 
         # Check if use gemini is set to true
         if USE_GEMINI:
-            import google.generativeai as genai
+            genai = configure_gemini()
 
             converted_msgs = convert_messages_format(messages)
 
@@ -128,17 +126,17 @@ class Chat:
             # with open("data/wvs/msgs_1.json", "w") as f:
             #     json.dump(converted_msgs, f)
 
-            genai.configure(api_key=GEMINI_API_KEY)
             model = genai.GenerativeModel(
                 model_name=GEMINI_CHAT_MODEL,
                 system_instruction=converted_msgs["system_instruction"],
             )
             chat = model.start_chat(history=converted_msgs["history"])
-            response = chat.send_message(content=converted_msgs["content"])
+            with measure("gemini"):
+                response = chat.send_message(content=converted_msgs["content"])
 
             answer = response.text
         elif USE_LM_STUDIO:
-            client = OpenAI(api_key=LM_STUDIO_API_KEY, base_url=LM_STUDIO_API_BASE)
+            client = get_client("lm_studio")
             if stream:
                 # Collect chunks eagerly so the generator over the list is
                 # near-instantaneous — preventing Streamlit re-runs from
@@ -166,7 +164,7 @@ class Chat:
                 )
                 answer = response.choices[0].message.content
         else:
-            client = OpenAI(api_key=GPT_KEY, base_url=GPT_BASE)
+            client = get_client("openai")
             if stream:
                 if GPT_SUPPORTS_REASONING:
                     reasoning_effort = reasoning_effort if reasoning_effort in GPT_AVAILABLE_REASONING_EFFORTS else GPT_AVAILABLE_REASONING_EFFORTS[0]
@@ -392,7 +390,7 @@ class PlayerChat(Chat):
 
         self.messages_to_display.append({"role": "user", "content": input})
 
-        client = OpenAI(api_key=GPT_KEY, base_url=GPT_BASE)
+        client = get_client("openai")
 
         # Call 1: model picks a tool if relevant, or answers directly if not
         r1 = client.responses.create(
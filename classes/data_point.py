@@ -48,9 +48,12 @@ class Country(Stat):
 
 class Person(Stat):
 
-    def __init__(self, id, name, ser_metrics):
+    def __init__(self, id, name, ser_metrics, salient_questions):
 
         # Unpack ser_info
         self.id = id
         self.name = name
         self.ser_metrics = ser_metrics
+
+        # Question with the highest and lowest answer per trait, keys are <trait>_max and <trait>_min
+        self.salient_questions = salient_questions
@@ -8,19 +8,131 @@ import json
 import datetime
 from scipy.stats import zscore
 import os
+import glob
 
 from itertools import accumulate
 from pathlib import Path
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
 
 from math import floor, ceil
 
 import classes.data_point as data_point
+from utils.cache import make_key
+from utils.readers import read_csv
+from utils.stats_utils import (
+    PercentileTable,
+    RunningMetric,
+    shift_ranks,
+    statistics_block,
+)
 
 # from classes.wyscout_api import WyNot
 
 
+# Groups and Questions modify version of the big five personality test
+# (1) extraversion, (2) neuroticism, (3) agreeableness, (4)conscientiousness , and (5) openness
+# Each question maps to [statement, sign of the answer in the trait score]
+_EXT_QUESTIONS = {
+    "EXT1": ["they are the life of the party", 1],
+    "EXT2": ["they dont talk a lot", -1],
+    "EXT3": ["they feel comfortable around people", 1],
+    "EXT4": ["they keep in the background", -1],
+    "EXT5": ["they start conversations", 1],
+    "EXT6": ["they have little to say", -1],
+    "EXT7": ["they talk to a lot of different people at parties", 1],
+    "EXT8": ["they dont like to draw attention to themself", -1],
+    "EXT9": ["they dont mind being the center of attention", 1],
+    "EXT10": ["they are quiet around strangers", -1],
+}
+
+_EST_QUESTIONS = {
+    "EST1": ["they get stressed out easily", -1],
+    "EST2": ["they are relaxed most of the time", 1],
+    "EST3": ["they worry about things", -1],
+    "EST4": ["they seldom feel blue", 1],
+    "EST5": ["they are easily disturbed", -1],
+    "EST6": ["they get upset easily", -1],
+    "EST7": ["they change their mood a lot", -1],
+    "EST8": ["they have frequent mood swings", -1],
+    "EST9": ["they get irritated easily", -1],
+    "EST10": ["they often feel blue", -1],
+}
+
+_AGR_QUESTIONS = {
+    "AGR1": ["they feel little concern for others", -1],
+    "AGR2": ["they interested in people", 1],
+    "AGR3": ["they insult people", -1],
+    "AGR4": ["they sympathize with others feelings", 1],
+    "AGR5": ["they are not interested in other peoples problems", -1],
+    "AGR6": ["they have a soft heart", 1],
+    "AGR7": ["they not really interested in others", -1],
+    "AGR8": ["they take time out for others", 1],
+    "AGR9": ["they feel others emotions", 1],
+    "AGR10": ["they make people feel at ease", 1],
+}
+
+_CSN_QUESTIONS = {
+    "CSN1": ["they are always prepared", 1],
+    "CSN2": ["they leave their belongings around", -1],
+    "CSN3": ["they pay attention to details", 1],
+    "CSN4": ["they make a mess of things", -1],
+    "CSN5": ["they get chores done right away", 1],
+    "CSN6": ["they often forget to put things back in their proper place", -1],
+    "CSN7": ["they like order", 1],
+    "CSN8": ["they shirk their duties", -1],
+    "CSN9": ["they follow a schedule", 1],
+    "CSN10": ["they are exacting in their work", 1],
+}
+
+_OPN_QUESTIONS = {
+    "OPN1": ["they have a rich vocabulary", 1],
+    "OPN2": ["they have difficulty understanding abstract ideas", -1],
+    "OPN3": ["they have a vivid imagination", 1],
+    "OPN4": ["they are not interested in abstract ideas", -1],
+    "OPN5": ["they have excellent ideas", 1],
+    "OPN6": ["they do not have a good imagination", -1],
+    "OPN7": ["they are quick to understand things", 1],
+    "OPN8": ["they use difficult words", 1],
+    "OPN9": ["they spend time reflecting on things", 1],
+    "OPN10": ["they are full of ideas", 1],
+}
+
+QUESTIONS = (
+    _EXT_QUESTIONS
+    | _EST_QUESTIONS
+    | _AGR_QUESTIONS
+    | _CSN_QUESTIONS
+    | _OPN_QUESTIONS
+)
+
+# The ten questions of each trait, in the column order of the test
+TRAIT_QUESTIONS = {
+    "extraversion": list(_EXT_QUESTIONS),
+    "neuroticism": list(_EST_QUESTIONS),
+    "agreeableness": list(_AGR_QUESTIONS),
+    "conscientiousness": list(_CSN_QUESTIONS),
+    "openness": list(_OPN_QUESTIONS),
+}
+
+
+# Sign of every question in its trait score, and the 50x5 matrix that sums the signed answers per trait
+QUESTION_SIGNS = np.array([sign for statement, sign in QUESTIONS.values()], dtype=np.int8)
+TRAIT_LOADINGS = np.array(
+    [
+        [sign if question in trait_questions else 0 for trait_questions in TRAIT_QUESTIONS.values()]
+        for question, (statement, sign) in QUESTIONS.items()
+    ],
+    dtype=np.int8,
+)
+# reference to scoring: https://sites.temple.edu/rtassessment/files/2018/10/Table_BFPT.pdf
+TRAIT_OFFSETS = np.array([20, 38, 14, 14, 8])
+
+
 # Base class for all data
 class Data:
     """
@@ -28,9 +140,13 @@ class Data:
     """
 
     data_point_class = None
+    # Backend of utils.readers.read_csv, "pandas", "arrow" or "polars". All of them return
+    # the same dataframe, arrow and polars read with multiple threads but use more memory
+    reader_backend = "pandas"
 
     def __init__(self):
         self.df = self.get_processed_data()
+        self._row_index = {}
 
     def get_raw_data(self) -> pd.DataFrame:
         raise NotImplementedError("Child class must implement get_raw_data(self)")
@@ -51,6 +167,66 @@ class Data:
         selected_id = st.selectbox(label, df[column_name].unique(), index=default_index)
         self.df = df[df[column_name] == selected_id]
 
+    def get_row_index(self, column_name):
+        """
+        Return a dict from each value of column_name to the position of its first row in self.df.
+
+        The dict is built once per dataframe and keeps the order of df[column_name].unique().
+        """
+        df, positions = self._row_index.get(column_name, (None, None))
+        if df is not self.df:
+            positions = {}
+            for position, value in enumerate(self.df[column_name]):
+                positions.setdefault(value, position)
+            self._row_index[column_name] = (self.df, positions)
+
+        return positions
+
+    def get_row(self, column_name, value):
+        """
+        O(1) lookup of the position of the row where column_name equals value.
+        Unlike select_and_filter, self.df is not modified, so the object can be shared.
+        """
+        return self.get_row_index(column_name)[value]
+
+    def select_row(self, column_name, label, default_index=0):
+
+        positions = self.get_row_index(column_name)
+        selected_id = st.selectbox(label, list(positions), index=default_index)
+        return positions[selected_id]
+
+
+# Stats objects returned by Stats.load, shared by all sessions of the app
+_stats_cache = {}
+# One lock per class and arguments, so different statistics are computed in parallel.
+# _stats_lock only guards _stats_locks.
+_stats_locks = {}
+_stats_lock = threading.Lock()
+
+# JSON of the attributes other than df, in the parquet metadata written by write_statistics.
+# Files without the current version are computed again.
+STATS_ATTRIBUTES_KEY = b"stats_attributes"
+STATS_ATTRIBUTES_VERSION = 2
+
+# Hive partitioning of the players dataset, all keys are read as strings
+PLAYER_PARTITIONING = ds.partitioning(
+    pa.schema([("league", pa.string()), ("season", pa.string()), ("position", pa.string())]),
+    flavor="hive",
+)
+
+
+def load_partition(cls, metrics, negative_metrics, minimal_minutes, partition):
+    # Run in the worker processes of PlayerStats.precompute
+    league, season, position = partition
+    cls.load(
+        metrics,
+        negative_metrics,
+        minimal_minutes=minimal_minutes,
+        league=league,
+        season=season,
+        position=position,
+    )
+
 
 # Base class for stat related data sources
 # Calculates zscores, ranks and pct_ranks
@@ -59,6 +235,9 @@ class Stats(Data):
     Builds upon DataSource for data sources which have metrics and info
     """
 
+    # Directory of the parquet files written by Stats.load
+    stats_cache_dir = "data/cache/stats"
+
     def __init__(self):
         # Dataframe specs:
         # df_info: index = player, columns = basic info
@@ -66,6 +245,8 @@ class Stats(Data):
         self.df = self.get_processed_data()
         self.metrics = []
         self.negative_metrics = []
+        self._row_index = {}
+        self._running_metrics = None
 
     def get_metric_zscores(self, df):
 
@@ -88,39 +269,317 @@ class Stats(Data):
         return df_ranks
 
     def get_pct_ranks(self, df):
-        df_pct = df.rank(pct=True) * 100
+        # The same as df.rank(pct=True) * 100, with the table used for the radar plots
+        df_pct = PercentileTable(df).percentiles(df)
         # Rename every column to include "Pct_Ranks" at the end
         df_pct.columns = [f"{col}_Pct_Ranks" for col in df_pct.columns]
 
         return df_pct
 
+    def get_percentile_table(self, metrics):
+        """
+        PercentileTable of metrics, for the percentiles of any player or batch of players
+        against the players in self.df.
+        """
+        return PercentileTable(self.df[metrics])
+
     def calculate_statistics(self, metrics, negative_metrics=[]):
         self.metrics = metrics
         self.negative_metrics = negative_metrics
 
-        df = self.df
-        # Add zscores, rankings and qualities
-        df_metric_zscores = self.get_metric_zscores(df[metrics])
-        # Here we want to use df_metric_zscores to get the ranks and pct_ranks due to negative metrics
-        df_metric_ranks = self.get_ranks(df[metrics])
+        # Add zscores and rankings of all metrics in one pass over the metric values,
+        # the same as get_metric_zscores and get_ranks. Percentile ranks are not stored
+        signs = np.array([-1 if metric in negative_metrics else 1 for metric in metrics])
+        block = statistics_block(
+            self.df[metrics].to_numpy(dtype=np.float64), signs, pct_ranks=False
+        )
+        columns = [f"{metric}_Z" for metric in metrics] + [f"{metric}_Ranks" for metric in metrics]
+
+        # Add zscores and ranks as new columns, one contiguous column of the block each,
+        # without copying the rest of the table
+        for column, values in zip(columns, block.T):
+            self.df[column] = values
+        self._running_metrics = None
+
+    def update_rows(self, df_rows):
+        """
+        Add or change rows and refresh the _Z and _Ranks columns of all rows.
+
+        Rows of df_rows with an index that is already in self.df replace the values of that row,
+        the others are appended. They must already be processed like self.df, for example
+        with -1 replaced by NaN in PlayerStats.
+
+        Running sums and the sorted values of every metric are kept between calls, so k changed
+        rows cost O(k log n) searches, and the other ranks are shifted by comparing them with the
+        k changed values only. Every z-score changes with the mean, so the _Z columns are
+        rewritten in one vectorised pass. The result equals calculate_statistics on the updated data.
+
+        self.df is replaced by an updated copy, so frames with read-only blocks and views of the
+        old frame are never written to. The object itself is still modified, so do not call this
+        on an object returned by Stats.load, which is shared, but on your own copy of it.
+        """
+        if self._running_metrics is None:
+            self._running_metrics = dict(
+                (metric, RunningMetric(self.df[metric])) for metric in self.metrics
+            )
 
-        # Add ranks and pct_ranks as new columns
-        self.df = pd.concat([df, df_metric_zscores, df_metric_ranks], axis=1)
+        existing = df_rows.index.isin(self.df.index)
+        df_updated = df_rows[existing]
+        df_added = df_rows[~existing]
+        df_removed = self.df.loc[df_updated.index, self.metrics]
+
+        # Every _Z column is rewritten anyway, so a copy does not change the cost
+        df = self.df.copy()
+        df.loc[df_updated.index, df_updated.columns] = df_updated
+        if len(df_added) > 0:
+            df = pd.concat([df, df_added])
+        self.df = df
+        changed = self.df.index.isin(df_rows.index)
+
+        for metric in self.metrics:
+            running_metric = self._running_metrics[metric]
+            removed = df_removed[metric]
+            added = df_rows[metric]
+            running_metric.remove(removed)
+            running_metric.add(added)
+
+            values = self.df[metric].to_numpy(dtype=float)
+            zscores = running_metric.zscores(values)
+            # Here we get opposite value of metrics if their weight is negative
+            if metric in self.negative_metrics:
+                zscores = -zscores
+            self.df[metric + "_Z"] = zscores
+
+            # Unchanged rows move by the number of changed values above them,
+            # changed rows are searched in the sorted values
+            ranks = shift_ranks(self.df[metric + "_Ranks"], values, added, removed)
+            ranks[changed] = running_metric.ranks(values[changed])
+            self.df[metric + "_Ranks"] = ranks
+
+        self._row_index = {}
+
+    @classmethod
+    def get_source_paths(cls, **kwargs) -> list:
+        """
+        Files the data is read from, a cached result is stale when one of them changes.
+
+        Arguments:
+        kwargs: the constructor arguments.
+        """
+        raise NotImplementedError(
+            "Child class must implement get_source_paths(cls, **kwargs)"
+        )
+
+    @classmethod
+    def load(cls, metrics, negative_metrics=[], **kwargs):
+        """
+        Return cls(**kwargs) with calculate_statistics(metrics, negative_metrics) applied.
+
+        The result is computed once per process and written to a parquet file in stats_cache_dir,
+        so a new process loads it instead of recomputing it. Both are keyed by the source files
+        and their modification times, the metrics and kwargs.
+        The returned object is shared between sessions and must not be modified.
+
+        Arguments:
+        metrics: list of str
+        negative_metrics: list of str
+        kwargs: passed to the constructor, like minimal_minutes for PlayerStats.
+        """
+        params_key = make_key(cls.__name__, metrics, negative_metrics, kwargs)
+        key = make_key(
+            params_key,
+            [
+                (path, os.stat(path).st_mtime_ns)
+                for path in cls.get_source_paths(**kwargs)
+            ],
+        )
+
+        with _stats_lock:
+            lock = _stats_locks.setdefault(params_key, threading.Lock())
+
+        with lock:
+            cached_key, stats = _stats_cache.get(params_key, (None, None))
+            if cached_key == key:
+                return stats
+
+            prefix = os.path.join(cls.stats_cache_dir, f"{cls.__name__}_{params_key[:16]}_")
+            path = f"{prefix}{key[:16]}.parquet"
+            stats = cls.read_statistics(path) if os.path.exists(path) else None
+            if stats is None:
+                stats = cls(**kwargs)
+                stats.calculate_statistics(metrics=metrics, negative_metrics=negative_metrics)
+                # Artifacts of older versions of the source files are not needed anymore
+                for old_path in glob.glob(f"{glob.escape(prefix)}*.parquet"):
+                    os.remove(old_path)
+                stats.write_statistics(path)
+
+            _stats_cache[params_key] = (key, stats)
+            return stats
+
+    def get_attributes(self):
+        """
+        The attributes other than df that write_statistics stores, they must be JSON serialisable.
+        """
+        return dict(
+            (name, value)
+            for name, value in self.__dict__.items()
+            if name not in ["df", "_row_index", "_running_metrics"]
+        )
+
+    def set_attributes(self, attributes):
+        """
+        Restore the attributes of get_attributes, after self.df is read.
+        """
+        self.__dict__.update(attributes)
+
+    def write_statistics(self, path):
+        """
+        Write self.df to a parquet file, with the other attributes as JSON in its metadata.
+        """
+        attributes = {
+            "version": STATS_ATTRIBUTES_VERSION,
+            "attributes": self.get_attributes(),
+        }
+        table = pa.Table.from_pandas(self.df, preserve_index=True)
+        table = table.replace_schema_metadata(
+            {
+                **table.schema.metadata,
+                STATS_ATTRIBUTES_KEY: json.dumps(attributes).encode(),
+            }
+        )
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first, so other processes never read a partial file
+        pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def read_statistics(cls, path):
+        """
+        Read a file of write_statistics, None if it was written in another version.
+        """
+        table = pq.read_table(path)
+        try:
+            attributes = json.loads(table.schema.metadata[STATS_ATTRIBUTES_KEY])
+        except ValueError:
+            # Older versions pickled the attributes
+            return None
+        if attributes.get("version") != STATS_ATTRIBUTES_VERSION:
+            return None
+
+        stats = cls.__new__(cls)
+        stats.df = table.to_pandas()
+        stats._row_index = {}
+        stats._running_metrics = None
+        stats.set_attributes(attributes["attributes"])
+        return stats
 
 
 class PlayerStats(Stats):
     data_point_class = data_point.Player
     # This can be used if some metrics are not good to perform, like tackles lost.
     negative_metrics = []
-
-    def __init__(self, minimal_minutes=300):
+    # Parquet dataset partitioned by league, season and position, see utils/partition_players.py
+    dataset_path = "data/events/players"
+
+    def __init__(self, minimal_minutes=300, league=None, season=None, position=None):
+        """
+        Without league, season and position the forwards in data/events/Forwards.csv are used.
+        Otherwise only the partitions of the dataset that match them are read, and players are
+        compared against the players of those partitions.
+        """
         self.minimal_minutes = minimal_minutes
+        self.league = league
+        self.season = season
+        self.position = position
 
         super().__init__()
 
+    @classmethod
+    def get_dataset(cls):
+        return ds.dataset(
+            cls.dataset_path, format="parquet", partitioning=PLAYER_PARTITIONING
+        )
+
+    @staticmethod
+    def get_partition_filter(league=None, season=None, position=None):
+        expression = None
+        for field, value in [("league", league), ("season", season), ("position", position)]:
+            if value is not None:
+                condition = ds.field(field) == value
+                expression = condition if expression is None else expression & condition
+        return expression
+
+    @classmethod
+    def get_partitions(cls):
+        """
+        Return the sorted (league, season, position) tuples of the dataset.
+        """
+        partitions = set()
+        for fragment in cls.get_dataset().get_fragments():
+            keys = ds.get_partition_keys(fragment.partition_expression)
+            partitions.add((keys["league"], keys["season"], keys["position"]))
+        return sorted(partitions)
+
+    @classmethod
+    def get_source_paths(cls, league=None, season=None, position=None, **kwargs):
+        if league is None and season is None and position is None:
+            return ["data/events/Forwards.csv"]
+
+        partition_filter = cls.get_partition_filter(league, season, position)
+        return sorted(
+            fragment.path
+            for fragment in cls.get_dataset().get_fragments(filter=partition_filter)
+        )
+
+    @classmethod
+    def precompute(cls, metrics, negative_metrics=[], minimal_minutes=300, max_workers=None):
+        """
+        Calculate the statistics of every partition of the dataset in a process pool.
+
+        Each worker reads one partition and writes its statistics with Stats.load, so a page
+        comparing against one partition only loads that result and nothing is sent back.
+
+        Returns:
+        List of the (league, season, position) tuples that were calculated.
+        """
+        partitions = cls.get_partitions()
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    load_partition,
+                    cls,
+                    metrics,
+                    negative_metrics,
+                    minimal_minutes,
+                    partition,
+                )
+                for partition in partitions
+            ]
+            for future in futures:
+                future.result()
+
+        return partitions
+
     def get_raw_data(self):
 
-        df = pd.read_csv("data/events/Forwards.csv", encoding="unicode_escape")
+        if self.league is None and self.season is None and self.position is None:
+            df = read_csv(
+                "data/events/Forwards.csv",
+                backend=self.reader_backend,
+                unicode_escape=True,
+            )
+        else:
+            # Only the matching partitions are read, and the partition columns are left out
+            dataset = self.get_dataset()
+            df = dataset.to_table(
+                columns=[
+                    name
+                    for name in dataset.schema.names
+                    if name not in PLAYER_PARTITIONING.schema.names
+                ],
+                filter=self.get_partition_filter(self.league, self.season, self.position),
+            ).to_pandas()
 
         return df
 
@@ -136,19 +595,19 @@ class PlayerStats(Stats):
 
         return df_raw
 
-    def to_data_point(self, gender, position) -> data_point.Player:
+    def to_data_point(self, gender, position, row=0) -> data_point.Player:
 
-        id = self.df.index[0]
+        id = self.df.index[row]
 
-        # Reindexing dataframe
-        self.df.reset_index(drop=True, inplace=True)
+        # Take the row as a one row dataframe, self.df is not modified
+        df = self.df.iloc[[row]].reset_index(drop=True)
 
-        name = self.df["player_name"][0]
-        minutes_played = self.df["Minutes"][0]
-        self.df = self.df.drop(columns=["player_name", "Minutes"])
+        name = df["player_name"][0]
+        minutes_played = df["Minutes"][0]
+        df = df.drop(columns=["player_name", "Minutes"])
 
         # Convert to series
-        ser_metrics = self.df.squeeze()
+        ser_metrics = df.squeeze()
 
         return self.data_point_class(
             id=id,
@@ -161,10 +620,28 @@ class PlayerStats(Stats):
         )
 
 
+def drill_down_from_json(drill_down):
+    """
+    The drill down dict of CountryStats.get_drill_down_dict from its JSON, which has no tuples.
+    """
+    return dict(
+        (
+            country,
+            dict(
+                (metric, (tuple(questions), tuple(values)))
+                for metric, (questions, values) in metrics.items()
+            ),
+        )
+        for country, metrics in drill_down.items()
+    )
+
+
 class CountryStats(Stats):
     data_point_class = data_point.Country
     # This can be used if some metrics are not good to perform, like tackles lost.
     negative_metrics = []
+    # Precomputed drill down dict, see get_drill_down_dict
+    drill_down_cache_path = "data/cache/wvs_drill_down.json"
 
     def __init__(self):
 
@@ -173,33 +650,51 @@ class CountryStats(Stats):
 
         super().__init__()
 
-    def get_drill_down_data(self, file_path):
-        df = self.process_data(self.get_z_scores(pd.read_csv(file_path)))
-
-        return dict(zip(df.country.values, df.drill_down_metric.values))
-
-    def get_drill_down_data_values(self, file_path, metric_name):
-
-        df = self.process_data(pd.read_csv(file_path))
-
-        # create a value column that has the values from the columns is given by the dict self.drill_down_metric_country_question
-        # where the dict has format {country: question}
-        df["value_low"] = df.apply(
-            lambda x: x[
-                self.drill_down_metric_country_question[metric_name][x["country"]][0]
-            ],
-            axis=1,
-        )
-
-        df["value_high"] = df.apply(
-            lambda x: x[
-                self.drill_down_metric_country_question[metric_name][x["country"]][1]
-            ],
-            axis=1,
-        )
-
+    def set_attributes(self, attributes):
+        super().set_attributes(attributes)
+        self.drill_down = drill_down_from_json(self.drill_down)
+
+    def get_drill_down_data(self, df):
+        """
+        Return a dict from country to the questions with the lowest and the highest answer.
+
+        Arguments:
+        df: dataframe of a *_pre.csv file, with a country column and one column per question.
+        """
+        df = self.process_data(df)
+        questions = np.array([m for m in df.columns if m not in ["country"]])
+        answers = df[questions].to_numpy(dtype=float)
+
+        # Same as idxmin/idxmax over the question columns, but for all countries at once
+        questions_low = questions[np.nanargmin(answers, axis=1)].tolist()
+        questions_high = questions[np.nanargmax(answers, axis=1)].tolist()
+
+        return dict(zip(df.country.values, zip(questions_low, questions_high)))
+
+    def get_drill_down_data_values(self, df, country_questions):
+        """
+        Return a dict from country to its answers to the questions in country_questions,
+        the low one rounded down and the high one rounded up.
+
+        Arguments:
+        df: dataframe of a *_raw.csv file, with a country column and one column per question.
+        country_questions: dict from country to a (low, high) tuple of question names.
+        """
+        df = self.process_data(df)
+        answers = df.drop(columns=["country"])
+
+        questions = [country_questions[country] for country in df["country"]]
+        columns_low = answers.columns.get_indexer([low for low, high in questions])
+        columns_high = answers.columns.get_indexer([high for low, high in questions])
+        if (columns_low < 0).any() or (columns_high < 0).any():
+            raise KeyError("Drill down question missing from the raw answers")
+
+        # Pick the answer of every country to its own questions with one fancy index per side
+        answers = answers.to_numpy(dtype=float)
+        rows = np.arange(len(answers))
         values = [
-            (floor(l), ceil(h)) for l, h in zip(df["value_low"], df["value_high"])
+            (floor(l), ceil(h))
+            for l, h in zip(answers[rows, columns_low], answers[rows, columns_high])
         ]
 
         return dict(zip(df.country.values, values))
@@ -207,16 +702,44 @@ class CountryStats(Stats):
     def get_drill_down_dict(
         self,
     ):
+        """
+        Return a dict from country to a dict from metric to the
+        ((question low, question high), (answer low, answer high)) used in the drill down.
 
-        # read all .csv files from path ending in _pre.csv
+        The dict is stored in drill_down_cache_path and only recomputed when one of the
+        intermediate files changes.
+        """
+
+        # read all .csv files from path ending in _pre.csv and _raw.csv
         path = "data/wvs/intermediate_data/"
-        all_files = os.listdir(path)
+        all_files = [
+            file
+            for file in os.listdir(path)
+            if file.endswith("_pre.csv") or file.endswith("_raw.csv")
+        ]
+        key = make_key(
+            sorted((file, os.stat(path + file).st_mtime_ns) for file in all_files)
+        )
 
-        self.drill_down_metric_country_question = dict(
-            (
-                "_".join(file.split("_")[:-1]),
-                self.get_drill_down_data(path + file),
+        if os.path.exists(self.drill_down_cache_path):
+            with open(self.drill_down_cache_path, "r") as f:
+                cached = json.load(f)
+            if cached["key"] == key:
+                return drill_down_from_json(cached["drill_down"])
+
+        with ThreadPoolExecutor() as executor:
+            dfs = dict(
+                zip(
+                    all_files,
+                    executor.map(
+                        lambda file: read_csv(path + file, backend=self.reader_backend),
+                        all_files,
+                    ),
+                )
             )
+
+        drill_down_metric_country_question = dict(
+            ("_".join(file.split("_")[:-1]), self.get_drill_down_data(dfs[file]))
             for file in all_files
             if file.endswith("_pre.csv")
         )
@@ -225,40 +748,40 @@ class CountryStats(Stats):
             (
                 "_".join(file.split("_")[:-1]),
                 self.get_drill_down_data_values(
-                    path + file, "_".join(file.split("_")[:-1])
+                    dfs[file],
+                    drill_down_metric_country_question["_".join(file.split("_")[:-1])],
                 ),
             )
             for file in all_files
             if file.endswith("_raw.csv")
         )
 
-        metrics = [m for m in self.drill_down_metric_country_question.keys()]
-        countries = [
-            k for k in self.drill_down_metric_country_question[metrics[0]].keys()
-        ]
+        metrics = [m for m in drill_down_metric_country_question.keys()]
+        countries = [k for k in drill_down_metric_country_question[metrics[0]].keys()]
 
-        drill_down = [
+        drill_down = dict(
             (
                 country,
                 dict(
-                    [
+                    (
+                        metric,
                         (
-                            metric,
-                            (
-                                self.drill_down_metric_country_question[metric][
-                                    country
-                                ],
-                                drill_down_data_raw[metric][country],
-                            ),
-                        )
-                        for metric in metrics
-                    ]
+                            drill_down_metric_country_question[metric][country],
+                            drill_down_data_raw[metric][country],
+                        ),
+                    )
+                    for metric in metrics
                 ),
             )
             for country in countries
-        ]
+        )
+
+        os.makedirs(os.path.dirname(self.drill_down_cache_path), exist_ok=True)
+        with open(self.drill_down_cache_path + ".tmp", "w") as f:
+            json.dump({"key": key, "drill_down": drill_down}, f)
+        os.replace(self.drill_down_cache_path + ".tmp", self.drill_down_cache_path)
 
-        return dict(drill_down)
+        return drill_down
 
     def get_z_scores(self, df, metrics=None, negative_metrics=[]):
 
@@ -313,9 +836,16 @@ class CountryStats(Stats):
         # return the index of the random sample
         return self.df.sample(1).index[0]
 
+    @classmethod
+    def get_source_paths(cls, **kwargs):
+        path = "data/wvs/intermediate_data/"
+        return ["data/wvs/wave_7.csv"] + sorted(
+            path + file for file in os.listdir(path) if file.endswith(".csv")
+        )
+
     def get_raw_data(self):
 
-        df = pd.read_csv("data/wvs/wave_7.csv")
+        df = read_csv("data/wvs/wave_7.csv", backend=self.reader_backend)
 
         return df
 
@@ -341,18 +871,18 @@ class CountryStats(Stats):
 
         return df_raw
 
-    def to_data_point(self) -> data_point.Country:
+    def to_data_point(self, row=0) -> data_point.Country:
 
-        id = self.df.index[0]
+        id = self.df.index[row]
 
-        # Reindexing dataframe
-        self.df.reset_index(drop=True, inplace=True)
+        # Take the row as a one row dataframe, self.df is not modified
+        df = self.df.iloc[[row]].reset_index(drop=True)
 
-        name = self.df["country"][0]
-        self.df = self.df.drop(columns=["country"])
+        name = df["country"][0]
+        df = df.drop(columns=["country"])
 
         # Convert to series
-        ser_metrics = self.df.squeeze()
+        ser_metrics = df.squeeze()
 
         # get the names of columns in ser_metrics than end in "_Z" with abs value greater than 1.5
         drill_down_metrics = ser_metrics[
@@ -386,193 +916,151 @@ class PersonStat(Stats):
 
     def __init__(self):
         super().__init__()
+        # Most and least agreed with question per trait, looked up when describing a person
+        self.salient_questions = self.get_salient_questions(self.df)
+
+    def get_attributes(self):
+        # A dataframe, it is found again from the answers in df
+        attributes = super().get_attributes()
+        del attributes["salient_questions"]
+        return attributes
+
+    def set_attributes(self, attributes):
+        super().set_attributes(attributes)
+        self.salient_questions = self.get_salient_questions(self.df)
+
+    @classmethod
+    def get_source_paths(cls, **kwargs):
+        return ["data/data_raw.csv"]
 
     def get_raw_data(self):
         # df = pd.read_csv('data/data-final.csv',sep='\t',encoding='unicode_escape').sample(frac=0.0001)
-        df = pd.read_csv("data/data_raw.csv", sep="\t", encoding="unicode_escape")
+        # Only the answers are used, the timings and the country are not read
+        df = read_csv(
+            "data/data_raw.csv",
+            backend=self.reader_backend,
+            columns=list(QUESTIONS),
+            sep="\t",
+            unicode_escape=True,
+        )
         return df
 
     def get_questions(self):
         """This function is to have access to the questions"""
+        return QUESTIONS
 
-        # Groups and Questions modify version
-        # (1) extraversion, (2) neuroticism, (3) agreeableness, (4)conscientiousness , and (5) openness
-        ext_questions = {
-            "EXT1": ["they are the life of the party", 1],
-            "EXT2": ["they dont talk a lot", -1],
-            "EXT3": ["they feel comfortable around people", 1],
-            "EXT4": ["they keep in the background", -1],
-            "EXT5": ["they start conversations", 1],
-            "EXT6": ["they have little to say", -1],
-            "EXT7": ["they talk to a lot of different people at parties", 1],
-            "EXT8": ["they dont like to draw attention to themself", -1],
-            "EXT9": ["they dont mind being the center of attention", 1],
-            "EXT10": ["they are quiet around strangers", -1],
-        }
-
-        est_questions = {
-            "EST1": ["they get stressed out easily", -1],
-            "EST2": ["they are relaxed most of the time", 1],
-            "EST3": ["they worry about things", -1],
-            "EST4": ["they seldom feel blue", 1],
-            "EST5": ["they are easily disturbed", -1],
-            "EST6": ["they get upset easily", -1],
-            "EST7": ["they change their mood a lot", -1],
-            "EST8": ["they have frequent mood swings", -1],
-            "EST9": ["they get irritated easily", -1],
-            "EST10": ["they often feel blue", -1],
-        }
-
-        agr_questions = {
-            "AGR1": ["they feel little concern for others", -1],
-            "AGR2": ["they interested in people", 1],
-            "AGR3": ["they insult people", -1],
-            "AGR4": ["they sympathize with others feelings", 1],
-            "AGR5": ["they are not interested in other peoples problems", -1],
-            "AGR6": ["they have a soft heart", 1],
-            "AGR7": ["they not really interested in others", -1],
-            "AGR8": ["they take time out for others", 1],
-            "AGR9": ["they feel others emotions", 1],
-            "AGR10": ["they make people feel at ease", 1],
-        }
+    def get_salient_questions(self, df):
+        """
+        Return, for every person in df, the question with the highest and the lowest
+        signed answer within each trait. Ties go to the first question, like idxmax.
 
-        csn_questions = {
-            "CSN1": ["they are always prepared", 1],
-            "CSN2": ["they leave their belongings around", -1],
-            "CSN3": ["they pay attention to details", 1],
-            "CSN4": ["they make a mess of things", -1],
-            "CSN5": ["they get chores done right away", 1],
-            "CSN6": ["they often forget to put things back in their proper place", -1],
-            "CSN7": ["they like order", 1],
-            "CSN8": ["they shirk their duties", -1],
-            "CSN9": ["they follow a schedule", 1],
-            "CSN10": ["they are exacting in their work", 1],
-        }
+        Returns:
+        Dataframe with the index of df and columns <trait>_max and <trait>_min.
+        """
+        salient_questions = {}
+        for trait, trait_questions in TRAIT_QUESTIONS.items():
+            answers = df[trait_questions].to_numpy()
+            trait_questions = np.array(trait_questions)
+            salient_questions[trait + "_max"] = trait_questions[answers.argmax(axis=1)]
+            salient_questions[trait + "_min"] = trait_questions[answers.argmin(axis=1)]
 
-        opn_questions = {
-            "OPN1": ["they have a rich vocabulary", 1],
-            "OPN2": ["they have difficulty understanding abstract ideas", -1],
-            "OPN3": ["they have a vivid imagination", 1],
-            "OPN4": ["they are not interested in abstract ideas", -1],
-            "OPN5": ["they have excellent ideas", 1],
-            "OPN6": ["they do not have a good imagination", -1],
-            "OPN7": ["they are quick to understand things", 1],
-            "OPN8": ["they use difficult words", 1],
-            "OPN9": ["they spend time reflecting on things", 1],
-            "OPN10": ["they are full of ideas", 1],
-        }
-
-        questions = (
-            ext_questions
-            | est_questions
-            | agr_questions
-            | csn_questions
-            | opn_questions
-        )
-        return questions
+        return pd.DataFrame(salient_questions, index=df.index)
 
     def process_data(self, df_raw):
         """This fonction get the person or candidate data with a number id or a list, and return a dataframe of the person"""
-        questions = self.get_questions()
 
         # First we want to check if the user want a certain candidate from the dataset
         # or if the user did the test so it return a list
         if isinstance(df_raw, list):
-            matching = [
-                "EXT1",
-                "EXT2",
-                "EXT3",
-                "EXT4",
-                "EXT5",
-                "EXT6",
-                "EXT7",
-                "EXT8",
-                "EXT9",
-                "EXT10",
-                "EST1",
-                "EST2",
-                "EST3",
-                "EST4",
-                "EST5",
-                "EST6",
-                "EST7",
-                "EST8",
-                "EST9",
-                "EST10",
-                "AGR1",
-                "AGR2",
-                "AGR3",
-                "AGR4",
-                "AGR5",
-                "AGR6",
-                "AGR7",
-                "AGR8",
-                "AGR9",
-                "AGR10",
-                "CSN1",
-                "CSN2",
-                "CSN3",
-                "CSN4",
-                "CSN5",
-                "CSN6",
-                "CSN7",
-                "CSN8",
-                "CSN9",
-                "CSN10",
-                "OPN1",
-                "OPN2",
-                "OPN3",
-                "OPN4",
-                "OPN5",
-                "OPN6",
-                "OPN7",
-                "OPN8",
-                "OPN9",
-                "OPN10",
-            ]
-            df_raw = pd.DataFrame([df_raw], columns=[column for column in matching])
+            df_raw = pd.DataFrame([df_raw], columns=list(QUESTIONS))
 
         else:
-            df_raw.drop(df_raw.columns[50:107], axis=1, inplace=True)
-            df_raw.drop(
-                df_raw.columns[50:], axis=1, inplace=True
-            )  # here 50 to remove the country
-            df_raw.dropna(inplace=True)
-
-            # Group Names and Columns
-            # EXT = [column for column in df_raw if column.startswith('EXT')]
-            # EST = [column for column in df_raw if column.startswith('EST')]
-            # AGR = [column for column in df_raw if column.startswith('AGR')]
-            # CSN = [column for column in df_raw if column.startswith('CSN')]
-            # OPN = [column for column in df_raw if column.startswith('OPN')]
-
-            # matching = EXT+EST+AGR+CSN+OPN
-
-            # Here we update the dataframe by applying the new coefficient
-        for column in df_raw.columns:
-            df_raw[column] = df_raw[column] * questions[column][1]
-
-        # reference to scoring: https://sites.temple.edu/rtassessment/files/2018/10/Table_BFPT.pdf
-        df_raw["extraversion"] = df_raw.iloc[:, 0:10].sum(axis=1) + 20
-        df_raw["neuroticism"] = df_raw.iloc[:, 10:20].sum(axis=1) + 38
-        df_raw["agreeableness"] = df_raw.iloc[:, 20:30].sum(axis=1) + 14
-        df_raw["conscientiousness"] = df_raw.iloc[:, 30:40].sum(axis=1) + 14
-        df_raw["openness"] = df_raw.iloc[:, 40:50].sum(axis=1) + 8
-        df_raw["name"] = df_raw.index.to_series().apply(lambda idx: "C_" + str(idx))
+            # Keep the answers to the questions, this removes the timings and the country
+            df_raw = df_raw[list(QUESTIONS)].dropna()
 
-        return df_raw
+        return self.score_answers(df_raw)
 
-    def to_data_point(self) -> data_point.Person:
+    @staticmethod
+    def score_answers(df_answers):
+        """
+        Return the signed answers, the five trait scores and a name for every row of df_answers.
 
-        id = self.df.index[0]
-        name = self.df["name"].values[0]
+        Arguments:
+        df_answers: dataframe with one column per question in QUESTIONS and no missing values.
+        """
+        answers = df_answers[list(QUESTIONS)].to_numpy()
 
-        # Reindexing dataframe
-        self.df.reset_index(drop=True, inplace=True)
+        # Here we update the answers by applying the coefficient of each question
+        signed_answers = answers * QUESTION_SIGNS
 
-        self.df = self.df.drop(columns=["name"])
+        # Every trait is the sum of its signed answers, for all traits in one matmul.
+        # The answers are 0 to 5, so the sums of ten of them fit in int8
+        if np.array_equal(answers, answers.astype(np.int8)):
+            trait_sums = answers.astype(np.int8) @ TRAIT_LOADINGS
+        else:
+            trait_sums = answers @ TRAIT_LOADINGS
+        trait_scores = trait_sums.astype(signed_answers.dtype) + TRAIT_OFFSETS
+
+        df = pd.DataFrame(signed_answers, columns=list(QUESTIONS), index=df_answers.index)
+        for i, trait in enumerate(TRAIT_QUESTIONS):
+            df[trait] = trait_scores[:, i]
+        df["name"] = "C_" + df.index.astype(str)
+
+        return df
+
+    @classmethod
+    def score_csv(cls, csv_path, output_path, sep="\t", chunksize=100_000):
+        """
+        Score every row of a csv file of answers, like the full open psychometrics dump, and
+        write the result of score_answers to a parquet file.
+
+        The file is read and written in chunks of chunksize rows, so memory use does not grow
+        with the size of the file.
+
+        Returns:
+        Number of rows written.
+        """
+        rows = 0
+        writer = None
+        try:
+            for chunk in pd.read_csv(
+                csv_path,
+                sep=sep,
+                usecols=list(QUESTIONS),
+                encoding="unicode_escape",
+                chunksize=chunksize,
+            ):
+                # Answers are kept as small integers to bound the memory of a chunk
+                chunk = chunk[list(QUESTIONS)].dropna().astype(np.int8)
+                table = pa.Table.from_pandas(cls.score_answers(chunk), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        return rows
+
+    def to_data_point(self, row=0) -> data_point.Person:
+
+        id = self.df.index[row]
+
+        # Take the row as a one row dataframe, self.df is not modified
+        df = self.df.iloc[[row]].reset_index(drop=True)
+
+        name = df["name"].values[0]
+        df = df.drop(columns=["name"])
 
         # Convert to series
-        ser_metrics = self.df.squeeze()
+        ser_metrics = df.squeeze()
+
+        salient_questions = self.salient_questions.loc[id].to_dict()
 
-        return self.data_point_class(id=id, name=name, ser_metrics=ser_metrics)
+        return self.data_point_class(
+            id=id,
+            name=name,
+            ser_metrics=ser_metrics,
+            salient_questions=salient_questions,
+        )
@@ -1,29 +1,30 @@
+import functools
+import os
 from abc import ABC, abstractmethod
-from typing import List, Union, Dict
+from types import MappingProxyType
+from typing import List, Union, Dict, Tuple
 
+import numpy as np
 import pandas as pd
 
-from openai import OpenAI
-
-
 import utils.sentences as sentences
 from utils.gemini import convert_messages_format
+from utils.llm_clients import get_client, configure_gemini, measure
+from utils.cache import TieredCache, make_key
 
 from classes.data_point import Player, Country, Person
-from classes.data_source import PersonStat
+from classes.data_source import QUESTIONS
 
 import json
 
 from settings import USE_GEMINI, USE_LM_STUDIO
 
 if USE_GEMINI:
-    from settings import GEMINI_API_KEY, GEMINI_CHAT_MODEL
+    from settings import GEMINI_CHAT_MODEL
 elif USE_LM_STUDIO:
-    from settings import LM_STUDIO_API_KEY, LM_STUDIO_CHAT_MODEL, LM_STUDIO_API_BASE
+    from settings import LM_STUDIO_CHAT_MODEL
 else:
     from settings import (
-        GPT_BASE,
-        GPT_KEY,
         GPT_CHAT_MODEL,
         GPT_SUPPORTS_REASONING,
         GPT_AVAILABLE_REASONING_EFFORTS,
@@ -31,6 +32,46 @@ else:
     )
 
 import streamlit as st
+import re
+
+from settings import (
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MEMORY_ENTRIES,
+)
+
+@functools.cache
+def get_response_cache():
+    """
+    Generated summaries, keyed by the prompt messages, the model and the sampling parameters.
+    The SQLite file is opened on first use, not on import.
+    """
+    return TieredCache(
+        RESPONSE_CACHE_PATH,
+        ttl=RESPONSE_CACHE_TTL,
+        max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+        memory_entries=RESPONSE_CACHE_MEMORY_ENTRIES,
+    )
+
+
+def replay_stream(text):
+    """
+    Yield a cached response word by word, like a streamed response.
+    """
+    for chunk in re.split(r"(?<=\s)(?=\S)", text):
+        yield chunk
+
+
+def cache_stream(chunks, key):
+    """
+    Pass through a streamed response and cache the full text once the stream is complete.
+    """
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        yield chunk
+    get_response_cache().set(key, text)
 
 
 
@@ -38,6 +79,9 @@ class Description(ABC):
     gpt_examples_base = "data/gpt_examples"
     describe_base = "data/describe"
 
+    # Compiled prompt prefixes, keyed by subclass and the paths and modification times of its excel files
+    _prefix_cache = {}
+
     @property
     @abstractmethod
     def gpt_examples_path(self) -> str:
@@ -133,16 +177,43 @@ class Description(ABC):
 
         # Convert to list of dicts
         messages = []
-        for i, row in df.iterrows():
-            if i == 0:
-                messages.append({"role": "user", "content": row["user"]})
-            else:
-                messages.append({"role": "user", "content": row["user"]})
-            messages.append({"role": "assistant", "content": row["assistant"]})
+        for user, assistant in zip(df["user"], df["assistant"]):
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
 
         return messages
 
-    def setup_messages(self) -> List[Dict[str, str]]:
+    def get_prefix_messages(self) -> Tuple[MappingProxyType, ...]:
+        """
+        Return the messages that come before the synthesized text: the intro, the describe
+        questions and answers, the prompt and the examples.
+
+        The prefix only depends on the subclass and its excel files, so it is built once and
+        rebuilt when one of the files changes. get_intro_messages and get_prompt_messages
+        must therefore not depend on the entity being described.
+
+        Returns:
+        Tuple of read-only dicts with keys "role" and "content".
+        """
+        describe_paths = self.describe_paths
+        if isinstance(describe_paths, str):
+            describe_paths = [describe_paths]
+        paths = tuple(describe_paths) + (self.gpt_examples_path,)
+        mtimes = tuple(
+            os.path.getmtime(path) if os.path.exists(path) else None for path in paths
+        )
+        key = (type(self), paths, mtimes)
+
+        prefix = Description._prefix_cache.get(key)
+        if prefix is None:
+            prefix = tuple(
+                MappingProxyType(message) for message in self.compile_prefix_messages()
+            )
+            Description._prefix_cache[key] = prefix
+
+        return prefix
+
+    def compile_prefix_messages(self) -> List[Dict[str, str]]:
         messages = self.get_intro_messages()
         try:
             paths = self.describe_paths
@@ -166,6 +237,10 @@ class Description(ABC):
         ) as e:  
             print(e)
 
+        return messages
+
+    def setup_messages(self) -> List[Dict[str, str]]:
+        messages = [dict(message) for message in self.get_prefix_messages()]
         messages += [
             {
                 "role": "user",
@@ -188,8 +263,21 @@ class Description(ABC):
 
         st.session_state["description_transcript"] = self.messages
 
+        # The same messages give the same summary, so a summary is only generated once
+        if USE_GEMINI:
+            provider, model = "gemini", GEMINI_CHAT_MODEL
+        elif USE_LM_STUDIO:
+            provider, model = "lm_studio", LM_STUDIO_CHAT_MODEL
+        else:
+            provider, model = "openai", GPT_CHAT_MODEL
+        cache_key = make_key(self.messages, provider, model, temperature, reasoning_effort)
+
+        cached = get_response_cache().get(cache_key)
+        if cached is not None:
+            return replay_stream(cached) if stream else cached
+
         if USE_GEMINI:
-            import google.generativeai as genai
+            genai = configure_gemini()
 
             converted_msgs = convert_messages_format(self.messages)
 
@@ -197,17 +285,17 @@ class Description(ABC):
             # with open("data/wvs/msgs_0.json", "w") as f:
             #     json.dump(converted_msgs, f)
 
-            genai.configure(api_key=GEMINI_API_KEY)
             model = genai.GenerativeModel(
                 model_name=GEMINI_CHAT_MODEL,
                 system_instruction=converted_msgs["system_instruction"],
             )
             chat = model.start_chat(history=converted_msgs["history"])
-            response = chat.send_message(content=converted_msgs["content"])
+            with measure("gemini"):
+                response = chat.send_message(content=converted_msgs["content"])
 
             answer = response.text
         elif USE_LM_STUDIO:
-            client = OpenAI(api_key=LM_STUDIO_API_KEY, base_url=LM_STUDIO_API_BASE)
+            client = get_client("lm_studio")
             if stream:
                 # Collect chunks eagerly so the generator over the list is
                 # near-instantaneous — preventing Streamlit re-runs from
@@ -235,7 +323,7 @@ class Description(ABC):
                 )
                 answer = response.choices[0].message.content
         else:
-            client = OpenAI(api_key=GPT_KEY, base_url=GPT_BASE)
+            client = get_client("openai")
             if stream:
                 if GPT_SUPPORTS_REASONING:
                     reasoning_effort = reasoning_effort if reasoning_effort in GPT_AVAILABLE_REASONING_EFFORTS else GPT_AVAILABLE_REASONING_EFFORTS[0]
@@ -287,6 +375,11 @@ class Description(ABC):
 
                 answer = response.output_text
 
+        if isinstance(answer, str):
+            get_response_cache().set(cache_key, answer)
+        else:
+            answer = cache_stream(answer, cache_key)
+
         return answer
 
 
@@ -365,6 +458,38 @@ class PlayerDescription(Description):
 
         return description
 
+    @classmethod
+    def synthesize_texts(cls, players, gender, position) -> pd.Series:
+        """
+        The text of synthesize_text for every player in players.df at once.
+
+        Arguments:
+        players: PlayerStats with calculated statistics.
+        gender, position: the same for all players, like in PlayerStats.to_data_point.
+
+        Returns:
+        Series of texts with the index of players.df.
+        """
+        df = players.df
+        subject_p = sentences.pronouns(gender)[0].capitalize()
+
+        descriptions = (
+            "Here is a statistical description of "
+            + df["player_name"].to_numpy(dtype=object)
+            + ", who played for "
+            + df["Minutes"].astype(str).to_numpy(dtype=object)
+            + f" minutes as a {position}. \n\n "
+        )
+        for metric in players.metrics:
+            descriptions = (
+                descriptions
+                + f"{subject_p} was "
+                + sentences.describe_levels(df[metric + "_Z"].to_numpy())
+                + f" in {sentences.write_out_metric(metric)} compared to other players in the same playing position. "
+            )
+
+        return pd.Series(descriptions, index=df.index)
+
     def get_prompt_messages(self):
         prompt = (
             f"Please use the statistical description enclosed with ``` to give a concise, 4 sentence summary of the player's playing style, strengths and weaknesses. "
@@ -465,6 +590,69 @@ class CountryDescription(Description):
 
         return description
 
+    @classmethod
+    def synthesize_texts(cls, countries, description_dict, thresholds_dict) -> pd.Series:
+        """
+        The text of synthesize_text for every country in countries.df at once.
+
+        Arguments:
+        countries: CountryStats with calculated statistics.
+        description_dict, thresholds_dict: as in CountryDescription.
+
+        Returns:
+        Series of texts with the index of countries.df.
+        """
+        with open("data/wvs/intermediate_data/relevant_questions.json", "r") as f:
+            relevant_questions = json.load(f)
+
+        df = countries.df
+        names = df["country"].to_numpy(dtype=object)
+        capitalized = np.array([name.capitalize() for name in names], dtype=object)
+
+        descriptions = (
+            "Here is a statistical description of the societal values of "
+            + capitalized
+            + "."
+        )
+        for metric in countries.metrics:
+            zscores = df[metric + "_Z"].to_numpy(dtype=float)
+            descriptions = (
+                descriptions
+                + "\n\nAccording to the WVS, "
+                + capitalized
+                + " was found to "
+                + sentences.describe_levels(
+                    zscores,
+                    thresholds=thresholds_dict[metric],
+                    words=description_dict[metric],
+                )
+                + " compared to other countries in the same wave. "
+            )
+
+            # Countries far enough from the average get the question that stands out most,
+            # like the drill_down_metrics of CountryStats.to_data_point
+            drill_down = np.abs(zscores) >= countries.drill_down_threshold
+            drill_down &= np.array(
+                [metric in countries.drill_down[name] for name in names], dtype=bool
+            )
+            for i in np.flatnonzero(drill_down):
+                questions, values = countries.drill_down[names[i]][metric]
+                index = 1 if zscores[i] > 0 else 0
+                question, value = questions[index], values[index]
+                descriptions[i] += (
+                    "In response to the question '"
+                    + relevant_questions[metric][question][0]
+                    + "', on average participants "
+                    + relevant_questions[metric][question][1]
+                    + " '"
+                    + relevant_questions[metric][question][2][str(value)]
+                    + "' "
+                    + relevant_questions[metric][question][3]
+                    + ". "
+                )
+
+        return pd.Series(descriptions, index=df.index)
+
     def get_prompt_messages(self):
         prompt = (
             f"Please use the statistical description enclosed with ``` to give a concise, 2 short paragraph summary of the social values held by population of the country. "
@@ -530,21 +718,55 @@ class PersonDescription(Description):
 
         return intro
 
+    # Per trait: the words for a low and a high score and the sentences that follow them
+    trait_phrases = {
+        "extraversion": (
+            "solitary and reserved. ",
+            "outgoing and energetic. ",
+            "The candidate tends to be less social. ",
+            "The candidate tends to be more social. ",
+        ),
+        "neuroticism": (
+            "resilient and confident. ",
+            "sensitive and nervous. ",
+            "The candidate tends to feel less negative emotions and anxiety. ",
+            "The candidate tends to feel more negative emotions and anxiety. ",
+        ),
+        "agreeableness": (
+            "critical and rational. ",
+            "friendly and compassionate. ",
+            "The candidate tends to be less cooperative, polite, kind and friendly. ",
+            "The candidate tends to be more cooperative, polite, kind and friendly. ",
+        ),
+        "conscientiousness": (
+            "extravagant and careless. ",
+            "efficient and organized. ",
+            "The candidate tends to be less careful or diligent. ",
+            "The candidate tends to be more careful or diligent. ",
+        ),
+        "openness": (
+            "consistent and cautious. ",
+            "inventive and curious. ",
+            "The candidate tends to be less open to new ideas and experiences. ",
+            "The candidate tends to be more open to new ideas and experiences. ",
+        ),
+    }
+    # Upper bounds (inclusive) of the z-scores of each category, higher values are "extremely"
+    category_bounds = [-2, -1, -0.5, 0.5, 1, 2]
+    category_words = [
+        "The candidate is extremely ",
+        "The candidate is very ",
+        "The candidate is quite ",
+        "The candidate is relatively ",
+        "The candidate is quite ",
+        "The candidate is very ",
+        "The candidate is extremely ",
+    ]
+
     def categorie_description(self, value):
-        if value <= -2:
-            return "The candidate is extremely "
-        elif -2 < value <= -1:
-            return "The candidate is very "
-        elif -1 < value <= -0.5:
-            return "The candidate is quite "
-        elif -0.5 < value <= 0.5:
-            return "The candidate is relatively "
-        elif 0.5 < value <= 1:
-            return "The candidate is quite "
-        elif 1 < value <= 2:
-            return "The candidate is very "
-        else:
-            return "The candidate is extremely "
+        return self.category_words[
+            np.searchsorted(self.category_bounds, value, side="left")
+        ]
 
     def all_max_indices(self, row):
         max_value = row.max()
@@ -555,174 +777,89 @@ class PersonDescription(Description):
         return list(row[row == min_value].index)
 
     def get_description(self, person):
-        # here we need the dataset to check the min and max score of the person
+        # The questions the person agreed with most and least are looked up in person.salient_questions
 
         person_metrics = person.ser_metrics
-        person_stat = PersonStat()
-        questions = person_stat.get_questions()
-
-        name = person.name
-        extraversion = person_metrics["extraversion_Z"]
-        neuroticism = person_metrics["neuroticism_Z"]
-        agreeableness = person_metrics["agreeableness_Z"]
-        conscientiousness = person_metrics["conscientiousness_Z"]
-        openness = person_metrics["openness_Z"]
+        salient_questions = person.salient_questions
 
         text = []
+        for trait, (cat_0, cat_1, less, more) in self.trait_phrases.items():
+            value = person_metrics[trait + "_Z"]
+
+            if value > 0:
+                text_t = self.categorie_description(value) + cat_1 + more
+                if value > 1:
+                    index_max = salient_questions[trait + "_max"]
+                    text_t += (
+                        "In particular they said that " + QUESTIONS[index_max][0] + ". "
+                    )
+            else:
+                text_t = self.categorie_description(value) + cat_0 + less
+                if value < -1:
+                    index_min = salient_questions[trait + "_min"]
+                    text_t += (
+                        "In particular they said that " + QUESTIONS[index_min][0] + ". "
+                    )
+            text.append(text_t)
 
-        # extraversion
-        cat_0 = "solitary and reserved. "
-        cat_1 = "outgoing and energetic. "
-
-        if extraversion > 0:
-            text_t = (self.categorie_description(extraversion) 
-            + cat_1
-            + "The candidate tends to be more social. "
-                     )
-            if extraversion > 1:
-                index_max = person_metrics[0:10].idxmax()
-                text_2 = (
-                    "In particular they said that " + questions[index_max][0] + ". "
-                )
-                text_t += text_2
-        else:
-            text_t = (self.categorie_description(extraversion) 
-            + cat_0
-            + "The candidate tends to be less social. "
-                     )
-            if extraversion < -1:
-                index_min = person_metrics[0:10].idxmin()
-                text_2 = (
-                    "In particular they said that " + questions[index_min][0] + ". "
-                )
-                text_t += text_2
-        text.append(text_t)
-
-        # neuroticism
-        cat_0 = "resilient and confident. "
-        cat_1 = "sensitive and nervous. "
-
-        if neuroticism > 0:
-            text_t = (
-                self.categorie_description(neuroticism)
-                + cat_1
-                + "The candidate tends to feel more negative emotions and anxiety. "
-            )
-            if neuroticism > 1:
-                index_max = person_metrics[10:20].idxmax()
-                text_2 = (
-                    "In particular they said that " + questions[index_max][0] + ". "
-                )
-                text_t += text_2
+        text = "".join(text)
+        text = text.replace(",", "")
+        return text
 
-        else:
-            text_t = (
-                self.categorie_description(neuroticism)
-                + cat_0
-                + "The candidate tends to feel less negative emotions and anxiety. "
-            )
-            if neuroticism < -1:
-                index_min = person_metrics[10:20].idxmin()
-                text_2 = (
-                    "In particular they said that " + questions[index_min][0] + ". "
-                )
-                text_t += text_2
-        text.append(text_t)
-
-        # agreeableness
-        cat_0 = "critical and rational. "
-        cat_1 = "friendly and compassionate. "
-
-        if agreeableness > 0:
-            text_t = (
-                self.categorie_description(agreeableness)
-                + cat_1
-                + "The candidate tends to be more cooperative, polite, kind and friendly. "
-            )
-            if agreeableness > 1:
-                index_max = person_metrics[20:30].idxmax()
-                text_2 = (
-                    "In particular they said that " + questions[index_max][0] + ". "
-                )
-                text_t += text_2
+    @classmethod
+    def synthesize_texts(cls, people) -> pd.Series:
+        """
+        The text of synthesize_text for every person in people.df at once.
 
-        else:
-            text_t = (
-                self.categorie_description(agreeableness)
-                + cat_0
-                + "The candidate tends to be less cooperative, polite, kind and friendly. "
-            )
-            if agreeableness < -1:
-                index_min = person_metrics[20:30].idxmin()
-                text_2 = (
-                    "In particular they said that " + questions[index_min][0] + ". "
-                )
-                text_t += text_2
-        text.append(text_t)
-
-        # conscientiousness
-        cat_0 = "extravagant and careless. "
-        cat_1 = "efficient and organized. "
-
-        if conscientiousness > 0:
-            text_t = (
-                self.categorie_description(conscientiousness)
-                + cat_1
-                + "The candidate tends to be more careful or diligent. "
-            )
-            if conscientiousness > 1:
-                index_max = person_metrics[30:40].idxmax()
-                text_2 = (
-                    "In particular they said that " + questions[index_max][0] + ". "
-                )
-                text_t += text_2
-        else:
-            text_t = (
-                self.categorie_description(conscientiousness)
-                + cat_0
-                + "The candidate tends to be less careful or diligent. "
+        Arguments:
+        people: PersonStat with calculated statistics.
+
+        Returns:
+        Series of texts with the index of people.df.
+        """
+        df = people.df
+        salient_questions = people.salient_questions.loc[df.index]
+
+        # get_description removes the commas from the whole text, here from every part of it
+        question_texts = pd.Series(
+            dict(
+                (question, text.replace(",", ""))
+                for question, (text, _) in QUESTIONS.items()
             )
-            if conscientiousness < -1:
-                index_min = person_metrics[30:40].idxmin()
-                text_2 = (
-                    "In particular they said that " + questions[index_min][0] + ". "
+        )
+        categories = np.array(cls.category_words, dtype=object)
+
+        descriptions = np.full(len(df), "", dtype=object)
+        for trait, phrases in cls.trait_phrases.items():
+            cat_0, cat_1, less, more = [phrase.replace(",", "") for phrase in phrases]
+            values = df[trait + "_Z"].to_numpy(dtype=float)
+            high = values > 0
+
+            # categorie_description of every value
+            category = categories[
+                np.searchsorted(cls.category_bounds, values, side="left")
+            ]
+            questions = question_texts.reindex(
+                np.where(
+                    high,
+                    salient_questions[trait + "_max"].to_numpy(dtype=object),
+                    salient_questions[trait + "_min"].to_numpy(dtype=object),
                 )
-                text_t += text_2
-        text.append(text_t)
-
-        # openness
-        cat_0 = "consistent and cautious. "
-        cat_1 = "inventive and curious. "
-
-        if openness > 0:
-            text_t = (
-                self.categorie_description(openness)
-                + cat_1
-                + "The candidate tends to be more open to new ideas and experiences. "
+            ).to_numpy(dtype=object)
+            in_particular = np.where(
+                np.where(high, values > 1, values < -1),
+                "In particular they said that " + questions + ". ",
+                "",
             )
-            if openness > 1:
-                index_max = person_metrics[40:50].idxmax()
-                text_2 = (
-                    "In particular they said that " + questions[index_max][0] + ". "
-                )
-                text_t += text_2
-        else:
-            text_t = (
-                self.categorie_description(openness)
-                + cat_0
-                + "The candidate tends to be less open to new ideas and experiences. "
+
+            descriptions = (
+                descriptions
+                + category
+                + np.where(high, cat_1 + more, cat_0 + less)
+                + in_particular
             )
-            if openness < -1:
-                index_min = person_metrics[40:50].idxmin()
-                text_2 = (
-                    "In particular they said that " + questions[index_min][0] + ". "
-                )
-                text_t += text_2
-        text.append(text_t)
 
-        text = "".join(text)
-        text = text.replace(",", "")
-        return text
+        return pd.Series(descriptions, index=df.index)
 
     def synthesize_text(self):
         person = self.person
@@ -1,17 +1,197 @@
+import json
+import os
+import threading
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from utils.embeddings_utils import get_embedding, cosine_similarity
+from utils.llm_clients import configure_gemini
 
 from settings import (
     GPT_EMBEDDINGS_MODEL,
     USE_GEMINI,
     GEMINI_EMBEDDING_MODEL,
-    GEMINI_API_KEY,
 )
 
+# Version of the on-disk layout written by write_embeddings, stored in the parquet metadata.
+# Version 1 (no metadata) kept each vector as str(list) in the user_embedded column.
+# Version 2 keeps them as a fixed size list of float32, which is read without any parsing.
+EMBEDDINGS_FORMAT_KEY = b"embeddings_format"
+EMBEDDINGS_FORMAT_VERSION = 2
+# Engine and provider the vectors were made with, as json, vectors of different models
+# can not be mixed in one file
+EMBEDDINGS_MODEL_KEY = b"embeddings_model"
+
+
+def read_embeddings(path):
+    """
+    Read an embeddings parquet file.
+
+    Returns:
+    df: dataframe with the user, assistant, category and format columns
+    matrix: float32 array with one embedding per row of df
+    """
+    table = pq.read_table(path)
+    metadata = table.schema.metadata or {}
+
+    vectors = table.column("user_embedded").combine_chunks()
+    if len(vectors) == 0:
+        # reshape(0, -1) is ambiguous, the size of the vectors is only known from the schema
+        matrix = np.empty(
+            (0, getattr(vectors.type, "list_size", 0)), dtype=np.float32
+        )
+    elif metadata.get(EMBEDDINGS_FORMAT_KEY) == str(EMBEDDINGS_FORMAT_VERSION).encode():
+        matrix = vectors.flatten().to_numpy().reshape(len(vectors), -1)
+    else:
+        # Old layout, every vector is stored as the string of a python list
+        matrix = np.array(
+            [json.loads(vector) for vector in vectors.to_pylist()], dtype=np.float32
+        ).reshape(len(vectors), -1)
+
+    df = table.drop_columns(["user_embedded"]).to_pandas()
+    if "category" not in df:
+        df["category"] = None
+    if "format" not in df:
+        df["format"] = None
+    df = df[["user", "assistant", "category", "format"]]
+
+    return df, matrix
+
+
+def read_embeddings_model(path):
+    """
+    The model stored by write_embeddings, None if the file does not record one.
+    """
+    metadata = pq.read_schema(path).metadata or {}
+    if EMBEDDINGS_MODEL_KEY not in metadata:
+        return None
+    return json.loads(metadata[EMBEDDINGS_MODEL_KEY])
+
+
+def write_embeddings(df, path, model=None):
+    """
+    Write a dataframe with a user_embedded column holding one embedding per row
+    in the current embeddings format.
+
+    Arguments:
+    model: optional dict
+        Engine and provider of the embeddings, stored in the file metadata.
+    """
+    if len(df) == 0:
+        # Arrow has no fixed size lists of size 0 and the size of the vectors is unknown,
+        # read_embeddings returns a matrix with 0 rows and columns
+        vectors = pa.array([], type=pa.list_(pa.float32()))
+    else:
+        matrix = np.array(df["user_embedded"].to_list(), dtype=np.float32).reshape(
+            len(df), -1
+        )
+        vectors = pa.FixedSizeListArray.from_arrays(
+            pa.array(matrix.ravel(), type=pa.float32()), matrix.shape[1]
+        )
+
+    table = pa.Table.from_pandas(
+        df.drop(columns=["user_embedded"]), preserve_index=False
+    ).append_column("user_embedded", vectors)
+    table = table.replace_schema_metadata(
+        {
+            **(table.schema.metadata or {}),
+            EMBEDDINGS_FORMAT_KEY: str(EMBEDDINGS_FORMAT_VERSION).encode(),
+            **({} if model is None else {EMBEDDINGS_MODEL_KEY: json.dumps(model).encode()}),
+        }
+    )
+    pq.write_table(table, path)
+
+
+class EmbeddingIndex:
+    """
+    Read-only similarity index over embedded user/assistant pairs.
+
+    The embeddings are held as one contiguous float32 matrix whose rows are normalised
+    to unit length when the index is built, so the cosine similarity against every row
+    is a single matrix-vector product.
+    """
+
+    def __init__(self, df, matrix):
+        # The dataframe holds the text columns and is only used to return the rows that were found.
+        self.df = df.reset_index(drop=True)
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.matrix = np.ascontiguousarray(matrix / norms, dtype=np.float32)
+        self.matrix.flags.writeable = False
+
+    @classmethod
+    def from_files(cls, paths):
+        dfs, matrices = zip(*[read_embeddings(path) for path in paths])
+        # Empty files have a matrix without columns, which can not be stacked with the others
+        matrices = [matrix for matrix in matrices if len(matrix)] or [matrices[0]]
+        return cls(pd.concat(dfs, ignore_index=True), np.vstack(matrices))
+
+    def __len__(self):
+        return len(self.df)
+
+    def search(self, embedding, top_n=3, threshold=0.7):
+        if len(self.df) == 0:
+            return self.df.assign(similarities=np.empty(0, dtype=np.float32))
+
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / np.linalg.norm(query)
+        similarities = self.matrix @ query
+
+        # Only rows above the threshold are candidates, of these we take the top_n
+        # without sorting the whole array.
+        candidates = np.flatnonzero(similarities > threshold)
+        if len(candidates) > top_n:
+            top = np.argpartition(similarities[candidates], -top_n)[-top_n:]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-similarities[candidates])]
+
+        res = self.df.iloc[candidates].copy()
+        res["similarities"] = similarities[candidates]
+        return res
+
+
+class EmbeddingIndexRegistry:
+    """
+    Process wide store of loaded embedding indexes.
+
+    Streamlit runs every session in the same process, so chats look their index up here
+    instead of reading the parquet files on every rerun. Indexes are keyed by their file
+    paths and reloaded when the modification time of any of the files changes.
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, paths):
+        paths = tuple(paths)
+        mtimes = tuple(os.stat(path).st_mtime_ns for path in paths)
+
+        with self._lock:
+            if paths in self._indexes and self._indexes[paths][0] == mtimes:
+                self.hits += 1
+                return self._indexes[paths][1]
+
+            self.misses += 1
+            index = EmbeddingIndex.from_files(paths)
+            self._indexes[paths] = (mtimes, index)
+            return index
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "indexes": len(self._indexes)}
+
+
+index_registry = EmbeddingIndexRegistry()
+
 
 class Embeddings:
     def __init__(self):
-        self.df_dict = None
+        self.index = None
 
     def search(self, query, top_n=3):
         # type is the index into the various dataframes stored in the embeddings.
@@ -19,23 +199,14 @@ class Embeddings:
         # otherwise it will search those listed
 
         if USE_GEMINI:
-            import google.generativeai as genai
-
-            genai.configure(api_key=GEMINI_API_KEY)
+            configure_gemini()
             ENGINE = GEMINI_EMBEDDING_MODEL
         else:
             ENGINE = GPT_EMBEDDINGS_MODEL
         embedding = get_embedding(query, engine=ENGINE, use_gemini=USE_GEMINI)
 
         # An option for the future is to take the top from each dataframe, so we get a mixture of responses.
-        df = self.df_dict
-        df["similarities"] = df.user_embedded.apply(
-            lambda x: cosine_similarity(x, embedding)
-        )
-        df = df[df.similarities > 0.7]
-
-        res = df.sort_values("similarities", ascending=False).head(top_n)
-        return res
+        return self.index.search(embedding, top_n=top_n, threshold=0.7)
 
     def compare_strings(self, string1, string2):
         # Use this function to compare two strings or words embeddings
@@ -48,9 +219,7 @@ class Embeddings:
 
     def return_embedding(self, query):
         if USE_GEMINI:
-            import google.generativeai as genai
-
-            genai.configure(api_key=GEMINI_API_KEY)
+            configure_gemini()
             ENGINE = GEMINI_EMBEDDING_MODEL
         else:
             ENGINE = GPT_EMBEDDINGS_MODEL
@@ -61,7 +230,7 @@ class Embeddings:
 
 class PlayerEmbeddings(Embeddings):
     def __init__(self):
-        self.df_dict = PlayerEmbeddings.get_embeddings()
+        self.index = PlayerEmbeddings.get_embeddings()
 
     def get_embeddings():
         # Gets all relevant embeddings
@@ -70,26 +239,12 @@ class PlayerEmbeddings(Embeddings):
             "Forward",
         ]
 
-        df_embeddings = pd.DataFrame()
-        for file in files:
-            # Read in
-            df_temp = pd.read_parquet(f"data/embeddings/{file}.parquet")
-            if "category" not in df_temp:
-                df_temp["category"] = None
-            if "format" not in df_temp:
-                df_temp["format"] = None
-            df_temp = df_temp[
-                ["user", "assistant", "category", "user_embedded", "format"]
-            ]
-            df_temp["user_embedded"] = df_temp.user_embedded.apply(eval).to_list()
-            df_embeddings = pd.concat([df_embeddings, df_temp], ignore_index=True)
-
-        return df_embeddings
+        return index_registry.get([f"data/embeddings/{file}.parquet" for file in files])
 
 
 class CountryEmbeddings(Embeddings):
     def __init__(self):
-        self.df_dict = CountryEmbeddings.get_embeddings()
+        self.index = CountryEmbeddings.get_embeddings()
 
     def get_embeddings():
         # Gets all relevant embeddings
@@ -97,47 +252,17 @@ class CountryEmbeddings(Embeddings):
             "WVS_qualities",
         ]
 
-        df_embeddings = pd.DataFrame()
-        for file in files:
-            # Read in
-            df_temp = pd.read_parquet(f"data/embeddings/{file}.parquet")
-            if "category" not in df_temp:
-                df_temp["category"] = None
-            if "format" not in df_temp:
-                df_temp["format"] = None
-            df_temp = df_temp[
-                ["user", "assistant", "category", "user_embedded", "format"]
-            ]
-            df_temp["user_embedded"] = df_temp.user_embedded.apply(eval).to_list()
-            df_embeddings = pd.concat([df_embeddings, df_temp], ignore_index=True)
-
-        return df_embeddings
+        return index_registry.get([f"data/embeddings/{file}.parquet" for file in files])
 
 
 class PersonEmbeddings(Embeddings):
     def __init__(self):
-        self.df_dict = PersonEmbeddings.get_embeddings()
+        self.index = PersonEmbeddings.get_embeddings()
 
     def get_embeddings():
         # Gets all embeddings
-        df_embeddings_dict = dict()
-
         files = [
             "Forward_bigfive",
         ]
 
-        df_embeddings = pd.DataFrame()
-        for file in files:
-            # Read in
-            df_temp = pd.read_parquet(f"data/embeddings/{file}.parquet")
-            if "category" not in df_temp:
-                df_temp["category"] = None
-            if "format" not in df_temp:
-                df_temp["format"] = None
-            df_temp = df_temp[
-                ["user", "assistant", "category", "user_embedded", "format"]
-            ]
-            df_temp["user_embedded"] = df_temp.user_embedded.apply(eval).to_list()
-            df_embeddings = pd.concat([df_embeddings, df_temp], ignore_index=True)
-
-        return df_embeddings
+        return index_registry.get([f"data/embeddings/{file}.parquet" for file in files])
@@ -34,8 +34,11 @@ import os
 import pathlib
 import warnings 
 #used for plots
-from scipy import stats
 from mplsoccer import PyPizza, FontManager
+#possession adjustment, run from the root of the repository: python -m data.events.plot_RadarPlot
+from utils.events.possession import possession_per_player, adjust_per90
+from utils.stats_utils import PercentileTable
+from utils.partition_players import write_partition
 
 pd.options.mode.chained_assignment = None
 warnings.filterwarnings('ignore')
@@ -394,8 +397,10 @@ salah = salah[['npxG_per90', "goals_per90", "assists_per90", "key_passes_per90",
 per_90_columns = salah.columns[:]
 #values to mark on the plot
 values = [round(salah[column].iloc[0],2) for column in per_90_columns]
-#percentiles
-percentiles = [int(stats.percentileofscore(summary_per_90[column], salah[column].iloc[0])) for column in per_90_columns]
+#percentiles, from a table of the sorted values of every statistic that is made once
+#and gives the percentiles of any player, the same as stats.percentileofscore
+percentile_table = PercentileTable(summary_per_90[per_90_columns])
+percentiles = [int(percentile) for percentile in percentile_table.percentiles(salah.iloc[0])]
 
 ##############################################################################
 # Making radar charts
@@ -478,45 +483,12 @@ plt.show()
 # touched the ball (or if he did the team did not take control over it). We sum 
 # both team passes and these duels and all passes and these duels in this period. We store these values in a 
 # dictionary. Then, summing them for each player separately and calculating their ratio, we get 
-# the possesion of the ball by player's team while he was on the pitch. As the last step we merge it with our summary dataframe.
-
-possesion_dict = {}
-#for every row in the dataframe
-for i, row in minutes_per_game.iterrows():
-    #take player id, team id and match id, minute in and minute out
-    player_id, team_id, match_id = row["playerId"], row["teamId"], row["matchId"]
-    #create a key in dictionary if player encounterd first time
-    if not str(player_id) in possesion_dict.keys():
-        possesion_dict[str(player_id)] = {'team_passes': 0, 'all_passes' : 0}
-    min_in = row["player_in_min"]*60
-    min_out = row["player_out_min"]*60
-    
-    #get the dataframe of events from the game
-    match_df = train.loc[train["matchId"] == match_id].copy()
-    #add to 2H the highest value of 1H
-    match_df.loc[match_df["matchPeriod"] == "2H", 'eventSec'] = match_df.loc[match_df["matchPeriod"] == "2H", 'eventSec'] + match_df.loc[match_df["matchPeriod"] == "1H"]["eventSec"].iloc[-1]
-    #take all events from this game and this period
-    player_in_match_df = match_df.loc[match_df["eventSec"] > min_in].loc[match_df["eventSec"] <= min_out]
-    #take all passes and won duels as described
-    all_passes = player_in_match_df.loc[player_in_match_df["eventName"].isin(["Pass", "Duel"])]
-    #adjusting for no passes in this period (Tuanzebe)
-    if len(all_passes) > 0:
-        #removing lost air duels
-        no_contact = all_passes.loc[all_passes["subEventName"].isin(["Air duel", "Ground defending duel","Ground loose ball duel"])].loc[all_passes.apply(lambda x:{'id':701} in x.tags, axis = 1)]
-        all_passes = all_passes.drop(no_contact.index)
-    #take team passes 
-    team_passes = all_passes.loc[all_passes["teamId"] == team_id]
-    #append it {player id: {team passes: sum, all passes : sum}}
-    possesion_dict[str(player_id)]["team_passes"] += len(team_passes)
-    possesion_dict[str(player_id)]["all_passes"] += len(all_passes)
-
-#calculate possesion for each player
-percentage_dict = {key: value["team_passes"]/value["all_passes"] if value["all_passes"] > 0 else 0 for key, value in possesion_dict.items()}
-#create a dataframe
-percentage_df = pd.DataFrame(percentage_dict.items(), columns = ["playerId", "possesion"])
-percentage_df["playerId"] = percentage_df["playerId"].astype(int)
-#merge it
-summary = summary.merge(percentage_df, how = "left", on = ["playerId"])
+# the possesion of the ball by player's team while he was on the pitch.
+#
+# Instead of filtering the events of a game again for every player, *possession_per_player* groups the
+# events by match once, counts the touches cumulatively over time and looks up the time each player was on the pitch.
+
+possesion = possession_per_player(train, minutes_per_game)
 
 ##############################################################################
 # Adjusting data for possession
@@ -525,13 +497,7 @@ summary = summary.merge(percentage_df, how = "left", on = ["playerId"])
 # possesion while player was on the pitch during the entire season. To normalize the values per 
 # 90 minutes player we repeat the multiplication by 90 and division by minutes played.
 
-#create a new dataframe only for it
-summary_adjusted = pd.DataFrame()
-summary_adjusted["shortName"] = summary["shortName"]
-#calculate value adjusted
-for column in summary.columns[2:11]:
-    summary_adjusted[column + "_adjusted_per90"] = summary.apply(lambda x: (x[column]/x["possesion"])*90/x["minutesPlayed"], axis = 1)
-summary_adjusted["minutesPlayed"]= summary["Minutes"]
+summary_adjusted = adjust_per90(summary, possesion)
 
 
 ##############################################################################
@@ -547,7 +513,8 @@ adjusted_columns = salah_adjusted.columns[:]
 #values
 values = [salah_adjusted[column].iloc[0] for column in adjusted_columns]
 #percentiles
-percentiles = [int(stats.percentileofscore(summary_adjusted[column], salah_adjusted[column].iloc[0])) for column in adjusted_columns]
+percentile_table = PercentileTable(summary_adjusted[adjusted_columns])
+percentiles = [int(percentile) for percentile in percentile_table.percentiles(salah_adjusted.iloc[0])]
 names = names = ["non-penalty Expected Goals", "non-penalty Goals", "Assists", "Key Passes", "Smart Passes", "Passes Ending in Final Third", "Passes Received in Final Third", "Offensive Ground Duels Won", "Air Duels Won"]
 
 
@@ -602,6 +569,15 @@ fig.text(
 
 plt.show()
 
+##############################################################################
+# Saving the data
+# ----------------------------
+# The adjusted statistics are the data of the chatbot. For several leagues the same table can be made
+# from the parquet files of *utils.events.ingest* with *python -m utils.events.metrics*, which classifies
+# every event once instead of filtering the events again for every statistic.
+# The football scout page reads the same table from its partition of the players dataset.
+
 summary_adjusted.to_csv('data/events/Forwards.csv', index=False)
+write_partition(summary_adjusted, league="England", season="2017-18", position="Forward")
 
     
\ No newline at end of file
@@ -1,51 +1,47 @@
 # Run this script to generate responses for the data points
-# This code uses exponential backoff to handle rate limiting errors from the API.
-# The code will also cycle through API keys if the max delay is reached.
+# Responses are generated concurrently with asyncio: every entity and type runs as a task, and
+# the generation and reconstruction calls of different entities overlap. The number of requests
+# in flight and the requests per minute of every API key are limited, and a key that gets a
+# 429 is rested while the other keys are used (see gemini_client.py).
 
 # Required files:
-# 1. secrets.json - containing a valid Gemini API key
+# 1. secrets.json - containing valid Gemini API keys (GEMINI_API_KEY, GEMINI_API_KEY_V, ...), or pass --keys
 # 2. data/{ttype}_texts.csv - containing the entity names and the corresponding text to be used in 3. (see generate_data_for_evaluation.py)
 # 3. prompts/prompt_v1_{ttype}.json - prompt to use for generating responses (copy of chat used in app with modification to discourage "decline to answer" responses, i.e. example with no data.)
 # 4. prompts/reconstruct_v1_{ttype}.json - prompt to use for reconstructing the data from the responses 3.
 # 5. data/{ttype}_ground_truth.csv - data to be used as ground truth for the factors. (see generate_data_for_evaluation.py)
 
 # Output:
-# 1. data_points.json - in per ttype subfolder.
-
+# 1. data_points.sqlite - in per ttype subfolder, every response is added as soon as it is
+#    reconstructed, and a stopped run continues from it (see result_store.py).
+# 2. data_points.json - the same data points, written when the entity type is done. A
+#    data_points.json of an earlier run without data_points.sqlite is imported first.
+
+# Usage (from the root of the repository):
+#     python -m evaluation.analysis_pipeline [--run 2024-11-27] [--concurrency 8] [--rpm 15]
+# To run offline against a stub of the API, start python -m evaluation.stub_llm_server and add
+#     --base-url http://127.0.0.1:8765 --keys a b c d
+
+import argparse
+import asyncio
 import json
-import pandas as pd
-import pickle
-import google.generativeai as genai
-import datetime
 import os
-import random
-import time
-from nltk.translate.bleu_score import sentence_bleu
 import re
-from tqdm import tqdm
+import time
 
-path = "C:/Users/Amy/Desktop/Green_Git/wvs-data/analysis/"
+import pandas as pd
+
+from evaluation.gemini_client import GEMINI_BASE_URL, GeminiClient, KeyPool
+from evaluation.result_store import ResultStore
+
+path = os.path.dirname(os.path.abspath(__file__))
 N = 10  # Min number of (non-"None") labels per factor per data point
+max_tries = 20  # max number of tries to generate a response
 
 additional_text = (
     f"\n If no data is provided answer anyway, using your prior statistical knowledge."
 )
 
-# read secrets.json
-with open(path + "secrets.json") as f:
-    secrets = json.load(f)
-
-GEMINI_API_KEYS = [
-    secrets[x]
-    for x in [
-        "GEMINI_API_KEY",
-        "GEMINI_API_KEY_V",
-        "GEMINI_API_KEY_N",
-        "GEMINI_API_KEY_B",
-    ]
-]
-current_key = 0
-genai.configure(api_key=GEMINI_API_KEYS[current_key])
 GEMINI_CHAT_MODEL = "gemini-1.5-flash"
 generationConfig = {
     "temperature": 1.0,
@@ -54,60 +50,49 @@ generationConfig = {
     # "maxOutputTokens": 2048,
 }
 
-
 ttypes = ["player", "person", "country"]  # entity types, different applications
 dt = "2024-11-27"  # datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
-prompt_files = []
-prompts = []
-reconstruct_prompt_files = []
-reconstruct_prompts = []
-folder_names = []
-entity_names_list = []
-entity_texts_list = []
-ground_truth_dfs = []
-for ttype in ttypes:
-    prompt_file = f"prompt_v1_{ttype}.json"
-    # read prompt from json
-    with open(path + "prompts\\" + prompt_file) as f:
-        msgs = json.load(f)
-
-    prompt_files.append(prompt_file)
-    prompts.append(msgs)
-
-    ####################
 
-    rec_prompt_file = f"reconstruct_v1_{ttype}.json"
-    # read prompt from json
-    with open(path + "prompts\\" + rec_prompt_file) as f:
-        msgs = json.load(f)
-    reconstruct_prompt_files.append(rec_prompt_file)
-    reconstruct_prompts.append(msgs)
+def get_api_keys(path):
+    # read secrets.json
+    with open(os.path.join(path, "secrets.json")) as f:
+        secrets = json.load(f)
 
-    ####################
+    return [
+        secrets[x]
+        for x in [
+            "GEMINI_API_KEY",
+            "GEMINI_API_KEY_V",
+            "GEMINI_API_KEY_N",
+            "GEMINI_API_KEY_B",
+        ]
+        if x in secrets
+    ]
 
-    folder_name = path + f"{dt}/{prompt_file.split('.')[0]}/"
-    # if folder does not exist create it
-    if not os.path.exists(folder_name):
-        os.makedirs(folder_name)
-    folder_names.append(folder_name)
 
-    ####################
+def load_ttype(path, ttype, dt):
+    """
+    Read the prompts, texts and ground truth of an entity type.
+    """
+    prompt_file = f"prompt_v1_{ttype}.json"
+    # read prompt from json
+    with open(os.path.join(path, "prompts", prompt_file)) as f:
+        msg = json.load(f)
 
-    # read country specify text from csv
-    entity_texts = pd.read_csv(path + "data\\" + f"{ttype}_texts.csv")
+    rec_prompt_file = f"reconstruct_v1_{ttype}.json"
+    with open(os.path.join(path, "prompts", rec_prompt_file)) as f:
+        msg_rec = json.load(f)
 
-    entity_names = entity_texts[ttype].tolist()
+    folder_name = os.path.join(path, dt, prompt_file.split(".")[0])
+    os.makedirs(folder_name, exist_ok=True)
 
+    entity_texts = pd.read_csv(os.path.join(path, "data", f"{ttype}_texts.csv"))
     entity_texts["text_empty"] = entity_texts["text_empty"].apply(
         lambda x: x + additional_text
     )
-    entity_names_list.append(entity_names)
-    entity_texts_list.append(entity_texts)
-
-    ####################
 
-    df_ground_truth = pd.read_csv(path + f"data//{ttype}_ground_truth.csv")
+    df_ground_truth = pd.read_csv(os.path.join(path, "data", f"{ttype}_ground_truth.csv"))
 
     if ttype == "player":
         cols_y = [
@@ -140,81 +125,7 @@ for ttype in ttypes:
     # rename columns to lowercase
     df_ground_truth.columns = df_ground_truth.columns.str.lower()
 
-    ground_truth_dfs.append(df_ground_truth)
-
-
-# define a retry decorator
-def retry_with_exponential_backoff(
-    func,
-    initial_delay: float = 2,
-    exponential_base: float = 2,
-    jitter: bool = True,
-    max_retries: int = 10,
-    max_delay: float = 60 * 5,
-    errors: tuple = (Exception,),
-):
-    """Retry a function with exponential backoff."""
-
-    def wrapper(*args, **kwargs):
-        # Initialize variables
-        num_retries = 0
-        delay = initial_delay
-
-        # Loop until a successful response or max_retries is hit or an exception is raised
-        while True:
-            try:
-                return func(*args, **kwargs)
-
-            # Retry on specified errors
-            except errors as e:
-                # Increment retries
-                num_retries += 1
-
-                # Check if max retries has been reached
-                if num_retries > max_retries:
-                    raise Exception(
-                        f"Maximum number of retries ({max_retries}) exceeded."
-                    )
-
-                # Increment the delay
-                delay *= exponential_base * (1 + jitter * random.random())
-
-                if delay > max_delay:
-
-                    global current_key
-                    current_key = current_key + 1
-                    # mod len(GEMINI_API_KEYS) to ensure current_key is within the range of GEMINI_API_KEYS
-                    current_key = current_key % len(GEMINI_API_KEYS)
-                    print("max delay reached switching to next key", current_key)
-
-                print(f"Retrying in {delay} seconds...")
-                # Sleep for the delay
-                time.sleep(delay)
-
-            # Raise exceptions for any errors not specified
-            except Exception as e:
-                raise e
-
-    return wrapper
-
-
-def get_response(msgs, text):
-
-    model = genai.GenerativeModel(
-        model_name=GEMINI_CHAT_MODEL,
-        system_instruction=msgs["system_instruction"],
-        generation_config=generationConfig,
-    )
-    msgs["content"]["parts"] = text
-    chat = model.start_chat(history=msgs["history"])
-    response = chat.send_message(content=msgs["content"])
-
-    return response
-
-
-@retry_with_exponential_backoff
-def completions_with_backoff(**kwargs):
-    return get_response(**kwargs)
+    return msg, msg_rec, entity_texts, df_ground_truth, folder_name
 
 
 label_factor_dict = {}
@@ -284,12 +195,6 @@ label_factor_dict["person"] = {
     },
 }
 
-for t in ttypes:
-    if t not in label_factor_dict.keys():
-        raise ValueError(
-            f"{t} not in label_factor_dict, please add factors and labels for your application."
-        )
-
 
 def match_re(text):
     pattern = re.compile(r"{.*?}", re.DOTALL)
@@ -337,131 +242,178 @@ def get_metrics(entity, text, labels, factors):
     return metrics
 
 
-start = time.time()
-to_do = 0
-max_tries = 20  # max number of tries to generate a response
+async def complete_entity(
+    client, ttype, name, tt, text, msg, msg_rec, ground_truth, store
+):
+    """
+    Generate and reconstruct responses for one entity and type until every factor has N labels.
+    """
+    factors = label_factor_dict[ttype]["factors"]
+    completed = store.counts(name, tt)
+    factor_counts = store.factor_counts(name, tt)
+
+    count = -1
+    # while the factor count of any factor is less than N continue to generate responses
+    while any([x < N for x in factor_counts.values()]) and count < max_tries:
+        count += 1
+        if count in completed:
+            continue
+
+        response_text = await client.generate(msg, text)
+        response_text_rec = await client.generate(msg_rec, response_text)
+
+        metrics = get_metrics(
+            entity=name,
+            text=response_text_rec,
+            labels=label_factor_dict[ttype]["labels"],
+            factors=factors,
+        )
 
-for (
-    ttype,
-    entity_names,
-    entity_texts,
-    msg,
-    msg_rec,
-    ground_truth_df,
-    folder_name,
-) in zip(
-    ttypes,
-    entity_names_list,
-    entity_texts_list,
-    prompts,
-    reconstruct_prompts,
-    ground_truth_dfs,
-    folder_names,
+        # increase factor counts if the response is not None
+        for factor in factors:
+            if metrics[factor] != "None":
+                factor_counts[factor] += 1
+
+        data_point = {
+            ttype: name,
+            "type": tt,
+            "count": count,
+            "response": response_text,
+            "response_rec": response_text_rec,
+        }
+        for factor in factors:
+            data_point[factor + "_true"] = ground_truth[factor]
+            data_point[factor + "_pred"] = metrics[factor]
+        store.add(data_point)
+
+    if count >= max_tries:
+        print("Max tries reached.", "_".join([name, tt, str(count)]))
+
+
+async def gather_all(coroutines):
+    """
+    Like asyncio.gather, but when one of the coroutines fails the others are cancelled and
+    awaited before the error is raised, so nothing still uses the store or the client after
+    they are closed.
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def run_ttype(client, path, ttype, dt, limit=None):
+    msg, msg_rec, entity_texts, df_ground_truth, folder_name = load_ttype(path, ttype, dt)
+
+    store = ResultStore(
+        os.path.join(folder_name, "data_points.sqlite"),
+        ttype,
+        label_factor_dict[ttype]["factors"],
+    )
+    # Continue from the data points of a run before the store existed
+    json_path = os.path.join(folder_name, "data_points.json")
+    if len(store) == 0 and os.path.exists(json_path):
+        store.import_json(json_path)
+
+    entity_texts = entity_texts.set_index(ttype)
+    df_ground_truth = df_ground_truth.set_index(ttype)
+    entity_names = entity_texts.index.tolist()[:limit]
+
+    try:
+        await gather_all(
+            complete_entity(
+                client,
+                ttype,
+                name,
+                tt,
+                entity_texts.at[name, t],
+                msg,
+                msg_rec,
+                df_ground_truth.loc[name],
+                store,
+            )
+            for name in entity_names
+            for t, tt in zip(["text", "text_empty"], ["with data", "no data"])
+        )
+        # save data_points to json
+        store.export_json(json_path)
+        return len(store)
+    finally:
+        store.close()
+
+
+async def run(
+    keys,
+    path=path,
+    ttypes=ttypes,
+    dt=dt,
+    base_url=GEMINI_BASE_URL,
+    concurrency=8,
+    requests_per_minute=15,
+    limit=None,
 ):
-    # if data points already exist, load them
-    if os.path.exists(folder_name + "data_points.json"):
-        with open(folder_name + "data_points.json") as f:
-            data_points = json.load(f)
-    else:
-        data_points = {}
-
-    for name in tqdm(entity_names):
-        for t, tt in zip(["text", "text_empty"], ["with data", "no data"]):
-
-            count = -1
-            text = entity_texts[entity_texts[ttype] == name][t].values[0]
-
-            factors = label_factor_dict[ttype]["factors"]
-            keys = [k for k in data_points.keys() if name + "_" + tt in k]
-            factor_counts = {
-                factor: sum(
-                    [
-                        1 if data_points[k][factor + "_pred"] != "None" else 0
-                        for k in keys
-                    ]
-                )
-                for factor in factors
-            }
-
-            #####################
-            # to_do_list = [N - factor_counts[factor] for factor in factors]
-            # to_do += max(to_do_list)
-
-            # # if any([x < N for x in factor_counts.values()]):
-            # #     print(name, tt)
-            # #     print(factor_counts)
-
-            # continue
-            #####################
-
-            # while the factor count of any factor is less than 5 continue to generate responses
-            while any([x < N for x in factor_counts.values()]) and count < max_tries:
-                count += 1
-                if "_".join([name, tt, str(count)]) in keys:
-                    # print("_".join([name, tt, str(count)]), "already completed")
-                    pass
-                else:
-                    #####################
-                    response = completions_with_backoff(
-                        msgs=msg,
-                        text=entity_texts[entity_texts[ttype] == name]["text"].values[
-                            0
-                        ],
-                    )
-                    response_text = response.candidates[0].content.parts[0].text
-
-                    response_rec = completions_with_backoff(
-                        msgs=msg_rec,
-                        text=response_text,
-                    )
-                    response_text_rec = response_rec.candidates[0].content.parts[0].text
-
-                    metrics = get_metrics(
-                        entity=name,
-                        text=response_text_rec,
-                        labels=label_factor_dict[ttype]["labels"],
-                        factors=factors,
-                    )
-                    #####################
-                    # response_text = ""
-                    # response_text_rec = ""
-                    # metrics = {
-                    #     f: ground_truth_df[ground_truth_df[ttype] == name][f].values[0]
-                    #     for f in factors
-                    # }
-                    #####################
-
-                    # increase factor counts if the response is not None
-                    for factor in factors:
-                        if metrics[factor] != "None":
-                            factor_counts[factor] += 1
-
-                    data_points["_".join([name, tt, str(count)])] = {
-                        ttype: name,
-                        "type": tt,
-                        "count": count,
-                        "response": response_text,
-                        "response_rec": response_text_rec,
-                    }
-                    for factor in factors:
-                        data_points["_".join([name, tt, str(count)])][
-                            factor + "_true"
-                        ] = ground_truth_df[ground_truth_df[ttype] == name][
-                            factor
-                        ].values[
-                            0
-                        ]
-                        data_points["_".join([name, tt, str(count)])][
-                            factor + "_pred"
-                        ] = metrics[factor]
-
-            # save data_points to json
-            with open(folder_name + "data_points.json", "w") as f:
-                json.dump(data_points, f)
-
-            if count >= max_tries:
-                print("Max tries reached.", "_".join([name, tt, str(count)]))
-
-end = time.time()
-print(f"Time taken: {end-start} seconds")
-print(to_do)
+    """
+    Generate the data points of every entity type concurrently.
+
+    Returns:
+    Dict from entity type to its number of data points, and the requests and 429s per key.
+    """
+    key_pool = KeyPool(keys, requests_per_minute)
+    client = GeminiClient(
+        key_pool,
+        GEMINI_CHAT_MODEL,
+        generationConfig,
+        base_url=base_url,
+        concurrency=concurrency,
+    )
+    try:
+        results = await gather_all(
+            run_ttype(client, path, ttype, dt, limit=limit) for ttype in ttypes
+        )
+    finally:
+        await client.aclose()
+
+    return dict(zip(ttypes, results)), key_pool.summary()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=path)
+    parser.add_argument("--run", default=dt, help="name of the output folder")
+    parser.add_argument("--ttypes", nargs="+", default=ttypes)
+    parser.add_argument("--keys", nargs="+", help="API keys, default from secrets.json")
+    parser.add_argument("--base-url", default=GEMINI_BASE_URL)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=float, default=15, help="requests per minute per key")
+    parser.add_argument("--limit", type=int, default=None, help="entities per type")
+    args = parser.parse_args()
+
+    for t in args.ttypes:
+        if t not in label_factor_dict.keys():
+            raise ValueError(
+                f"{t} not in label_factor_dict, please add factors and labels for your application."
+            )
+
+    start = time.time()
+    data_points, key_summary = asyncio.run(
+        run(
+            args.keys or get_api_keys(args.path),
+            path=args.path,
+            ttypes=args.ttypes,
+            dt=args.run,
+            base_url=args.base_url,
+            concurrency=args.concurrency,
+            requests_per_minute=args.rpm,
+            limit=args.limit,
+        )
+    )
+    end = time.time()
+
+    requests = sum(key["requests"] for key in key_summary.values())
+    print(f"Time taken: {end-start} seconds")
+    print(f"{requests} requests, {requests / (end - start):.2f} per second")
+    print(key_summary)
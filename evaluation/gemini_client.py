@@ -0,0 +1,201 @@
+"""
+Async Gemini client for analysis_pipeline.py, with a rate limit per API key.
+
+Requests go to the REST endpoint models/{model}:generateContent, so the pipeline can run against
+the Gemini API or against stub_llm_server.py. Each key has a token bucket of requests per minute.
+A request takes the key that has a token available soonest, and a key that answers 429 is
+not used again until its Retry-After has passed, so the keys rotate on the limits that are
+actually hit. The number of requests in flight is bounded by a semaphore.
+"""
+
+import asyncio
+import random
+import time
+
+import httpx
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com"
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average and bursts of up to capacity requests.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """
+        Seconds until a token is available.
+        """
+        self.refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def take(self):
+        self.refill()
+        self.tokens -= 1
+
+
+class KeyPool:
+    def __init__(self, keys, requests_per_minute, burst=1):
+        self.buckets = dict(
+            (key, TokenBucket(requests_per_minute / 60, burst)) for key in keys
+        )
+        # Time until which a key is not used after a 429
+        self.blocked_until = dict((key, 0.0) for key in keys)
+        self.requests = dict((key, 0) for key in keys)
+        self.rate_limited = dict((key, 0) for key in keys)
+        self._lock = asyncio.Lock()
+
+    def wait_time(self, key):
+        return max(
+            self.buckets[key].wait_time(), self.blocked_until[key] - time.monotonic()
+        )
+
+    async def acquire(self):
+        """
+        Wait for the key that is available soonest and take a token from it.
+        """
+        async with self._lock:
+            while True:
+                key = min(self.buckets, key=self.wait_time)
+                wait = self.wait_time(key)
+                if wait <= 0:
+                    self.buckets[key].take()
+                    self.requests[key] += 1
+                    return key
+                await asyncio.sleep(wait)
+
+    def block(self, key, seconds):
+        self.rate_limited[key] += 1
+        self.blocked_until[key] = max(
+            self.blocked_until[key], time.monotonic() + seconds
+        )
+        # No burst when the key is used again
+        self.buckets[key].tokens = 0
+
+    def summary(self):
+        return dict(
+            (
+                key[-4:],
+                {"requests": self.requests[key], "rate_limited": self.rate_limited[key]},
+            )
+            for key in self.buckets
+        )
+
+
+def get_request_body(msgs, text, generation_config):
+    """
+    Body of a generateContent request for a prompt file of analysis_pipeline.py, with text as
+    the last user message.
+    """
+    contents = [
+        {"role": message["role"], "parts": [{"text": message["parts"]}]}
+        for message in msgs["history"]
+    ]
+    contents.append({"role": msgs["content"]["role"], "parts": [{"text": text}]})
+
+    return {
+        "system_instruction": {"parts": [{"text": msgs["system_instruction"]}]},
+        "contents": contents,
+        "generationConfig": generation_config,
+    }
+
+
+class GeminiClient:
+    def __init__(
+        self,
+        key_pool,
+        model,
+        generation_config,
+        base_url=GEMINI_BASE_URL,
+        concurrency=8,
+        max_retries=10,
+        max_rate_limited=50,
+        rate_limit_wait=60,
+        timeout=120,
+    ):
+        self.key_pool = key_pool
+        self.model = model
+        self.generation_config = generation_config
+        self.url = f"{base_url}/v1beta/models/{model}:generateContent"
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_retries = max_retries
+        # 429s of a single request before it fails, so it cannot loop when every key stays limited
+        self.max_rate_limited = max_rate_limited
+        # Seconds a key is not used after a 429 without a Retry-After header
+        self.rate_limit_wait = rate_limit_wait
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=concurrency, max_keepalive_connections=concurrency
+            ),
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def generate(self, msgs, text):
+        """
+        Return the text of the response to msgs with text as the last user message.
+
+        A 429 blocks the key and the request is retried with the next available key, this
+        does not count as a retry, but the request fails after max_rate_limited 429s. Other
+        errors are retried up to max_retries times with exponential backoff, which only delays
+        this request.
+        """
+        body = get_request_body(msgs, text, self.generation_config)
+        delay = 2.0
+        error = None
+
+        attempt = 0
+        rate_limited = 0
+        while attempt <= self.max_retries:
+            try:
+                async with self.semaphore:
+                    # The token is taken when the request can be sent
+                    key = await self.key_pool.acquire()
+                    response = await self.client.post(
+                        self.url, json=body, headers={"x-goog-api-key": key}
+                    )
+            except httpx.TransportError as e:
+                error = e
+            else:
+                if response.status_code < 400:
+                    return response.json()["candidates"][0]["content"]["parts"][0][
+                        "text"
+                    ]
+                error = httpx.HTTPStatusError(
+                    f"{response.status_code} from {self.url}",
+                    request=response.request,
+                    response=response,
+                )
+                if response.status_code == 429:
+                    # The next attempt takes another key, without waiting here
+                    retry_after = response.headers.get("retry-after")
+                    self.key_pool.block(
+                        key,
+                        float(retry_after) if retry_after else self.rate_limit_wait,
+                    )
+                    rate_limited += 1
+                    if rate_limited < self.max_rate_limited:
+                        continue
+                    break
+                if response.status_code < 500:
+                    raise error
+
+            attempt += 1
+            if attempt <= self.max_retries:
+                await asyncio.sleep(delay * (1 + random.random()))
+                delay = min(delay * 2, 60)
+
+        raise Exception(f"Maximum number of retries ({self.max_retries}) exceeded.") from error
@@ -1,425 +1,157 @@
-# %%
-# # Debug the data loading and processing
+"""
+Generate the texts and ground truth used by analysis_pipeline.py.
 
-# from classes.data_source import CountryStats
-# import copy
-# from classes.description import (
-#     CountryDescription,
-# )
-# import json
+For every entity type (player, country, person) the statistics are calculated once, then the
+texts of all entities are made with the batch synthesize_texts of the descriptions, and the
+ground truth label of every factor is taken from the same z-scores. The entity types are
+generated in parallel in a process pool.
 
-# countries = CountryStats()
-# metrics = [m for m in countries.df.columns if m not in ["country"]]
+Output, per entity type, in evaluation/data:
+- {ttype}.parquet: the entity name, text, text_empty and one column per factor.
+- {ttype}_texts.csv and {ttype}_ground_truth.csv: the same data in the files read by analysis_pipeline.py.
 
-# countries.calculate_statistics(metrics=metrics)
-# country_names = countries.df["country"].values.tolist()
+Usage (from the root of the repository):
+    python -m evaluation.generate_data_for_evaluation [player] [country] [person] [--workers 3]
+"""
 
-# country = copy.deepcopy(countries)
-# country.df = country.df[country.df["country"] == "United States of America"]
-# country = country.to_data_point()
-
-
-# with open("../data/wvs/description_dict.json", "r") as f:
-#     description_dict = json.load(f)
-
-# thresholds_dict = dict(
-#     (
-#         metric,
-#         [
-#             2,
-#             1,
-#             -1,
-#             -2,
-#         ],
-#     )
-#     for metric in metrics
-# )
-# description = CountryDescription(
-#     country, description_dict=description_dict, thresholds_dict=thresholds_dict
-# )
-
-
-# %%
-# Generate country specific data for evaluation
-
-from classes.data_source import CountryStats
-from classes.description import CountryDescription
-import copy
+import argparse
 import json
-import pandas as pd
-
-countries = CountryStats()
-
-metrics = [m for m in countries.df.columns if m not in ["country"]]
-
-countries.calculate_statistics(metrics=metrics)
-
-country_names = countries.df["country"].values.tolist()
-
-with open("../data/wvs/description_dict.json", "r") as f:
-    description_dict = json.load(f)
-
-thresholds_dict = dict(
-    (
-        metric,
-        [
-            2,
-            1,
-            -1,
-            -2,
-        ],
-    )
-    for metric in metrics
-)
-
-
-def select_country(countries, country_name):
-
-    countries = CountryStats()
-    countries.calculate_statistics(metrics=metrics)
-    # Make a copy of Players object
-    country = copy.deepcopy(countries)
-
-    # rnd = int(country.select_random()) # does not work because of page refresh!
-    # Filter country by position and select a player with sidebar selectors
-    country.df = country.df[country.df["country"] == country_name]
-    # Return data point
-
-    country = country.to_data_point()
-
-    return country
-
-
-texts = []
-texts_empty = []
-for country_name in country_names:
-    try:
-        tmp_country = select_country(countries, country_name)
-        c_description = CountryDescription(
-            tmp_country,
-            description_dict=description_dict,
-            thresholds_dict=thresholds_dict,
-        )
+import os
+from concurrent.futures import ProcessPoolExecutor
 
-        text = f"Now do the same thing with the following: ```{c_description.synthesize_text()}```"
-        text_empty = f"Now do the same thing with the following: ```Here is a statistical description of the societal values of {tmp_country.name.capitalize()}.\n\n```"
-
-        texts.append(text)
-        texts_empty.append(text_empty)
-    except:
-        texts.append("")
-        texts_empty.append("")
-        print(f"Error with {country_name}")
-
-
-# zip country names and texts into a dataframe and save
-df = pd.DataFrame({"country": country_names, "text": texts, "text_empty": texts_empty})
-df.to_csv("data/country_texts.csv", index=False)
-# %%
-
-# Generate country specific ground truth
-
-from classes.data_source import CountryStats
-from classes.description import CountryDescription
-import copy
-import json
+import numpy as np
 import pandas as pd
-import utils.sentences as sentences
-
-countries = CountryStats()
-
-metrics = [m for m in countries.df.columns if m not in ["country"]]
-
-countries.calculate_statistics(metrics=metrics)
-
-country_names = countries.df["country"].values.tolist()
-
-description_dict = dict(
-    (
-        metric,
-        [
-            "far above average",
-            "above average",
-            "average",
-            "below average",
-            "far below average",
-        ],
-    )
-    for metric in metrics
-)
-
-
-thresholds_dict = dict(
-    (
-        metric,
-        [
-            2,
-            1,
-            -1,
-            -2,
-        ],
-    )
-    for metric in metrics
-)
-
-
-def select_country(countries, country_name):
-
-    countries = CountryStats()
-    countries.calculate_statistics(metrics=metrics)
-    # Make a copy of Players object
-    country = copy.deepcopy(countries)
-
-    # rnd = int(country.select_random()) # does not work because of page refresh!
-    # Filter country by position and select a player with sidebar selectors
-    country.df = country.df[country.df["country"] == country_name]
-    # Return data point
-
-    country = country.to_data_point()
 
-    return country
-
-
-factors = []
-for country_name in country_names:
-    tmp_country = select_country(countries, country_name)
-    data = [tmp_country.name]
-    for metric in tmp_country.relevant_metrics:
-        try:
-            text = sentences.describe_level(
-                tmp_country.ser_metrics[metric + "_Z"],
-                thresholds=thresholds_dict[metric],
-                words=description_dict[metric],
-            )
-            data.append(text)
-        except:
-            data.append(None)
-            print(f"Error with {country_name}")
-
-    factors.append(data)
-
-# create a dataframe with columns 'country' and and each factor from tmp_country.relevant_metrics
-df = pd.DataFrame(factors, columns=["country"] + tmp_country.relevant_metrics)
-df.to_csv("data/country_ground_truth.csv", index=False)
-# %%
-# %%
-# Generate player specific data for evaluation
-
-from classes.data_source import PlayerStats
-from classes.description import PlayerDescription
-import copy
-import json
-import pandas as pd
 import utils.sentences as sentences
-
-
-players = PlayerStats()
-
-metrics = [m for m in players.df.columns if m not in ["player_name"]]
-
-players.calculate_statistics(metrics=metrics)
-
-player_names = players.df["player_name"].values.tolist()
-
-description_dict = dict(
-    (
-        metric,
-        ["outstanding", "excellent", "good", "average", "below average", "poor"],
-    )
-    for metric in metrics
+from classes.data_source import PlayerStats, CountryStats, PersonStat
+from classes.description import (
+    PlayerDescription,
+    CountryDescription,
+    PersonDescription,
 )
 
-thresholds_dict = dict(
-    (
-        metric,
-        [1.5, 1, 0.5, -0.5, -1],
-    )
-    for metric in metrics
-)
+OUTPUT_PATH = "evaluation/data"
+TTYPES = ["player", "country", "person"]
 
+COUNTRY_WORDS = [
+    "far above average",
+    "above average",
+    "average",
+    "below average",
+    "far below average",
+]
+COUNTRY_THRESHOLDS = [2, 1, -1, -2]
 
-def select_player(players, player_name):
 
+def generate_players():
     players = PlayerStats()
+    metrics = [m for m in players.df.columns if m not in ["player_name"]]
     players.calculate_statistics(metrics=metrics)
-    # Make a copy of Players object
-    player = copy.deepcopy(players)
-
-    # rnd = int(player.select_random()) # does not work because of page refresh!
-    # Filter player by position and select a player with sidebar selectors
-    player.df = player.df[player.df["player_name"] == player_name]
-    # Return data point
-
-    player = player.to_data_point(gender="male", position="Forward")
-
-    return player
-
 
-texts = []
-texts_empty = []
-for player_name in player_names:
-    # try:
-    tmp_player = select_player(players, player_name)
-    c_description = PlayerDescription(
-        tmp_player,
+    names = players.df["player_name"]
+    df = pd.DataFrame(
+        {
+            "player": names,
+            "text": PlayerDescription.synthesize_texts(players, "male", "Forward"),
+            "text_empty": "Here is a statistical description of " + names + "...```",
+        }
     )
+    for metric in metrics:
+        df[metric] = sentences.describe_levels(players.df[metric + "_Z"].to_numpy())
 
-    text = c_description.synthesize_text()
-    text_empty = f"Here is a statistical description of {tmp_player.name}...```"
-
-    texts.append(text)
-    texts_empty.append(text_empty)
-    # except:
-    #     texts.append("")
-    #     texts_empty.append("")
-    #     print(f"Error with {player_name}")
-
-
-# zip country names and texts into a dataframe and save
-df = pd.DataFrame({"player": player_names, "text": texts, "text_empty": texts_empty})
-df.to_csv("data/player_texts.csv", index=False)
-
-factors = []
-for name in player_names:
-    tmp_player = select_player(players, name)
-    data = [tmp_player.name]
-    for metric in tmp_player.relevant_metrics:
-        try:
-            text = sentences.describe_level(
-                tmp_player.ser_metrics[metric + "_Z"],
-                thresholds=thresholds_dict[metric],
-                words=description_dict[metric],
-            )
-            data.append(text)
-        except:
-            data.append(None)
-            print(f"Error with {name}")
-
-    factors.append(data)
-
-# create a dataframe with columns 'player' and and each factor from tmp_player.relevant_metrics
-df = pd.DataFrame(factors, columns=["player"] + tmp_player.relevant_metrics)
-df.to_csv("data/player_ground_truth.csv", index=False)
-# %%
+    return df
 
-# Generate player specific data for evaluation
 
-from classes.data_source import PersonStat
-from classes.description import PersonDescription
-import copy
-import json
-import pandas as pd
-import utils.sentences as sentences
-
-
-people = PersonStat()
-
-metrics = [m for m in people.df.columns if m not in ["name"]]
+def generate_countries():
+    countries = CountryStats()
+    metrics = [m for m in countries.df.columns if m not in ["country"]]
+    countries.calculate_statistics(metrics=metrics)
 
-people.calculate_statistics(metrics=metrics)
+    with open("data/wvs/description_dict.json", "r") as f:
+        description_dict = json.load(f)
+    thresholds_dict = dict((metric, COUNTRY_THRESHOLDS) for metric in metrics)
 
-people_names = people.df["name"].values.tolist()
+    names = countries.df["country"]
+    texts = CountryDescription.synthesize_texts(
+        countries, description_dict, thresholds_dict
+    )
+    df = pd.DataFrame(
+        {
+            "country": names,
+            "text": "Now do the same thing with the following: ```" + texts + "```",
+            "text_empty": "Now do the same thing with the following: ```Here is a statistical description of the societal values of "
+            + names.str.capitalize()
+            + ".\n\n```",
+        }
+    )
+    for metric in metrics:
+        df[metric] = sentences.describe_levels(
+            countries.df[metric + "_Z"].to_numpy(),
+            thresholds=COUNTRY_THRESHOLDS,
+            words=COUNTRY_WORDS,
+        )
 
+    return df
 
-def select_person(people, player_name):
 
+def generate_persons():
     people = PersonStat()
-    people.calculate_statistics(metrics=metrics)
-
-    person = copy.deepcopy(people)
-
-    person.df = person.df[person.df["name"] == player_name]
-
-    person = person.to_data_point()
-
-    return person
-
-
-texts = []
-texts_empty = []
-for player_name in people_names:
-    # try:
-    tmp_person = select_person(people, player_name)
-    c_description = PersonDescription(
-        tmp_person,
+    traits = list(PersonDescription.trait_phrases)
+    people.calculate_statistics(metrics=traits)
+
+    df = pd.DataFrame(
+        {
+            "person": people.df["name"],
+            "text": PersonDescription.synthesize_texts(people),
+            "text_empty": "The candidate is...",
+        }
     )
+    for trait, (cat_0, cat_1, _, _) in PersonDescription.trait_phrases.items():
+        df[trait] = np.where(
+            people.df[trait + "_Z"].to_numpy() > 0,
+            cat_1.rstrip(". "),
+            cat_0.rstrip(". "),
+        )
 
-    text = c_description.synthesize_text()
-    text_empty = f"The candidate is..."
-
-    texts.append(text)
-    texts_empty.append(text_empty)
-    # except:
-    #     texts.append("")
-    #     texts_empty.append("")
-    #     print(f"Error with {player_name}")
-
-
-# zip country names and texts into a dataframe and save
-df = pd.DataFrame({"person": people_names, "text": texts, "text_empty": texts_empty})
-df.to_csv("data/personality_texts.csv", index=False)
-
-
-factors = []
-for name in people_names:
-    tmp_person = select_person(people, name)
-    data = [tmp_person.name]
+    return df
 
-    # extraversion
-    extraversion = tmp_person.ser_metrics["extraversion_Z"]
-    cat_0 = "solitary and reserved"
-    cat_1 = "outgoing and energetic"
-    if extraversion > 0:
-        data.append(cat_1)
-    else:
-        data.append(cat_0)
 
-    # neuroticism
-    neuroticism = tmp_person.ser_metrics["neuroticism_Z"]
-    cat_0 = "resilient and confident"
-    cat_1 = "sensitive and nervous"
-    if neuroticism > 0:
-        data.append(cat_1)
-    else:
-        data.append(cat_0)
+GENERATORS = {
+    "player": generate_players,
+    "country": generate_countries,
+    "person": generate_persons,
+}
 
-    # agreeableness
-    agreeableness = tmp_person.ser_metrics["agreeableness_Z"]
-    cat_0 = "critical and rational"
-    cat_1 = "friendly and compassionate"
-    if agreeableness > 0:
-        data.append(cat_1)
-    else:
-        data.append(cat_0)
 
-    # conscientiousness
-    conscientiousness = tmp_person.ser_metrics["conscientiousness_Z"]
-    cat_0 = "extravagant and careless"
-    cat_1 = "efficient and organized"
+def generate(ttype):
+    """
+    Make the texts and ground truth of every entity of ttype and write them to OUTPUT_PATH.
 
-    if conscientiousness > 0:
-        data.append(cat_1)
-    else:
-        data.append(cat_0)
+    Returns:
+    Number of entities.
+    """
+    df = GENERATORS[ttype]().reset_index(drop=True)
+    df.to_parquet(f"{OUTPUT_PATH}/{ttype}.parquet", index=False)
 
-    # openness
-    openness = tmp_person.ser_metrics["openness_Z"]
-    cat_0 = "consistent and cautious"
-    cat_1 = "inventive and curious"
+    factors = [column for column in df.columns if column not in ["text", "text_empty"]]
+    df[[ttype, "text", "text_empty"]].to_csv(
+        f"{OUTPUT_PATH}/{ttype}_texts.csv", index=False
+    )
+    df[factors].to_csv(f"{OUTPUT_PATH}/{ttype}_ground_truth.csv", index=False)
 
-    if openness > 0:
-        data.append(cat_1)
-    else:
-        data.append(cat_0)
+    return len(df)
 
-    factors.append(data)
 
-# create a dataframe with columns 'player' and and each factor from tmp_person.relevant_metrics
-df = pd.DataFrame(
-    factors,
-    columns=["person"]
-    + ["extraversion", "neuroticism", "agreeableness", "conscientiousness", "openness"],
-)
-df.to_csv("data/personality_ground_truth.csv", index=False)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("ttypes", nargs="*", help=f"any of {TTYPES}, default all")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    ttypes = args.ttypes or TTYPES
+    if not set(ttypes) <= set(TTYPES):
+        parser.error(f"ttypes must be in {TTYPES}")
 
-# %%
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for ttype, n in zip(ttypes, executor.map(generate, ttypes)):
+            print(f"{n} {ttype} texts and ground truth written to {OUTPUT_PATH}")
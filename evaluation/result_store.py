@@ -0,0 +1,126 @@
+"""
+Append-only store of the data points of analysis_pipeline.py, in a SQLite file per entity type.
+
+A data point is stored once under (entity, type, count) and never rewritten, and every insert
+commits, so a run that stops can be resumed from the file. Per (entity, type, factor) the number
+of labels that are not "None" is kept in a counter table, updated in the same transaction as the
+insert, so the counts of an entity are looked up instead of scanning all data points. The file is
+in WAL mode, so several processes can write to it, a data point written twice is only counted once.
+
+The data points can be exported to and imported from the data_points.json format of earlier runs.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+
+class ResultStore:
+    def __init__(self, path, ttype, factors):
+        self.path = path
+        self.ttype = ttype
+        self.factors = list(factors)
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS data_points "
+            "(entity TEXT, type TEXT, count INTEGER, data TEXT, "
+            "PRIMARY KEY (entity, type, count))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS factor_counts "
+            "(entity TEXT, type TEXT, factor TEXT, labels INTEGER, "
+            "PRIMARY KEY (entity, type, factor))"
+        )
+        self._db.commit()
+
+    def add(self, data_point):
+        """
+        Store a data point of analysis_pipeline.py and count its labels.
+
+        Returns:
+        False if a data point with the same entity, type and count was already stored.
+        """
+        entity, type_, count = data_point[self.ttype], data_point["type"], data_point["count"]
+        labelled = [
+            (entity, type_, factor)
+            for factor in self.factors
+            if data_point[factor + "_pred"] != "None"
+        ]
+        with self._lock, self._db:
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO data_points VALUES (?, ?, ?, ?)",
+                (entity, type_, count, json.dumps(data_point)),
+            ).rowcount
+            if inserted:
+                self._db.executemany(
+                    "INSERT INTO factor_counts VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT (entity, type, factor) DO UPDATE SET labels = labels + 1",
+                    labelled,
+                )
+        return bool(inserted)
+
+    def factor_counts(self, entity, type_):
+        """
+        Number of labels that are not "None" per factor for an entity and type.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT factor, labels FROM factor_counts WHERE entity = ? AND type = ?",
+                (entity, type_),
+            ).fetchall()
+        counts = dict((factor, 0) for factor in self.factors)
+        counts.update(rows)
+        return counts
+
+    def counts(self, entity, type_):
+        """
+        The counts of the data points stored for an entity and type.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT count FROM data_points WHERE entity = ? AND type = ?",
+                (entity, type_),
+            ).fetchall()
+        return set(count for (count,) in rows)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM data_points").fetchone()[0]
+
+    def to_dict(self):
+        """
+        All data points, keyed by entity_type_count like data_points.json.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT entity, type, count, data FROM data_points "
+                "ORDER BY entity, type, count"
+            ).fetchall()
+        return dict(
+            ("_".join([entity, type_, str(count)]), json.loads(data))
+            for entity, type_, count, data in rows
+        )
+
+    def export_json(self, path):
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(path + ".tmp", path)
+
+    def import_json(self, path):
+        """
+        Add the data points of a data_points.json file.
+
+        Returns:
+        Number of data points that were not stored yet.
+        """
+        with open(path) as f:
+            data_points = json.load(f)
+        return sum(self.add(data_point) for data_point in data_points.values())
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,139 @@
+"""
+Local stand-in for the Gemini generateContent endpoint, to run analysis_pipeline.py offline.
+
+Every request waits for a random latency and answers with the first non-empty model message of
+its history. For the reconstruct prompts this is an example data dictionary, so the pipeline
+can parse it. Each API key may send rate requests per minute, like the free tier of the API.
+Requests above that get a 429 with a Retry-After header.
+
+Usage (from the root of the repository):
+    python -m evaluation.stub_llm_server [--port 8765] [--latency 0.5] [--rate 60]
+    python -m evaluation.analysis_pipeline --base-url http://127.0.0.1:8765 --keys a b c d
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PATH_PATTERN = re.compile(r"^/v1beta/models/(?P<model>[^/:]+):generateContent$")
+
+
+class RateLimiter:
+    """
+    At most rate requests per key in any 60 second window.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._requests = {}
+
+    def retry_after(self, key):
+        """
+        Record a request of key and return 0 if it is allowed, otherwise the seconds to wait.
+        """
+        now = time.monotonic()
+        with self._lock:
+            times = [t for t in self._requests.get(key, []) if now - t < 60]
+            if len(times) >= self.rate:
+                self._requests[key] = times
+                return 60 - (now - times[0])
+            times.append(now)
+            self._requests[key] = times
+            return 0
+
+
+def get_answer(body):
+    for content in body.get("contents", []):
+        if content.get("role") == "model":
+            text = "".join(part.get("text", "") for part in content.get("parts", []))
+            if text.strip():
+                return text
+    return ""
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Set by serve
+    latency = 0.0
+    rate_limiter = None
+
+    def send_json(self, status, data, headers={}):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if not PATH_PATTERN.match(url.path):
+            self.send_json(404, {"error": {"code": 404, "message": "Not found"}})
+            return
+
+        key = self.headers.get("x-goog-api-key") or parse_qs(url.query).get("key", [""])[0]
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+
+        retry_after = self.rate_limiter.retry_after(key)
+        if retry_after > 0:
+            self.send_json(
+                429,
+                {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}},
+                headers={"Retry-After": f"{retry_after:.3f}"},
+            )
+            return
+
+        time.sleep(random.uniform(0.5, 1.5) * self.latency)
+        self.send_json(
+            200,
+            {
+                "candidates": [
+                    {
+                        "content": {"role": "model", "parts": [{"text": get_answer(body)}]},
+                        "finishReason": "STOP",
+                    }
+                ]
+            },
+        )
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=8765, latency=0.5, rate=60):
+    """
+    Return a running server, stop it with server.shutdown().
+    """
+    handler = type(
+        "Handler",
+        (StubHandler,),
+        {"latency": latency, "rate_limiter": RateLimiter(rate)},
+    )
+    # Room for many concurrent connections
+    server_class = type("Server", (ThreadingHTTPServer,), {"request_queue_size": 256})
+    server = server_class(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per request")
+    parser.add_argument("--rate", type=int, default=60, help="requests per minute per key")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.rate)
+    print(f"Stub LLM server on http://127.0.0.1:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
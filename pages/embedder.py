@@ -8,7 +8,15 @@ from utils.utils import normalize_text
 
 from utils.page_components import add_common_page_elements
 
-from classes.embeddings import Embeddings
+from classes.embeddings import read_embeddings
+from utils.embedding_job import run_embedding_job
+from utils.llm_clients import configure_gemini
+
+from settings import (
+    USE_GEMINI,
+    GEMINI_EMBEDDING_MODEL,
+    GPT_EMBEDDINGS_MODEL,
+)
 
 
 def get_format(path):
@@ -23,7 +31,7 @@ def get_format(path):
     return file_format, read_func
 
 
-def embed(file_path, embeddings):
+def embed(file_path):
     file_format, read_func = get_format(file_path)
 
     df = read_func(file_path)
@@ -32,34 +40,46 @@ def embed(file_path, embeddings):
     )
 
     st.write(f"Embedding file: {file_path}")
+    # Check for common errors in the text
+    df["user"] = df["user"].apply(lambda x: normalize_text(x))
+
     # Check if the content of user exceeds max token length
     tokenizer = tiktoken.get_encoding("cl100k_base")
     df["user_tokens"] = df["user"].apply(lambda x: len(tokenizer.encode(x)))
     df = df[df.user_tokens < 8192]
+    token_counts = df["user_tokens"].to_list()
     df = df.drop("user_tokens", axis=1)
 
-    # Check for common errors in the text
-    df["user"] = df["user"].apply(lambda x: normalize_text(x))
-
-    df["user_embedded"] = df["user"].apply(
-        lambda x: str(embeddings.return_embedding(x))
-    )
-
     directory = os.path.dirname(embedding_path)
     if not os.path.exists(directory):
         os.makedirs(directory)
 
+    if USE_GEMINI:
+        configure_gemini()
+
+    # Rows are embedded in batches, only rows whose text is new since the last run are sent
+    progress = st.progress(0.0, text="Embedding rows...")
+    n_embedded = run_embedding_job(
+        df,
+        token_counts,
+        embedding_path,
+        engine=GEMINI_EMBEDDING_MODEL if USE_GEMINI else GPT_EMBEDDINGS_MODEL,
+        use_gemini=USE_GEMINI,
+        on_progress=lambda done, total: progress.progress(
+            done / total, text=f"Embedded {done} of {total} rows"
+        ),
+    )
+    progress.empty()
+
+    st.write(f"Embedded {n_embedded} new rows, reused {len(df) - n_embedded}.")
     st.write("Embedded file:")
-    st.write(df)
-    df.to_parquet(embedding_path, index=False)
+    st.write(read_embeddings(embedding_path)[0])
 
 
 sidebar_container = add_common_page_elements()
 
 st.divider()
 
-embeddings = Embeddings()
-
 # Get list of files in data/describe folder
 describe_folder = "data/describe"
 available_files = []
@@ -107,7 +127,7 @@ else:
     if st.button(button_label, type="primary"):
         st.write(f"Starting to embed {selected_file}...")
         try:
-            embed(full_path, embeddings)
+            embed(full_path)
             st.success(f"Successfully embedded {selected_file}!")
         except Exception as e:
             st.error(f"Error embedding file: {str(e)}")
@@ -38,7 +38,6 @@ st.divider()
 
 # minimal_minutes is the minimum number of minutes a player must have played to be included in the analysis
 minimal_minutes = 300
-players = PlayerStats(minimal_minutes=minimal_minutes)
 
 # Define the metrics we are interested in and calculates them
 metrics = [
@@ -52,10 +51,21 @@ metrics = [
     "ground_duels_won_adjusted_per90",
     "air_duels_won_adjusted_per90",
 ]
-players.calculate_statistics(metrics=metrics)
+
+# Players are compared against the other players of their league, season and position
+league, season, position = "England", "2017-18", "Forward"
+
+# The statistics are computed once and shared by all sessions, so players must not be modified
+players = PlayerStats.load(
+    metrics=metrics,
+    minimal_minutes=minimal_minutes,
+    league=league,
+    season=season,
+    position=position,
+)
 
 # Now select the focal player
-player = select_player(sidebar_container, players, gender="male", position="Forward")
+player = select_player(sidebar_container, players, gender="male", position=position)
 
 st.write(
     "This app can only handle three or four users at a time. Please [download](https://github.com/soccermatics/twelve-gpt-educational) and run on your own computer with your own Gemini key."
@@ -30,10 +30,11 @@ sidebar_container = st.sidebar.container()
 
 st.divider()
 
-persons = PersonStat()
 # Define the metrics we are interested in and calculates them
 metrics = ['extraversion', 'neuroticism', 'agreeableness', 'conscientiousness', 'openness']
-persons.calculate_statistics(metrics=metrics)
+
+# The statistics are computed once and shared by all sessions, so persons must not be modified
+persons = PersonStat.load(metrics=metrics)
 
 with st.expander("Dataframe"):
     st.write(persons.df)
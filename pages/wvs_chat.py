@@ -1,16 +1,20 @@
 from classes.data_source import CountryStats
 
-countries = CountryStats()
+import pandas as pd
+import streamlit as st
 
-metrics = [m for m in countries.df.columns if m not in ["country"]]
+# Every column of the survey data except the country is a metric
+metrics = [
+    m for m in pd.read_csv("data/wvs/wave_7.csv", nrows=0).columns if m not in ["country"]
+]
 
-countries.calculate_statistics(metrics=metrics)
+# The statistics are computed once and shared by all sessions, so countries must not be modified
+countries = CountryStats.load(metrics=metrics)
 
 # # save countries.df to csv
 # countries.df.to_csv("data/wvs/countries.csv", index=False)
 
 
-import streamlit as st
 from utils.utils import select_country, create_chat
 
 
@@ -37,3 +37,19 @@ LM_STUDIO_API_BASE = st.secrets.get("LM_STUDIO_API_BASE", "")
 LM_STUDIO_CHAT_MODEL = st.secrets.get("LM_STUDIO_CHAT_MODEL", "")
 LM_STUDIO_EMBEDDING_MODEL = st.secrets.get("LM_STUDIO_EMBEDDING_MODEL", "")
 
+
+# Embedding cache, query embeddings are looked up here before calling the provider
+EMBEDDING_CACHE_PATH = st.secrets.get("EMBEDDING_CACHE_PATH", "data/cache/embeddings.sqlite")
+EMBEDDING_CACHE_TTL = st.secrets.get("EMBEDDING_CACHE_TTL", 60 * 60 * 24 * 30)
+EMBEDDING_CACHE_MAX_ENTRIES = st.secrets.get("EMBEDDING_CACHE_MAX_ENTRIES", 100000)
+EMBEDDING_CACHE_MEMORY_ENTRIES = st.secrets.get("EMBEDDING_CACHE_MEMORY_ENTRIES", 1024)
+
+# Offline mode, embeddings are generated locally from a hash of the text instead of calling a provider
+USE_STUB_EMBEDDINGS = st.secrets.get("USE_STUB_EMBEDDINGS", False)
+STUB_EMBEDDING_DIMENSIONS = st.secrets.get("STUB_EMBEDDING_DIMENSIONS", 3072)
+
+# Cache of generated descriptions, the summary of an entity is only generated once per prompt and model
+RESPONSE_CACHE_PATH = st.secrets.get("RESPONSE_CACHE_PATH", "data/cache/responses.sqlite")
+RESPONSE_CACHE_TTL = st.secrets.get("RESPONSE_CACHE_TTL", 60 * 60 * 24 * 7)
+RESPONSE_CACHE_MAX_ENTRIES = st.secrets.get("RESPONSE_CACHE_MAX_ENTRIES", 10000)
+RESPONSE_CACHE_MEMORY_ENTRIES = st.secrets.get("RESPONSE_CACHE_MEMORY_ENTRIES", 256)
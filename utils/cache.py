@@ -0,0 +1,177 @@
+"""
+Two tier key-value cache: an in-memory LRU in front of a SQLite file.
+
+Values are pickled, so anything picklable can be stored. Entries expire after `ttl`
+seconds and each tier is bounded, the least recently used entries are evicted first.
+The cache is safe to share between the threads of a Streamlit server.
+
+The disk tier is only trimmed once it holds more than `max_entries`, and then down to
+EVICT_FRACTION of it, so most inserts do not touch the other rows. The access times of
+hits of both tiers are kept in memory and written in one batch with the next insert or after
+FLUSH_ACCESSED hits.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Fraction of max_entries that is kept when the disk tier is trimmed
+EVICT_FRACTION = 0.9
+# Number of pending access times of disk hits that are written at once
+FLUSH_ACCESSED = 256
+
+
+def make_key(*parts):
+    """
+    Content addressed key for any JSON serialisable parts.
+    """
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class TieredCache:
+    def __init__(self, path, ttl=None, max_entries=100_000, memory_entries=1024):
+        """
+        Arguments:
+        path: str
+            Path of the SQLite file, created if it does not exist.
+        ttl: optional float
+            Seconds after which an entry is no longer returned. None means entries never expire.
+        max_entries: int
+            Maximum number of entries kept on disk.
+        memory_entries: int
+            Maximum number of entries kept in memory.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        # Access times of disk hits that are not written yet
+        self._accessed = {}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(key TEXT PRIMARY KEY, value BLOB, created REAL, accessed REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+        self._db.commit()
+        # Upper bound of the number of rows, a replaced key is counted again until the next trim
+        self._entries = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            if key in self._memory:
+                created, value = self._memory[key]
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    # The disk tier evicts by access time too, so memory hits are recorded
+                    self._touch(key, now)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+            row = self._db.execute(
+                "SELECT value, created FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._expired(row[1], now):
+                self.misses += 1
+                return None
+
+            self._touch(key, now)
+            value = pickle.loads(row[0])
+            self._remember(key, row[1], value)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (key, pickle.dumps(value), now, now),
+            )
+            self._flush_accessed()
+            self._entries += 1
+            if self._entries > self.max_entries:
+                self._evict(now)
+            self._db.commit()
+
+    def _touch(self, key, now):
+        self._accessed[key] = now
+        if len(self._accessed) >= FLUSH_ACCESSED:
+            self._flush_accessed()
+            self._db.commit()
+
+    def _flush_accessed(self):
+        if self._accessed:
+            self._db.executemany(
+                "UPDATE cache SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()],
+            )
+            self._accessed.clear()
+
+    def _evict(self, now):
+        """
+        Remove the expired entries and, if there are still more than max_entries, the least
+        recently used ones down to EVICT_FRACTION of max_entries.
+        """
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM cache WHERE created < ?", (now - self.ttl,))
+        self._entries = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if self._entries > self.max_entries:
+            keep = int(self.max_entries * EVICT_FRACTION)
+            self._db.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (self._entries - keep,),
+            )
+            self._entries = keep
+
+    def _remember(self, key, created, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._accessed.clear()
+            self._db.execute("DELETE FROM cache")
+            self._db.commit()
+            self._entries = 0
+
+    def stats(self):
+        with self._lock:
+            self._flush_accessed()
+            self._db.commit()
+            entries = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "disk_entries": entries,
+        }
@@ -0,0 +1,15 @@
+from utils.datalib.common import INSTRUCTIONS, MissingDependencyError
+
+try:
+    import polars
+except ImportError:
+    polars = None
+
+HAS_POLARS = bool(polars)
+
+POLARS_INSTRUCTIONS = INSTRUCTIONS.format(library="polars")
+
+
+def assert_has_polars():
+    if not HAS_POLARS:
+        raise MissingDependencyError(POLARS_INSTRUCTIONS)
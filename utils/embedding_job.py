@@ -0,0 +1,172 @@
+"""
+Batch embedding of the user column of a describe file, used by pages/embedder.py.
+
+Rows are packed into batches that stay under a token budget and the batches are sent
+concurrently to the embedding API, with at most `concurrency` requests in flight.
+Every finished batch is appended to a checkpoint file next to the output, so an
+interrupted run picks up where it stopped. Rows whose user text is already in the
+previous version of the output are not embedded again.
+
+The engine and provider are stored in the output metadata and in every checkpoint row.
+Vectors are only reused when both match, a previous output or checkpoint made with another
+model is discarded.
+"""
+
+import asyncio
+import json
+import os
+
+from utils.embeddings_utils import aget_embeddings, embedding_provider
+from classes.embeddings import read_embeddings, read_embeddings_model, write_embeddings
+
+
+def get_batches(texts, token_counts, max_batch_tokens=50000, max_batch_size=2048):
+    """
+    Split texts into consecutive batches with at most max_batch_tokens tokens
+    and max_batch_size texts each.
+    """
+    batches = []
+    batch, batch_tokens = [], 0
+    for text, tokens in zip(texts, token_counts):
+        if batch and (
+            batch_tokens + tokens > max_batch_tokens or len(batch) >= max_batch_size
+        ):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def read_checkpoint(checkpoint_path, model):
+    """
+    Embeddings in the checkpoint file. The file is removed if it was written with another model.
+    """
+    embedded = {}
+    if not os.path.exists(checkpoint_path):
+        return embedded
+
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line can be incomplete if the run was killed while writing it
+                break
+            if row.get("engine") != model["engine"] or row.get("provider") != model["provider"]:
+                embedded = None
+                break
+            embedded[row["user"]] = row["embedding"]
+
+    if embedded is None:
+        os.remove(checkpoint_path)
+        return {}
+    return embedded
+
+
+async def embed_batches(
+    batches, checkpoint_path, engine, use_gemini, concurrency=4, on_progress=None
+):
+    provider = embedding_provider(use_gemini)
+    semaphore = asyncio.Semaphore(concurrency)
+    lock = asyncio.Lock()
+    done = 0
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+
+        async def embed_batch(batch):
+            nonlocal done
+            async with semaphore:
+                embeddings = await aget_embeddings(
+                    batch, engine=engine, use_gemini=use_gemini
+                )
+            async with lock:
+                for text, embedding in zip(batch, embeddings):
+                    row = {"user": text, "embedding": embedding, "engine": engine, "provider": provider}
+                    checkpoint.write(json.dumps(row) + "\n")
+                checkpoint.flush()
+                done += len(batch)
+                if on_progress is not None:
+                    on_progress(done)
+            return dict(zip(batch, embeddings))
+
+        results = await asyncio.gather(*[embed_batch(batch) for batch in batches])
+
+    embedded = {}
+    for result in results:
+        embedded.update(result)
+    return embedded
+
+
+def run_embedding_job(
+    df,
+    token_counts,
+    embedding_path,
+    engine,
+    use_gemini=False,
+    max_batch_tokens=50000,
+    concurrency=4,
+    on_progress=None,
+):
+    """
+    Embed df["user"] and write df with a user_embedded column to embedding_path.
+
+    Arguments:
+    df: dataframe with a user column
+    token_counts: list of int
+        Number of tokens of each row of df["user"].
+    on_progress: optional function
+        Called with (number of rows embedded, number of rows to embed) after every batch.
+
+    Returns:
+    Number of rows that were sent to the embedding API.
+    """
+    checkpoint_path = embedding_path.replace(".parquet", ".checkpoint.jsonl")
+    model = {"engine": engine, "provider": embedding_provider(use_gemini)}
+
+    # Embeddings from the last time the file was written and from an interrupted run,
+    # if they were made with the same model
+    embedded = {}
+    if os.path.exists(embedding_path):
+        if read_embeddings_model(embedding_path) == model:
+            previous, matrix = read_embeddings(embedding_path)
+            embedded.update(zip(previous["user"], matrix.tolist()))
+        else:
+            os.remove(embedding_path)
+    embedded.update(read_checkpoint(checkpoint_path, model))
+
+    # Only embed each new text once, even if it appears in several rows
+    to_embed = {}
+    for text, tokens in zip(df["user"], token_counts):
+        if text not in embedded:
+            to_embed[text] = tokens
+
+    batches = get_batches(
+        list(to_embed.keys()), list(to_embed.values()), max_batch_tokens=max_batch_tokens
+    )
+    embedded.update(
+        asyncio.run(
+            embed_batches(
+                batches,
+                checkpoint_path,
+                engine,
+                use_gemini,
+                concurrency=concurrency,
+                on_progress=(
+                    None
+                    if on_progress is None
+                    else lambda done: on_progress(done, len(to_embed))
+                ),
+            )
+        )
+    )
+
+    df = df.copy()
+    df["user_embedded"] = [embedded[text] for text in df["user"]]
+    write_embeddings(df, embedding_path, model=model)
+    os.remove(checkpoint_path)
+
+    return len(to_embed)
@@ -1,3 +1,4 @@
+import functools
 import textwrap as tr
 from typing import List, Optional
 
@@ -9,19 +10,71 @@ from sklearn.manifold import TSNE
 from sklearn.metrics import average_precision_score, precision_recall_curve
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
-from openai import OpenAI, AsyncOpenAI
-from settings import GPT_BASE, GPT_KEY
+from settings import (
+    GPT_BASE,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_TTL,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_MEMORY_ENTRIES,
+    USE_STUB_EMBEDDINGS,
+    STUB_EMBEDDING_DIMENSIONS,
+)
+from utils.cache import TieredCache, make_key
+from utils.llm_clients import get_client, get_async_client
 from utils.datalib.numpy_helper import numpy as np
 from utils.datalib.pandas_helper import pandas as pd
 
 
+@functools.cache
+def get_embedding_cache() -> TieredCache:
+    """
+    Cache of single text embeddings, keyed by engine, provider, normalized text and request
+    arguments. The SQLite file is opened on first use, not on import.
+    """
+    return TieredCache(
+        EMBEDDING_CACHE_PATH,
+        ttl=EMBEDDING_CACHE_TTL,
+        max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+        memory_entries=EMBEDDING_CACHE_MEMORY_ENTRIES,
+    )
+
+
+def embedding_provider(use_gemini: bool) -> str:
+    """Name of the service the embeddings come from, vectors of different providers are not comparable."""
+    if USE_STUB_EMBEDDINGS:
+        return "stub"
+    elif use_gemini:
+        return "gemini"
+    else:
+        return f"openai:{GPT_BASE}"
+
+
+def embedding_cache_key(text: str, engine: str, use_gemini: bool, **kwargs) -> str:
+    # kwargs such as dimensions change the vector, so they are part of the key
+    return make_key(engine, embedding_provider(use_gemini), text, kwargs)
+
+
+def stub_embedding(text: str, dimensions=STUB_EMBEDDING_DIMENSIONS) -> List[float]:
+    """Deterministic unit length vector derived from the text, used when USE_STUB_EMBEDDINGS is set."""
+    seed = int.from_bytes(make_key(text).encode()[:8], "little")
+    vector = np.random.default_rng(seed).normal(size=dimensions)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
 @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
 def get_embedding(text: str, engine="text-similarity-davinci-001", use_gemini=False, **kwargs) -> List[float]:
 
-    # replace newlines, which can negatively affect performance.
-    text = text.replace("\n", " ")
+    # replace newlines and repeated whitespace, which can negatively affect performance.
+    text = " ".join(text.split())
 
-    if use_gemini:
+    key = embedding_cache_key(text, engine, use_gemini, **kwargs)
+    embedding = get_embedding_cache().get(key)
+    if embedding is not None:
+        return embedding
+
+    if USE_STUB_EMBEDDINGS:
+        embedding = stub_embedding(text)
+    elif use_gemini:
         import google.generativeai as genai
         # FIXME: ignores kwargs
         embedding = genai.embed_content(
@@ -30,8 +83,10 @@ def get_embedding(text: str, engine="text-similarity-davinci-001", use_gemini=Fa
             task_type="retrieval_document"
         )["embedding"]
     else:
-        client = OpenAI(api_key=GPT_KEY, base_url=GPT_BASE)
+        client = get_client("openai")
         embedding = client.embeddings.create(input=[text], model=engine, **kwargs).data[0].embedding
+
+    get_embedding_cache().set(key, embedding)
     return embedding
 
 
@@ -40,16 +95,26 @@ async def aget_embedding(
     text: str, engine="text-similarity-davinci-001", use_gemini=False, **kwargs
 ) -> List[float]:
 
-    # replace newlines, which can negatively affect performance.
-    text = text.replace("\n", " ")
+    # replace newlines and repeated whitespace, which can negatively affect performance.
+    text = " ".join(text.split())
 
-    if use_gemini:
+    key = embedding_cache_key(text, engine, use_gemini, **kwargs)
+    embedding = get_embedding_cache().get(key)
+    if embedding is not None:
+        return embedding
+
+    if USE_STUB_EMBEDDINGS:
+        embedding = stub_embedding(text)
+    elif use_gemini:
         import google.generativeai as genai
-        return (await genai.embed_content_async(model=engine, content=text, task_type="retrieval_document"))["embedding"]
+        embedding = (await genai.embed_content_async(model=engine, content=text, task_type="retrieval_document"))["embedding"]
     else:
-        client = AsyncOpenAI(api_key=GPT_KEY, base_url=GPT_BASE)
+        client = get_async_client("openai")
         response = await client.embeddings.create(input=[text], model=engine, **kwargs)
-        return response.data[0].embedding
+        embedding = response.data[0].embedding
+
+    get_embedding_cache().set(key, embedding)
+    return embedding
 
 
 @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
@@ -61,16 +126,19 @@ def get_embeddings(
     # replace newlines, which can negatively affect performance.
     list_of_text = [text.replace("\n", " ") for text in list_of_text]
 
+    if USE_STUB_EMBEDDINGS:
+        return [stub_embedding(text) for text in list_of_text]
+
     if use_gemini:
         import google.generativeai as genai
-        # FIXME: to be checked
-        data = genai.embed_content(
+        # With a list of texts Gemini returns {"embedding": [...]} with one vector per text
+        return genai.embed_content(
             model=engine,
             content=list_of_text,
             task_type="retrieval_document"
-        )
+        )["embedding"]
     else:
-        data = OpenAI(api_key=GPT_KEY, base_url=GPT_BASE).embeddings.create(
+        data = get_client("openai").embeddings.create(
             input=list_of_text, model=engine, **kwargs
         ).data
     return [d["embedding"] if isinstance(d, dict) else d.embedding for d in data]
@@ -84,12 +152,16 @@ async def aget_embeddings(
 
     # replace newlines, which can negatively affect performance.
     list_of_text = [text.replace("\n", " ") for text in list_of_text]
+
+    if USE_STUB_EMBEDDINGS:
+        return [stub_embedding(text) for text in list_of_text]
+
     if use_gemini:
         import google.generativeai as genai
-        data = (await genai.embed_content_async(model=engine, content=list_of_text, task_type="retrieval_document"))
+        return (await genai.embed_content_async(model=engine, content=list_of_text, task_type="retrieval_document"))["embedding"]
     else:
         data = (
-            await AsyncOpenAI(api_key=GPT_KEY, base_url=GPT_BASE).embeddings.create(
+            await get_async_client("openai").embeddings.create(
                 input=list_of_text, model=engine, **kwargs
             )
         ).data
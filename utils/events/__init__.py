@@ -0,0 +1,3 @@
+"""
+Preprocessing of Wyscout event data into the player datasets read by PlayerStats.
+"""
@@ -0,0 +1,272 @@
+"""
+Convert the Wyscout json files in data/events to parquet.
+
+The event files are json arrays of several GB for a season, too large for pd.read_json. They
+are read in chunks, every event is decoded on its own with json.JSONDecoder.raw_decode and only
+the fields used by the metrics are kept, so memory is bounded by the batch size. The parquet
+files are typed: ids are integers, names are dictionary encoded (categoricals in pandas), the
+tags are lists of tag ids and the positions are flattened to x_start, y_start, x_end and y_end
+(in Wyscout coordinates, 0 to 100, missing when an event has no end position).
+
+players.json is streamed in the same way. The minutes played per game are small and in the
+columns format of pandas, so they are read at once.
+
+Usage (from the root of the repository):
+    python -m utils.events.ingest events data/events/events_England.json [--output path]
+    python -m utils.events.ingest players data/events/players.json
+    python -m utils.events.ingest minutes data/events/minutes_played_per_game_England.json
+
+Without --output the parquet file is written next to the json file. read_events reads it back
+as a DataFrame for utils/events/possession.py.
+"""
+
+import argparse
+import json
+import os
+import re
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CHUNK_SIZE = 1 << 20
+BATCH_SIZE = 100_000
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+DELIMITER = re.compile(r"[ \t\n\r,\]]")
+
+NAME = pa.dictionary(pa.int16(), pa.string())
+EVENT_SCHEMA = pa.schema(
+    [
+        ("matchId", pa.int32()),
+        ("matchPeriod", NAME),
+        ("eventSec", pa.float64()),
+        ("teamId", pa.int32()),
+        ("playerId", pa.int32()),
+        ("eventName", NAME),
+        ("subEventName", NAME),
+        ("tags", pa.list_(pa.int16())),
+        ("x_start", pa.int8()),
+        ("y_start", pa.int8()),
+        ("x_end", pa.int8()),
+        ("y_end", pa.int8()),
+    ]
+)
+# Fields of the events that are copied as they are
+EVENT_FIELDS = [
+    "matchId",
+    "matchPeriod",
+    "eventSec",
+    "teamId",
+    "playerId",
+    "eventName",
+    "subEventName",
+]
+PLAYER_SCHEMA = pa.schema(
+    [
+        ("playerId", pa.int32()),
+        ("shortName", pa.string()),
+        ("role", NAME),
+        ("currentTeamId", pa.int32()),
+    ]
+)
+MINUTES_SCHEMA = pa.schema(
+    [
+        ("playerId", pa.int32()),
+        ("shortName", pa.string()),
+        ("matchId", pa.int32()),
+        ("teamId", pa.int32()),
+        ("teamName", NAME),
+        ("player_in_min", pa.int16()),
+        ("player_out_min", pa.int16()),
+        ("minutesPlayed", pa.int16()),
+        ("red_card", pa.int8()),
+    ]
+)
+
+
+def iter_json_array(path, chunk_size=CHUNK_SIZE):
+    """
+    Yield the elements of the json array in path one by one, reading chunk_size characters at
+    a time.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        position = 0
+        end_of_file = False
+        # What is expected next: the opening bracket, a value or the closing bracket, a value,
+        # or a comma or the closing bracket
+        expected = "["
+
+        while True:
+            position = WHITESPACE.match(buffer, position).end()
+            if position == len(buffer):
+                if end_of_file:
+                    raise ValueError(f"{path} ends before the end of the json array")
+                # Everything in the buffer is decoded
+                buffer = f.read(chunk_size)
+                position = 0
+                end_of_file = not buffer
+                continue
+
+            char = buffer[position]
+            if expected == "[":
+                if char != "[":
+                    raise ValueError(f"{path} is not a json array")
+                position += 1
+                expected = "value or ]"
+            elif char == "]" and expected in ["value or ]", ", or ]"]:
+                return
+            elif expected == ", or ]":
+                if char != ",":
+                    raise ValueError(f"Expected , or ] in {path}, found {char!r}")
+                position += 1
+                expected = "value"
+            else:
+                # Numbers and literals end at the next delimiter, which must be in the buffer
+                complete = (
+                    end_of_file
+                    or char in '{["'
+                    or DELIMITER.search(buffer, position) is not None
+                )
+                if complete:
+                    try:
+                        element, end = decoder.raw_decode(buffer, position)
+                    except json.JSONDecodeError as e:
+                        if end_of_file:
+                            raise ValueError(f"Invalid json in {path}: {e}") from e
+                        complete = False
+                # An element that is not complete continues in the next chunk
+                if not complete:
+                    chunk = f.read(chunk_size)
+                    end_of_file = not chunk
+                    buffer = buffer[position:] + chunk
+                    position = 0
+                    continue
+
+                yield element
+                position = end
+                expected = ", or ]"
+
+
+def to_table(columns, schema):
+    return pa.Table.from_arrays(
+        [
+            pa.array(columns[field.name], type=field.type.value_type)
+            .dictionary_encode()
+            .cast(field.type)
+            if pa.types.is_dictionary(field.type)
+            else pa.array(columns[field.name], type=field.type)
+            for field in schema
+        ],
+        schema=schema,
+    )
+
+
+def write_batches(rows, output_path, schema, project, batch_size=BATCH_SIZE):
+    """
+    Write the rows projected to the columns of schema to a parquet file, a row group per batch.
+
+    Arguments:
+    rows: Iterable of json objects.
+    project: Function that appends the fields of a json object to a dict of column lists.
+
+    Returns:
+    Number of rows written.
+    """
+    n = 0
+    with pq.ParquetWriter(output_path, schema, compression="zstd") as writer:
+        columns = dict((name, []) for name in schema.names)
+        for row in rows:
+            project(row, columns)
+            n += 1
+            if n % batch_size == 0:
+                writer.write_table(to_table(columns, schema))
+                columns = dict((name, []) for name in schema.names)
+        if n == 0 or n % batch_size:
+            writer.write_table(to_table(columns, schema))
+    return n
+
+
+def project_event(event, columns):
+    for name in EVENT_FIELDS:
+        columns[name].append(event[name])
+    columns["tags"].append([tag["id"] for tag in event["tags"]])
+
+    positions = event["positions"]
+    start = positions[0] if positions else {}
+    end = positions[1] if len(positions) > 1 else {}
+    columns["x_start"].append(start.get("x"))
+    columns["y_start"].append(start.get("y"))
+    columns["x_end"].append(end.get("x"))
+    columns["y_end"].append(end.get("y"))
+
+
+def project_player(player, columns):
+    columns["playerId"].append(player["wyId"])
+    columns["shortName"].append(player["shortName"])
+    columns["role"].append(player["role"]["name"])
+    # Players without a team have None or "null"
+    team_id = player["currentTeamId"]
+    columns["currentTeamId"].append(team_id if isinstance(team_id, int) else None)
+
+
+def convert_events(
+    json_path, output_path=None, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE
+):
+    output_path = output_path or os.path.splitext(json_path)[0] + ".parquet"
+    return write_batches(
+        iter_json_array(json_path, chunk_size),
+        output_path,
+        EVENT_SCHEMA,
+        project_event,
+        batch_size,
+    )
+
+
+def convert_players(json_path, output_path=None, chunk_size=CHUNK_SIZE):
+    output_path = output_path or os.path.splitext(json_path)[0] + ".parquet"
+    return write_batches(
+        iter_json_array(json_path, chunk_size), output_path, PLAYER_SCHEMA, project_player
+    )
+
+
+def convert_minutes(json_path, output_path=None):
+    output_path = output_path or os.path.splitext(json_path)[0] + ".parquet"
+    with open(json_path, "r", encoding="utf-8") as f:
+        minutes = json.load(f)
+    # A dict of columns, each a dict from the row index to the value
+    columns = dict((name, list(values.values())) for name, values in minutes.items())
+    pq.write_table(to_table(columns, MINUTES_SCHEMA), output_path, compression="zstd")
+    return len(columns["playerId"])
+
+
+def read_events(path, columns=None, filters=None):
+    """
+    Read a parquet file of convert_events as a DataFrame.
+
+    The names are categoricals and the tags are kept as arrow lists, which has_tag of
+    utils/events/tags.py searches without a loop in python. filters are passed to
+    pq.read_table, for example [("matchId", "<=", match_id)] only reads the row groups with
+    those matches.
+    """
+    table = pq.read_table(path, columns=columns, filters=filters)
+    return table.to_pandas(
+        types_mapper=lambda type_: pd.ArrowDtype(type_) if pa.types.is_list(type_) else None
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("kind", choices=["events", "players", "minutes"])
+    parser.add_argument("json_path")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    convert = {
+        "events": convert_events,
+        "players": convert_players,
+        "minutes": convert_minutes,
+    }
+    n = convert[args.kind](args.json_path, args.output)
+    print(f"{n} {args.kind} rows written")
@@ -0,0 +1,314 @@
+"""
+The metrics of the forwards in data/events/Forwards.csv, from the parquet files of
+utils/events/ingest.py.
+
+plot_RadarPlot.py calculates every metric with its own function, each filtering the whole event
+table again. Here every event is classified once, into one boolean column per metric, and one
+groupby over the players sums them all. Receptions in the final third are counted for the player
+of the next event in the same match, with a second block of rows in the same groupby.
+
+The matches are split in ranges over a process pool. Every worker reads only its matches from
+the parquet files and returns the counts per player, the shots and the touches for the
+possession of utils/events/possession.py. The xG models (headers and other shots, on distance
+and angle) are then fitted on the shots of all matches, with a logistic regression like the
+binomial GLM of the radar plot, and the npxG is summed per player.
+
+Usage (from the root of the repository):
+    python -m utils.events.metrics data/events/events_England.parquet \
+        --minutes data/events/minutes_played_per_game_England.parquet \
+        --players data/events/players.parquet --league England --season 2017-18 \
+        [--output data/events/Forwards.csv] [--workers 4]
+
+Several leagues are combined by giving several events and minutes files. The forwards are
+written to the csv file and to the league=/season=/position=Forward partition of the players
+dataset read by the football scout page, see utils/partition_players.py.
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from utils.events.ingest import read_events
+from utils.events.possession import count_touches, get_possession, adjust_per90, METRICS
+from utils.events.tags import has_tag, GOAL, ASSIST, KEY_PASS, HEAD, WON, ACCURATE
+from utils.partition_players import write_partition
+
+EVENT_COLUMNS = [
+    "matchId",
+    "matchPeriod",
+    "eventSec",
+    "teamId",
+    "playerId",
+    "eventName",
+    "subEventName",
+    "tags",
+    "x_start",
+    "y_start",
+    "x_end",
+]
+# The metrics that are counted, npxG is summed over the shots
+COUNTS = [metric for metric in METRICS if metric != "npxG"]
+
+
+def classify_events(events):
+    """
+    Classify every event once, for all the metrics that are counted.
+
+    Returns:
+    DataFrame with a boolean column per metric of COUNTS, in the order of events, and an array
+    with the player of the next event in the same match (NaN for the last event of a match).
+    """
+    event_name = events["eventName"].to_numpy()
+    sub_event_name = events["subEventName"].to_numpy()
+    tags = events["tags"]
+
+    def with_tag(mask, tag_id):
+        found = np.zeros(len(events), dtype=bool)
+        found[mask] = has_tag(tags[mask], tag_id)
+        return found
+
+    is_pass = event_name == "Pass"
+    accurate = with_tag(is_pass, ACCURATE)
+    air_duels_won = with_tag(sub_event_name == "Air duel", WON)
+    ground_duels_won = with_tag(sub_event_name == "Ground attacking duel", WON)
+
+    end_x = events["x_end"].to_numpy(dtype=float) * 105 / 100
+    final_third_passes = accurate & (end_x > 2 * 105 / 3)
+
+    player_ids = events["playerId"].to_numpy(dtype=float)
+    match_ids = events["matchId"].to_numpy()
+    next_player = np.append(player_ids[1:], np.nan)
+    next_player[np.append(match_ids[1:] != match_ids[:-1], True)] = np.nan
+
+    classes = pd.DataFrame(
+        {
+            "final_third_passes": final_third_passes,
+            "final_third_receptions": np.zeros(len(events), dtype=bool),
+            "ground_duels_won": ground_duels_won,
+            "air_duels_won": air_duels_won,
+            "smart_passes": accurate & (sub_event_name == "Smart pass"),
+            "goals": with_tag(sub_event_name == "Shot", GOAL),
+            "assists": with_tag(is_pass, ASSIST),
+            "key_passes": with_tag(is_pass, KEY_PASS),
+        }
+    )
+    return classes, next_player
+
+
+def get_shots(events):
+    """
+    The shots, with the distance and angle to the goal in meters and radians like calulatexG
+    of the radar plot.
+    """
+    shots = events.loc[events["eventName"].to_numpy() == "Shot"]
+    x = (100 - shots["x_start"].to_numpy(dtype=float)) * 105 / 100
+    c = np.abs(shots["y_start"].to_numpy(dtype=float) - 50) * 68 / 100
+    angle = np.arctan(7.32 * x / (x**2 + c**2 - (7.32 / 2) ** 2))
+    return pd.DataFrame(
+        {
+            "playerId": shots["playerId"].to_numpy(),
+            "Distance": np.sqrt(x**2 + c**2),
+            "Angle": np.where(angle > 0, angle, angle + np.pi),
+            "header": has_tag(shots["tags"], HEAD),
+            "Goal": has_tag(shots["tags"], GOAL),
+        }
+    )
+
+
+def count_metrics(events):
+    """
+    The counts of COUNTS per player in events, in one groupby.
+
+    Returns:
+    DataFrame of counts indexed by playerId.
+    """
+    classes, next_player = classify_events(events)
+    receptions = classes["final_third_passes"].to_numpy() & ~np.isnan(next_player)
+    # The receptions are a second block of rows, for the players of the next events
+    received = pd.DataFrame(False, index=range(receptions.sum()), columns=COUNTS)
+    received["final_third_receptions"] = True
+
+    rows = pd.concat([classes, received], ignore_index=True)
+    rows["playerId"] = np.concatenate(
+        [events["playerId"].to_numpy(dtype=float), next_player[receptions]]
+    )
+    counts = rows.groupby("playerId").sum().astype(np.int64)
+    counts.index = counts.index.astype(np.int64)
+    return counts
+
+
+def count_matches(paths, minutes_per_game, first_match=None, last_match=None):
+    """
+    Read the events of the matches from first_match to last_match (all matches if None) in the
+    parquet files of paths and count them.
+
+    Returns:
+    The counts of count_metrics, the shots of get_shots, and the team touches and all touches
+    of count_touches for the rows of minutes_per_game in these matches.
+    """
+    filters = None
+    if first_match is not None:
+        filters = [("matchId", ">=", first_match), ("matchId", "<=", last_match)]
+        match_ids = minutes_per_game["matchId"]
+        minutes_per_game = minutes_per_game.loc[
+            (match_ids >= first_match) & (match_ids <= last_match)
+        ]
+
+    events = pd.concat(
+        [read_events(path, columns=EVENT_COLUMNS, filters=filters) for path in paths],
+        ignore_index=True,
+    )
+    team_touches, all_touches = count_touches(events, minutes_per_game)
+    touches = pd.DataFrame(
+        {"team_touches": team_touches, "all_touches": all_touches},
+        index=minutes_per_game.index,
+    )
+    return count_metrics(events), get_shots(events), touches
+
+
+def fit_logistic(X, y, max_iterations=100, tolerance=1e-10):
+    """
+    Maximum likelihood logistic regression with an intercept, with Newton's method (iteratively
+    reweighted least squares, like the binomial GLM of statsmodels).
+
+    Returns:
+    The coefficients, the intercept first.
+    """
+    X = np.column_stack([np.ones(len(X)), X])
+    y = np.asarray(y, dtype=float)
+    beta = np.zeros(X.shape[1])
+    for _ in range(max_iterations):
+        p = 1 / (1 + np.exp(-X @ beta))
+        step = np.linalg.solve(X.T @ (X * (p * (1 - p))[:, None]), X.T @ (y - p))
+        beta += step
+        if np.max(np.abs(step)) < tolerance:
+            break
+    return beta
+
+
+def calculate_xg(shots):
+    """
+    xG of every shot of get_shots, from one model for headers and one for the other shots.
+    """
+    xg = np.zeros(len(shots))
+    features = shots[["Distance", "Angle"]].to_numpy()
+    goals = shots["Goal"].to_numpy()
+    for model in [shots["header"].to_numpy(), ~shots["header"].to_numpy()]:
+        if model.any():
+            beta = fit_logistic(features[model], goals[model])
+            xg[model] = 1 / (1 + np.exp(-beta[0] - features[model] @ beta[1:]))
+    return xg
+
+
+def get_match_ranges(paths, n):
+    """
+    Split the matches in the files in up to n ranges of consecutive match ids.
+    """
+    match_ids = np.unique(
+        np.concatenate(
+            [pq.read_table(path, columns=["matchId"])["matchId"].to_numpy() for path in paths]
+        )
+    )
+    chunks = np.array_split(match_ids, max(1, min(n, len(match_ids))))
+    return [(int(chunk[0]), int(chunk[-1])) for chunk in chunks if len(chunk)]
+
+
+def aggregate_metrics(paths, minutes_per_game, workers=None):
+    """
+    Sum the metrics of every player over the events in the parquet files of paths, and calculate
+    the possession of the players in minutes_per_game.
+
+    Arguments:
+    paths: Parquet files of events, from utils/events/ingest.py.
+    minutes_per_game: DataFrame of the minutes played per game in the matches of the files.
+    workers: Number of processes, all cpus by default. With 1 the files are read in one go.
+
+    Returns:
+    DataFrame with playerId and the columns of METRICS, and DataFrame with playerId and possesion.
+    """
+    minutes_per_game = minutes_per_game.reset_index(drop=True)
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        results = [count_matches(paths, minutes_per_game)]
+    else:
+        # A few ranges per worker, as the number of events per match varies
+        ranges = get_match_ranges(paths, 4 * workers)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    count_matches,
+                    [paths] * len(ranges),
+                    [minutes_per_game] * len(ranges),
+                    [first for first, _ in ranges],
+                    [last for _, last in ranges],
+                )
+            )
+
+    counts = pd.concat([counts for counts, _, _ in results]).groupby(level=0).sum()
+    shots = pd.concat([shots for _, shots, _ in results], ignore_index=True)
+    npxg = shots.assign(npxG=calculate_xg(shots)).groupby("playerId")["npxG"].sum()
+    metrics = counts.join(npxg, how="outer").fillna(0)
+    metrics.index.name = "playerId"
+
+    touches = pd.concat([touches for _, _, touches in results])
+    touches = touches.reindex(minutes_per_game.index, fill_value=0)
+    possession = get_possession(
+        minutes_per_game["playerId"], touches["team_touches"], touches["all_touches"]
+    )
+    return metrics.reset_index()[["playerId"] + METRICS], possession
+
+
+def forwards_per90(
+    paths, minutes_per_game, players, minimal_minutes=400, role="Forward", workers=None
+):
+    """
+    The possession adjusted metrics per 90 minutes of the players with role who played more than
+    minimal_minutes, in the format of data/events/Forwards.csv.
+
+    Arguments:
+    paths: Parquet files of events, from utils/events/ingest.py.
+    minutes_per_game: DataFrame of the minutes played per game in the matches of the files.
+    players: DataFrame with playerId, shortName and role, like players.parquet of ingest.py.
+    """
+    metrics, possession = aggregate_metrics(paths, minutes_per_game, workers)
+
+    minutes = minutes_per_game.groupby("playerId")["minutesPlayed"].sum().reset_index()
+    summary = minutes.merge(metrics, how="left", on=["playerId"]).fillna(0)
+    summary = summary.loc[summary["minutesPlayed"] > minimal_minutes]
+    summary = summary.merge(
+        players.loc[players["role"] == role, ["playerId", "shortName"]],
+        how="inner",
+        on=["playerId"],
+    )
+    return adjust_per90(summary, possession)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("events", nargs="+", help="parquet files of events")
+    parser.add_argument("--minutes", nargs="+", required=True)
+    parser.add_argument("--players", required=True)
+    parser.add_argument("--league", required=True, help="league of the players partition")
+    parser.add_argument("--season", required=True, help="season of the players partition")
+    parser.add_argument("--output", default="data/events/Forwards.csv")
+    parser.add_argument("--minimal-minutes", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    minutes_per_game = pd.concat(
+        [pd.read_parquet(path) for path in args.minutes], ignore_index=True
+    )
+    forwards = forwards_per90(
+        args.events,
+        minutes_per_game,
+        pd.read_parquet(args.players),
+        minimal_minutes=args.minimal_minutes,
+        workers=args.workers,
+    )
+    forwards.to_csv(args.output, index=False)
+    print(f"{len(forwards)} forwards written to {args.output}")
+    write_partition(forwards, args.league, args.season, "Forward")
@@ -0,0 +1,185 @@
+"""
+Possession of the team of a player while they were on the pitch, from Wyscout event data.
+
+Possession is the number of touches of the team divided by the number of all touches. Touches
+are passes and duels, except the duels in which a player lost contact with the ball (lost air
+duels, lost ground defending duels and lost loose ball duels).
+
+The events are grouped by match once. Per match the touches are sorted by time, with the second
+half after the last event of the first half, and counted cumulatively for all touches and for
+each team. The touches in the time a player was on the pitch (player_in_min to player_out_min of
+the minutes played per game) are then the difference of two counters, found with searchsorted,
+for all the players in the match at once.
+
+Usage:
+    possession = possession_per_player(events, minutes_per_game)
+    forwards = adjust_per90(summary, possession)
+    forwards.to_csv("data/events/Forwards.csv", index=False)
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.events.tags import has_tag, LOST
+
+TOUCH_EVENTS = ["Pass", "Duel"]
+NO_CONTACT_DUELS = ["Air duel", "Ground defending duel", "Ground loose ball duel"]
+
+# Metrics of the players, in the order of the columns of data/events/Forwards.csv
+METRICS = [
+    "npxG",
+    "final_third_passes",
+    "final_third_receptions",
+    "ground_duels_won",
+    "air_duels_won",
+    "smart_passes",
+    "goals",
+    "assists",
+    "key_passes",
+]
+
+
+def get_match_seconds(events):
+    """
+    Seconds since the start of the match of every event, the second half continues after the
+    last event of the first half.
+    """
+    period = events["matchPeriod"].to_numpy()
+    first_half = events.loc[period == "1H"]
+    offsets = first_half.groupby("matchId")["eventSec"].last()
+
+    seconds = events["eventSec"].to_numpy(dtype=float, copy=True)
+    second_half = period == "2H"
+    seconds[second_half] += (
+        events.loc[second_half, "matchId"].map(offsets).fillna(0).to_numpy()
+    )
+    return seconds
+
+
+def get_touches(events):
+    """
+    The touches of the events, sorted by match and time.
+
+    Returns:
+    DataFrame with matchId, teamId and eventSec, in seconds since the start of the match.
+    """
+    is_touch = events["eventName"].isin(TOUCH_EVENTS).to_numpy(copy=True)
+    maybe_lost = is_touch & events["subEventName"].isin(NO_CONTACT_DUELS).to_numpy()
+    is_touch[maybe_lost] = ~has_tag(events.loc[maybe_lost, "tags"], LOST)
+
+    touches = pd.DataFrame(
+        {
+            "matchId": events["matchId"].to_numpy()[is_touch],
+            "teamId": events["teamId"].to_numpy()[is_touch],
+            "eventSec": get_match_seconds(events)[is_touch],
+        }
+    )
+    return touches.sort_values(["matchId", "eventSec"], kind="stable", ignore_index=True)
+
+
+def count_touches(events, minutes_per_game):
+    """
+    Touches of the team of the player and all touches while the player was on the pitch,
+    for every row of minutes_per_game.
+
+    Arguments:
+    events: DataFrame of Wyscout events with matchId, matchPeriod, eventSec, teamId, eventName,
+            subEventName and tags.
+    minutes_per_game: DataFrame with matchId, teamId, player_in_min and player_out_min.
+
+    Returns:
+    Two arrays with the team touches and all touches, in the order of minutes_per_game.
+    """
+    touches = get_touches(events)
+    seconds = touches["eventSec"].to_numpy()
+    teams = touches["teamId"].to_numpy()
+
+    game_teams = minutes_per_game["teamId"].to_numpy()
+    seconds_in = minutes_per_game["player_in_min"].to_numpy() * 60
+    seconds_out = minutes_per_game["player_out_min"].to_numpy() * 60
+
+    team_touches = np.zeros(len(minutes_per_game), dtype=np.int64)
+    all_touches = np.zeros(len(minutes_per_game), dtype=np.int64)
+
+    match_touches = touches.groupby("matchId", sort=False).indices
+    for match_id, games in minutes_per_game.groupby("matchId", sort=False).indices.items():
+        if match_id not in match_touches:
+            continue
+        # Positions of the touches of the match, which are sorted by time
+        match = match_touches[match_id]
+        match_seconds = seconds[match]
+        start = np.searchsorted(match_seconds, seconds_in[games], side="right")
+        end = np.searchsorted(match_seconds, seconds_out[games], side="right")
+        all_touches[games] = end - start
+
+        # Cumulative count of the touches of each team, with a row of zeros before the first
+        team_ids, team_index = np.unique(teams[match], return_inverse=True)
+        counts = np.zeros((len(match) + 1, len(team_ids)), dtype=np.int64)
+        np.cumsum(team_index[:, None] == np.arange(len(team_ids)), axis=0, out=counts[1:])
+
+        column = np.searchsorted(team_ids, game_teams[games]).clip(max=len(team_ids) - 1)
+        found = team_ids[column] == game_teams[games]
+        team_touches[games] = np.where(
+            found, counts[end, column] - counts[start, column], 0
+        )
+
+    return team_touches, all_touches
+
+
+def possession_per_player(events, minutes_per_game):
+    """
+    Possession of the team of every player in minutes_per_game while they were on the pitch,
+    over all their games.
+
+    Returns:
+    DataFrame with playerId and possesion, 0 for players without any touches on the pitch.
+    """
+    team_touches, all_touches = count_touches(events, minutes_per_game)
+    return get_possession(minutes_per_game["playerId"], team_touches, all_touches)
+
+
+def get_possession(player_ids, team_touches, all_touches):
+    """
+    Sum the touches of count_touches per player and divide the team touches by all touches.
+    """
+    touches = (
+        pd.DataFrame(
+            {
+                "playerId": np.asarray(player_ids),
+                "team_passes": team_touches,
+                "all_passes": all_touches,
+            }
+        )
+        .groupby("playerId")
+        .sum()
+    )
+    possession = np.divide(
+        touches["team_passes"].to_numpy(dtype=float),
+        touches["all_passes"].to_numpy(),
+        out=np.zeros(len(touches)),
+        where=touches["all_passes"].to_numpy() > 0,
+    )
+    return pd.DataFrame({"playerId": touches.index.to_numpy(), "possesion": possession})
+
+
+def adjust_per90(summary, possession, metrics=METRICS):
+    """
+    Metrics per 90 minutes, divided by the possession of the team while the player was on the pitch.
+
+    Arguments:
+    summary: DataFrame with playerId, shortName, minutesPlayed and the metrics summed over the
+             season.
+    possession: DataFrame with playerId and possesion, from possession_per_player.
+
+    Returns:
+    DataFrame with the columns of data/events/Forwards.csv: shortName, the metrics with
+    _adjusted_per90 and Minutes.
+    """
+    summary = summary.merge(possession, how="left", on=["playerId"])
+    adjusted = pd.DataFrame({"shortName": summary["shortName"]})
+    for metric in metrics:
+        adjusted[metric + "_adjusted_per90"] = (
+            summary[metric] / summary["possesion"] * 90 / summary["minutesPlayed"]
+        )
+    adjusted["Minutes"] = summary["minutesPlayed"]
+    return adjusted
@@ -0,0 +1,46 @@
+"""
+Wyscout event tags, see https://dataglossary.wyscout.com/.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+GOAL = 101
+ASSIST = 301
+KEY_PASS = 302
+HEAD = 403
+LOST = 701
+WON = 703
+ACCURATE = 1801
+
+
+def has_tag(tags, tag_id):
+    """
+    Boolean array, True for the events with tag_id in their tags.
+
+    Arguments:
+    tags: Series or sequence of the tags of the events, as lists of {"id": ...} dicts like in the
+          Wyscout json files, or as lists of tag ids like in the parquet files of
+          utils/events/ingest.py.
+    """
+    if isinstance(tags, pd.Series) and isinstance(tags.dtype, pd.ArrowDtype):
+        # Arrow lists, search the flattened tag ids of all events at once
+        tags = pa.array(tags)
+        found = np.zeros(len(tags), dtype=bool)
+        events = pc.list_parent_indices(tags).to_numpy()
+        found[events[pc.list_flatten(tags).to_numpy() == tag_id]] = True
+        return found
+
+    tag = {"id": tag_id}
+
+    def contains(event_tags):
+        # The element type tells the formats apart, both can be python lists
+        if len(event_tags) and isinstance(event_tags[0], dict):
+            return tag in event_tags
+        return tag_id in event_tags
+
+    return np.fromiter(
+        (contains(event_tags) for event_tags in tags), dtype=bool, count=len(tags)
+    )
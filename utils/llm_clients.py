@@ -0,0 +1,205 @@
+"""
+Long-lived LLM clients shared by the whole app.
+
+Creating an OpenAI client per call throws away its HTTP connection pool, so every
+request pays for a new TCP connection and TLS handshake. Instead, one sync and one async
+client is kept per (provider, base_url, api_key) and reused by chats, descriptions and
+embeddings. Gemini is configured once per key.
+
+Per provider latency and connection reuse are recorded and returned by client_metrics().
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+from settings import (
+    GPT_BASE,
+    GPT_KEY,
+    GEMINI_API_KEY,
+    LM_STUDIO_API_BASE,
+    LM_STUDIO_API_KEY,
+)
+
+# Connections are kept open between chat turns, which can be minutes apart
+HTTP_LIMITS = httpx.Limits(
+    max_connections=64, max_keepalive_connections=16, keepalive_expiry=300
+)
+HTTP_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+PROVIDERS = {
+    "openai": lambda: (GPT_BASE, GPT_KEY),
+    "lm_studio": lambda: (LM_STUDIO_API_BASE, LM_STUDIO_API_KEY),
+}
+
+
+class ClientMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def record(self, provider, latency, new_connection, error=False):
+        with self._lock:
+            metrics = self._metrics.setdefault(
+                provider,
+                {
+                    "requests": 0,
+                    "new_connections": 0,
+                    "reused_connections": 0,
+                    "errors": 0,
+                    "total_latency": 0.0,
+                },
+            )
+            metrics["requests"] += 1
+            metrics["total_latency"] += latency
+            # Failed and timed out calls count in the latency too
+            if error:
+                metrics["errors"] += 1
+            # None when the connection is not visible to us, like in the Gemini SDK
+            if new_connection is True:
+                metrics["new_connections"] += 1
+            elif new_connection is False:
+                metrics["reused_connections"] += 1
+
+    def summary(self):
+        with self._lock:
+            return {
+                provider: dict(
+                    metrics, mean_latency=metrics["total_latency"] / metrics["requests"]
+                )
+                for provider, metrics in self._metrics.items()
+            }
+
+
+metrics = ClientMetrics()
+
+
+class MeteredTransport(httpx.HTTPTransport):
+    """
+    Records the time until the response headers arrive and whether a new connection was opened.
+    """
+
+    def __init__(self, provider, **kwargs):
+        super().__init__(**kwargs)
+        self.provider = provider
+
+    def handle_request(self, request):
+        new_connection = False
+
+        def trace(name, info):
+            nonlocal new_connection
+            if name == "connection.connect_tcp.started":
+                new_connection = True
+
+        request.extensions["trace"] = trace
+        start = time.perf_counter()
+        error = True
+        try:
+            response = super().handle_request(request)
+            error = False
+            return response
+        finally:
+            metrics.record(self.provider, time.perf_counter() - start, new_connection, error)
+
+
+class AsyncMeteredTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, provider, **kwargs):
+        super().__init__(**kwargs)
+        self.provider = provider
+
+    async def handle_async_request(self, request):
+        new_connection = False
+
+        async def trace(name, info):
+            nonlocal new_connection
+            if name == "connection.connect_tcp.started":
+                new_connection = True
+
+        request.extensions["trace"] = trace
+        start = time.perf_counter()
+        error = True
+        try:
+            response = await super().handle_async_request(request)
+            error = False
+            return response
+        finally:
+            metrics.record(self.provider, time.perf_counter() - start, new_connection, error)
+
+
+_lock = threading.Lock()
+_clients = {}
+# Async clients are bound to the event loop they were first used in
+_async_clients = weakref.WeakKeyDictionary()
+_gemini_key = None
+
+
+def get_client(provider="openai"):
+    base_url, api_key = PROVIDERS[provider]()
+    key = (provider, base_url, api_key)
+    with _lock:
+        if key not in _clients:
+            _clients[key] = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=DefaultHttpxClient(
+                    transport=MeteredTransport(provider, limits=HTTP_LIMITS),
+                    timeout=HTTP_TIMEOUT,
+                ),
+            )
+        return _clients[key]
+
+
+def get_async_client(provider="openai"):
+    base_url, api_key = PROVIDERS[provider]()
+    key = (provider, base_url, api_key)
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=DefaultAsyncHttpxClient(
+                    transport=AsyncMeteredTransport(provider, limits=HTTP_LIMITS),
+                    timeout=HTTP_TIMEOUT,
+                ),
+            )
+        return clients[key]
+
+
+def configure_gemini():
+    """
+    Configure the Gemini SDK, which keeps its own client, once per API key.
+    """
+    global _gemini_key
+    import google.generativeai as genai
+
+    with _lock:
+        if _gemini_key != GEMINI_API_KEY:
+            genai.configure(api_key=GEMINI_API_KEY)
+            _gemini_key = GEMINI_API_KEY
+    return genai
+
+
+@contextmanager
+def measure(provider):
+    """
+    Record the latency of a call made through an SDK that does not use the clients above,
+    also when the call fails.
+    """
+    start = time.perf_counter()
+    error = True
+    try:
+        yield
+        error = False
+    finally:
+        metrics.record(provider, time.perf_counter() - start, new_connection=None, error=error)
+
+
+def client_metrics():
+    return metrics.summary()
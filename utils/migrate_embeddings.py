@@ -0,0 +1,43 @@
+"""
+Rewrite embeddings parquet files in the current on-disk format.
+
+Files written before the format was versioned store every vector as str(list) and have to be
+parsed on every load. This converts them to a fixed size float32 column. Files that already
+use the current format are left untouched.
+
+Usage (from the root of the repository):
+    python -m utils.migrate_embeddings [paths ...]
+
+Without paths, every file in data/embeddings/ is migrated.
+"""
+
+import glob
+import sys
+
+import pyarrow.parquet as pq
+
+from classes.embeddings import (
+    EMBEDDINGS_FORMAT_KEY,
+    EMBEDDINGS_FORMAT_VERSION,
+    read_embeddings,
+    read_embeddings_model,
+    write_embeddings,
+)
+
+
+def migrate(path):
+    metadata = pq.read_schema(path).metadata or {}
+    if metadata.get(EMBEDDINGS_FORMAT_KEY) == str(EMBEDDINGS_FORMAT_VERSION).encode():
+        print(f"{path}: already in format {EMBEDDINGS_FORMAT_VERSION}")
+        return
+
+    df, matrix = read_embeddings(path)
+    df["user_embedded"] = list(matrix)
+    write_embeddings(df, path, model=read_embeddings_model(path))
+    print(f"{path}: migrated {len(df)} rows to format {EMBEDDINGS_FORMAT_VERSION}")
+
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] or sorted(glob.glob("data/embeddings/*.parquet"))
+    for path in paths:
+        migrate(path)
@@ -7,7 +7,6 @@ import base64
 from pathlib import Path
 
 import streamlit as st
-import copy
 
 # from pages import about, football_scout, embedder, wvs_chat, own_page
 
@@ -126,42 +125,36 @@ def add_common_page_elements():
 
 def select_player(container, players, gender, position):
 
-    # Make a copy of Players object
-    player = copy.deepcopy(players)
-
-    # Filter players by position and select a player with sidebar selectors
+    # Select a player with sidebar selectors, players is shared between sessions and not modified
     with container:
 
-        # Filter for player name
-        player.select_and_filter(
+        # Look up the row of the player name
+        row = players.select_row(
             column_name="player_name",
             label="Player",
         )
 
         # Return data point
 
-        player = player.to_data_point(gender, position)
+        player = players.to_data_point(gender, position, row=row)
 
     return player
 
 
 def select_person(container, person_stat):
 
-    # Make a copy of Players object
-    person = copy.deepcopy(person_stat)
-
-    # Filter players by position and select a player with sidebar selectors
+    # Select a person with sidebar selectors, person_stat is shared between sessions and not modified
     with container:
 
-        # Filter for player name
-        person.select_and_filter(
+        # Look up the row of the person name
+        row = person_stat.select_row(
             column_name="name",
             label="Person",
         )
 
         # Return data point
 
-        person = person.to_data_point()
+        person = person_stat.to_data_point(row=row)
 
     return person
 
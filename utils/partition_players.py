@@ -0,0 +1,85 @@
+"""
+Build and precompute the players dataset used by PlayerStats.
+
+The dataset in data/events/players is a parquet dataset partitioned by league, season and
+position, so a page only reads the players it compares against. Each partition is a folder
+like league=England/season=2017-18/position=Forward.
+
+Usage (from the root of the repository):
+    python -m utils.partition_players convert data/events/Forwards.csv --league England --season 2017-18 --position Forward
+    python -m utils.partition_players precompute [--workers 4]
+
+convert adds (or replaces) the partition of one csv file with one row per player, like
+data/events/Forwards.csv. The producers of Forwards.csv, data/events/plot_RadarPlot.py and
+python -m utils.events.metrics, write their partition with write_partition as well, so the
+dataset stays in sync with the csv. precompute calculates the statistics of every partition in a process
+pool and stores them in data/cache/stats, for the metrics of pages/football_scout.py.
+"""
+
+import argparse
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from classes.data_source import PlayerStats, PLAYER_PARTITIONING
+
+# Must match the metrics and minimal minutes in pages/football_scout.py
+METRICS = [
+    "npxG_adjusted_per90",
+    "goals_adjusted_per90",
+    "assists_adjusted_per90",
+    "key_passes_adjusted_per90",
+    "smart_passes_adjusted_per90",
+    "final_third_passes_adjusted_per90",
+    "final_third_receptions_adjusted_per90",
+    "ground_duels_won_adjusted_per90",
+    "air_duels_won_adjusted_per90",
+]
+MINIMAL_MINUTES = 300
+
+
+def write_partition(df, league, season, position):
+    """
+    Add (or replace) the partition of league, season and position with the players in df,
+    a dataframe in the format of data/events/Forwards.csv.
+    """
+    df = df.assign(league=league, season=season, position=position)
+
+    ds.write_dataset(
+        pa.Table.from_pandas(df, preserve_index=False),
+        PlayerStats.dataset_path,
+        format="parquet",
+        partitioning=PLAYER_PARTITIONING,
+        basename_template="part-{i}.parquet",
+        # Only the partition that is written is replaced
+        existing_data_behavior="delete_matching",
+    )
+    print(f"{len(df)} players written to {league}/{season}/{position}")
+
+
+def convert(csv_path, league, season, position):
+    write_partition(pd.read_csv(csv_path, encoding="unicode_escape"), league, season, position)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = commands.add_parser("convert")
+    convert_parser.add_argument("csv_path")
+    convert_parser.add_argument("--league", required=True)
+    convert_parser.add_argument("--season", required=True)
+    convert_parser.add_argument("--position", required=True)
+
+    precompute_parser = commands.add_parser("precompute")
+    precompute_parser.add_argument("--workers", type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == "convert":
+        convert(args.csv_path, args.league, args.season, args.position)
+    else:
+        partitions = PlayerStats.precompute(
+            METRICS, minimal_minutes=MINIMAL_MINUTES, max_workers=args.workers
+        )
+        print(f"Statistics calculated for {len(partitions)} partitions")
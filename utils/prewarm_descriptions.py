@@ -0,0 +1,98 @@
+"""
+Fill the response cache with the summary of every player, country and person.
+
+The pages then replay the cached summary instead of calling the LLM when a chat starts.
+The data sources, metrics and description settings below must match the ones used in
+pages/football_scout.py, pages/wvs_chat.py and pages/personality_test.py, otherwise the
+prompts differ and the cache is not hit.
+
+Usage (from the root of the repository):
+    python -m utils.prewarm_descriptions [player] [country] [person]
+
+Without arguments all three are pre-warmed.
+"""
+
+import json
+import sys
+
+import pandas as pd
+
+from classes.data_source import PlayerStats, CountryStats, PersonStat
+from classes.description import (
+    PlayerDescription,
+    CountryDescription,
+    PersonDescription,
+    get_response_cache,
+)
+
+
+def prewarm_players():
+    metrics = [
+        "npxG_adjusted_per90",
+        "goals_adjusted_per90",
+        "assists_adjusted_per90",
+        "key_passes_adjusted_per90",
+        "smart_passes_adjusted_per90",
+        "final_third_passes_adjusted_per90",
+        "final_third_receptions_adjusted_per90",
+        "ground_duels_won_adjusted_per90",
+        "air_duels_won_adjusted_per90",
+    ]
+    players = PlayerStats.load(
+        metrics=metrics,
+        minimal_minutes=300,
+        league="England",
+        season="2017-18",
+        position="Forward",
+    )
+
+    for name, row in players.get_row_index("player_name").items():
+        player = players.to_data_point(gender="male", position="Forward", row=row)
+        PlayerDescription(player).stream_gpt()
+        print(f"player: {name}")
+
+
+def prewarm_countries():
+    metrics = [
+        m for m in pd.read_csv("data/wvs/wave_7.csv", nrows=0).columns if m not in ["country"]
+    ]
+    countries = CountryStats.load(metrics=metrics)
+
+    with open("data/wvs/description_dict.json", "r") as f:
+        description_dict = json.load(f)
+    thresholds_dict = dict((metric, [2, 1, -1, -2]) for metric in metrics)
+
+    for name, row in countries.get_row_index("country").items():
+        country = countries.to_data_point(row=row)
+        CountryDescription(
+            country, description_dict=description_dict, thresholds_dict=thresholds_dict
+        ).stream_gpt()
+        print(f"country: {name}")
+
+
+def prewarm_persons():
+    metrics = [
+        "extraversion",
+        "neuroticism",
+        "agreeableness",
+        "conscientiousness",
+        "openness",
+    ]
+    persons = PersonStat.load(metrics=metrics)
+
+    for name, row in persons.get_row_index("name").items():
+        person = persons.to_data_point(row=row)
+        PersonDescription(person).stream_gpt()
+        print(f"person: {name}")
+
+
+if __name__ == "__main__":
+    prewarm = {
+        "player": prewarm_players,
+        "country": prewarm_countries,
+        "person": prewarm_persons,
+    }
+    for entity_type in sys.argv[1:] or prewarm.keys():
+        prewarm[entity_type]()
+
+    print(get_response_cache().stats())
@@ -0,0 +1,141 @@
+"""
+CSV readers with interchangeable backends, used by the Data classes in classes/data_source.py.
+
+- "pandas": pandas.read_csv, single threaded.
+- "arrow": pyarrow.csv, multithreaded, only the requested columns are converted.
+- "polars": polars.scan_csv, lazy and multithreaded, only the requested columns are read.
+  Polars is an optional dependency.
+
+Every backend returns the same pandas DataFrame as the pandas backend, so the rest of the
+pipeline does not depend on the backend. Files saved with escaped characters (like \\u00c1 or \\t)
+are read with unicode_escape=True, which decodes them like encoding="unicode_escape" in pandas.
+"""
+
+import codecs
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+from utils.datalib.polars_helper import polars as pl, assert_has_polars
+
+BACKENDS = ["pandas", "arrow", "polars"]
+
+
+class UnicodeEscapeFile(io.RawIOBase):
+    """
+    Binary file that returns the utf-8 encoding of a file with escaped characters.
+
+    Escapes can stand for separators and line endings, so they are decoded before parsing.
+    The file is decoded one chunk at a time, so no decoded copy of the whole file is made.
+    """
+
+    def __init__(self, path, chunk_size=1 << 20):
+        self._file = open(path, "rb")
+        self._decoder = codecs.getincrementaldecoder("unicode_escape")()
+        self._chunk_size = chunk_size
+        self._buffer = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while len(self._buffer) == 0 and not self._file.closed:
+            chunk = self._file.read(self._chunk_size)
+            self._buffer = memoryview(
+                self._decoder.decode(chunk, final=not chunk).encode("utf-8")
+            )
+            if not chunk:
+                self._file.close()
+
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def _open(path, unicode_escape):
+    return io.BufferedReader(UnicodeEscapeFile(path)) if unicode_escape else path
+
+
+def _read_csv_pandas(path, columns, sep, unicode_escape):
+    return pd.read_csv(
+        path,
+        sep=sep,
+        usecols=columns,
+        encoding="unicode_escape" if unicode_escape else None,
+        # Correctly rounded floats, like the other backends
+        float_precision="round_trip",
+    )
+
+
+def _read_csv_arrow(path, columns, sep, unicode_escape):
+    parse_options = pa_csv.ParseOptions(delimiter=sep)
+
+    def read(column_types):
+        return pa_csv.read_csv(
+            _open(path, unicode_escape),
+            parse_options=parse_options,
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=columns, column_types=column_types
+            ),
+        )
+
+    table = read({})
+
+    # pandas keeps dates and times as text, read those columns again as strings
+    temporal = dict(
+        (field.name, pa.string())
+        for field in table.schema
+        if pa.types.is_temporal(field.type)
+    )
+    if temporal:
+        table = read(temporal)
+
+    # Consolidated, writable blocks like the pandas backend, the frames are modified in place
+    return table.to_pandas()
+
+
+def _read_csv_polars(path, columns, sep, unicode_escape):
+    assert_has_polars()
+    if unicode_escape:
+        frame = pl.read_csv(_open(path, unicode_escape), separator=sep, columns=columns)
+    else:
+        frame = pl.scan_csv(path, separator=sep)
+        if columns is not None:
+            frame = frame.select(columns)
+        frame = frame.collect()
+
+    return frame.to_pandas()
+
+
+def read_csv(path, backend="pandas", columns=None, sep=",", unicode_escape=False):
+    """
+    Read a csv file into a pandas DataFrame.
+
+    Arguments:
+    path: str
+    backend: one of BACKENDS
+    columns: optional list of str
+        Only these columns are read, in the order of the file.
+    sep: str
+    unicode_escape: bool
+        Decode escaped characters in the file.
+
+    Returns:
+    pd.DataFrame
+    """
+    readers = {
+        "pandas": _read_csv_pandas,
+        "arrow": _read_csv_arrow,
+        "polars": _read_csv_polars,
+    }
+    if backend not in readers:
+        raise ValueError(f"Unknown backend {backend}, use one of {BACKENDS}")
+
+    return readers[backend](path, columns, sep, unicode_escape)
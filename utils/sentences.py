@@ -1,3 +1,6 @@
+import numpy as np
+
+
 # Give the correct gender words
 def pronouns(gender):
     if gender.lower() == "male":
@@ -30,6 +33,29 @@ def describe(thresholds, words, value):
     return words[i]
 
 
+def describe_levels(
+    values,
+    thresholds=[1.5, 1, 0.5, -0.5, -1],
+    words=["outstanding", "excellent", "good", "average", "below average", "poor"],
+):
+    """
+    describe_level for an array of values at once.
+
+    Returns:
+    Object array of words with the shape of values.
+    """
+    assert len(words) == len(thresholds) + 1, "Issue with thresholds and words"
+
+    # describe stops at the first threshold that is not above the value, so the word is
+    # the number of thresholds above the value. NaN is sorted last and gets the first word, like in describe
+    ascending = np.asarray(thresholds, dtype=float)[::-1]
+    index = len(thresholds) - np.searchsorted(
+        ascending, np.asarray(values, dtype=float), side="right"
+    )
+
+    return np.asarray(words, dtype=object)[index]
+
+
 # Format the metrics for display and descriptions
 def format_metric(metric):
     return (
@@ -0,0 +1,242 @@
+"""
+Running statistics of a metric column, used by Stats.update_rows.
+
+Per metric the number of values, their sum and sum of squares and the values in sorted order
+are kept. Adding or removing k values updates them with O(k log n) searches, after which the
+z-score and the rank of any value are found in O(log n) without looking at the other rows,
+and the existing ranks are shifted by comparing them with the k changed values only.
+NaN values are left out, like zscore(nan_policy="omit") and DataFrame.rank do.
+
+PercentileTable keeps the sorted values of every metric in the same way, for the percentiles
+of the radar plots and Stats.get_pct_ranks.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+class RunningMetric:
+    def __init__(self, values):
+        values = self._drop_nan(values)
+
+        # Sums are taken around the first mean to avoid cancellation in the variance
+        self.shift = values.mean() if len(values) > 0 else 0.0
+        self.n = len(values)
+        self.sum = (values - self.shift).sum()
+        self.sum_squares = ((values - self.shift) ** 2).sum()
+        self.sorted = np.sort(values)
+
+    @staticmethod
+    def _drop_nan(values):
+        values = np.asarray(values, dtype=float)
+        return values[~np.isnan(values)]
+
+    def add(self, values):
+        values = np.sort(self._drop_nan(values))
+
+        self.n += len(values)
+        self.sum += (values - self.shift).sum()
+        self.sum_squares += ((values - self.shift) ** 2).sum()
+        self.sorted = np.insert(
+            self.sorted, np.searchsorted(self.sorted, values), values
+        )
+
+    def remove(self, values):
+        values = np.sort(self._drop_nan(values))
+
+        # Equal values are removed from consecutive positions
+        occurrence = np.arange(len(values)) - np.searchsorted(values, values)
+        positions = np.searchsorted(self.sorted, values) + occurrence
+        if np.any(positions >= len(self.sorted)) or np.any(
+            self.sorted[np.minimum(positions, len(self.sorted) - 1)] != values
+        ):
+            raise ValueError("Values to remove are not in the running statistics")
+
+        self.n -= len(values)
+        self.sum -= (values - self.shift).sum()
+        self.sum_squares -= ((values - self.shift) ** 2).sum()
+        self.sorted = np.delete(self.sorted, positions)
+
+    @property
+    def mean(self):
+        return self.shift + self.sum / self.n
+
+    @property
+    def std(self):
+        # Population standard deviation (ddof=0), like scipy.stats.zscore
+        return np.sqrt(max(self.sum_squares / self.n - (self.sum / self.n) ** 2, 0.0))
+
+    def zscores(self, values):
+        values = np.asarray(values, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (values - self.mean) / self.std
+
+    def ranks(self, values):
+        """
+        Descending ranks with ties averaged, like DataFrame.rank(ascending=False).
+        """
+        values = np.asarray(values, dtype=float)
+        left = np.searchsorted(self.sorted, values, side="left")
+        right = np.searchsorted(self.sorted, values, side="right")
+
+        # Number of larger values plus the average position among the equal ones
+        ranks = (self.n - right) + (right - left + 1) / 2
+        return np.where(np.isnan(values), np.nan, ranks)
+
+
+class PercentileTable:
+    """
+    Percentile of any value among the values of every metric, like
+    scipy.stats.percentileofscore(kind="rank").
+
+    The values of every metric are sorted once, after which the percentiles of a player, or of
+    a batch of players, are found with O(log n) searches per metric. For a value in the column
+    this is the same as DataFrame.rank(pct=True) * 100. NaN values are left out of the table
+    and get NaN.
+    """
+
+    def __init__(self, df):
+        """
+        Arguments:
+        df: DataFrame with one column per metric.
+        """
+        self.columns = list(df.columns)
+        self.sorted = [
+            np.sort(RunningMetric._drop_nan(df[column])) for column in self.columns
+        ]
+
+    def percentiles(self, values):
+        """
+        Percentiles of values, which have one value per metric in the order of the columns.
+
+        Arguments:
+        values: A player, as a Series or 1d array, or a batch of players, as a DataFrame or 2d
+                array with one row per player. Series and DataFrames are matched by column name.
+
+        Returns:
+        Percentiles between 0 and 100, in the same shape and type as values.
+        """
+        if isinstance(values, pd.DataFrame):
+            return pd.DataFrame(
+                self.percentiles(values[self.columns].to_numpy(dtype=float)),
+                index=values.index,
+                columns=self.columns,
+            )
+        if isinstance(values, pd.Series):
+            return pd.Series(
+                self.percentiles(values[self.columns].to_numpy(dtype=float)),
+                index=self.columns,
+                name=values.name,
+            )
+
+        values = np.asarray(values, dtype=float)
+        batch = np.atleast_2d(values)
+        percentiles = np.full(batch.shape, np.nan)
+        for i, sorted_values in enumerate(self.sorted):
+            if len(sorted_values) == 0:
+                continue
+            left = np.searchsorted(sorted_values, batch[:, i], side="left")
+            right = np.searchsorted(sorted_values, batch[:, i], side="right")
+            # The same arithmetic as percentileofscore, so the percentiles are equal
+            percentiles[:, i] = (left + right + (left < right)) * (50.0 / len(sorted_values))
+        percentiles[np.isnan(batch)] = np.nan
+        return percentiles.reshape(values.shape)
+
+
+def count_above(sorted_values, values):
+    """
+    Number of larger values plus half the number of equal values in sorted_values, for each of values.
+    """
+    left = np.searchsorted(sorted_values, values, side="left")
+    right = np.searchsorted(sorted_values, values, side="right")
+    return (len(sorted_values) - right) + (right - left) / 2
+
+
+def shift_ranks(ranks, values, added, removed):
+    """
+    Update descending average ranks after values were added to and removed from a column.
+
+    Only the changed values are searched, so this is O(n log k) for k changed values
+    instead of ranking the n values again.
+
+    Arguments:
+    ranks: ranks of values before the change, NaN for missing values.
+    values: values whose rank is updated.
+    added, removed: values added to and removed from the column.
+    """
+    added = np.sort(RunningMetric._drop_nan(added))
+    removed = np.sort(RunningMetric._drop_nan(removed))
+    values = np.asarray(values, dtype=float)
+    return (
+        np.asarray(ranks, dtype=float)
+        + count_above(added, values)
+        - count_above(removed, values)
+    )
+
+
+def statistics_block(values, signs=None, pct_ranks=True):
+    """
+    Z-scores, descending ranks and percentile ranks of every column of values, in one pass.
+
+    Matches zscore(nan_policy="omit"), DataFrame.rank(ascending=False) and
+    DataFrame.rank(pct=True) * 100: missing values are left out of the statistics and get NaN,
+    and tied values get the average of their ranks.
+
+    Arguments:
+    values: 2d float array, one column per metric.
+    signs: optional array with one 1 or -1 per metric, the z-scores of metrics with -1 are negated.
+    pct_ranks: without the percentile ranks the block only has the z-scores and the ranks.
+
+    Returns:
+    Preallocated (n, 3 * m) float64 array with the z-scores in the first m columns, the ranks
+    in the next m and the percentile ranks in the last m, (n, 2 * m) without pct_ranks.
+    """
+    # Work on one contiguous row per metric. The block is allocated the same way and returned
+    # transposed, which is also how pandas stores the columns of a dataframe
+    values = np.ascontiguousarray(np.asarray(values, dtype=np.float64).T)
+    m, n = values.shape
+    with_pct_ranks = pct_ranks
+    block = np.empty(((3 if with_pct_ranks else 2) * m, n))
+    zscores, ranks, pct_ranks = block[:m], block[m : 2 * m], block[2 * m :]
+
+    missing = np.isnan(values)
+    counts = (n - missing.sum(axis=1))[:, None]
+
+    # Columns without values give NaN, without warnings
+    with warnings.catch_warnings(), np.errstate(divide="ignore", invalid="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(values, axis=1, keepdims=True)
+        np.subtract(values, mean, out=zscores)
+        std = np.sqrt(np.nanmean(zscores**2, axis=1, keepdims=True))
+        np.divide(zscores, std, out=zscores)
+    if signs is not None:
+        zscores *= np.asarray(signs)[:, None]
+
+    # Sort every metric once, missing values go last
+    order = np.argsort(values, axis=1)
+    metric_rows = np.arange(m)[:, None]
+    sorted_values = values[metric_rows, order]
+
+    # First and last sorted position of the group of equal values each position belongs to
+    positions = np.arange(n)
+    new_group = np.ones((m, n), dtype=bool)
+    new_group[:, 1:] = sorted_values[:, 1:] != sorted_values[:, :-1]
+    last_in_group = np.ones((m, n), dtype=bool)
+    last_in_group[:, :-1] = new_group[:, 1:]
+    first = np.maximum.accumulate(np.where(new_group, positions, 0), axis=1)
+    last = np.minimum.accumulate(
+        np.where(last_in_group, positions, n - 1)[:, ::-1], axis=1
+    )[:, ::-1]
+
+    # Average ascending rank of the group, starting at 1
+    ascending = (first + last) / 2 + 1
+    ranks[metric_rows, order] = counts + 1 - ascending
+    ranks[missing] = np.nan
+    if with_pct_ranks:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pct_ranks[metric_rows, order] = ascending / counts * 100
+        pct_ranks[missing] = np.nan
+
+    return block.T
@@ -102,41 +102,32 @@ def hex_color_transparency(hex, alpha):
     return c.to_hex(c.to_rgba(hex, alpha), True)
 
 
-import copy
-
-
 def select_player(container, players, gender, position):
 
-    # Make a copy of Players object
-    player = copy.deepcopy(players)
-
-    # Filter players by position and select a player with sidebar selectors
+    # Select a player with sidebar selectors, players is shared between sessions and not modified
     with container:
 
-        # Filter for player name
-        player.select_and_filter(
+        # Look up the row of the player name
+        row = players.select_row(
             column_name="player_name",
             label="Player",
         )
 
         # Return data point
 
-        player = player.to_data_point(gender, position)
+        player = players.to_data_point(gender, position, row=row)
 
     return player
 
 
 def select_country(container, countries):
 
-    # Make a copy of Players object
-    country = copy.deepcopy(countries)
-
-    # rnd = int(country.select_random()) # does not work because of page refresh!
-    # Filter country by position and select a player with sidebar selectors
+    # rnd = int(countries.select_random()) # does not work because of page refresh!
+    # Select a country with sidebar selectors, countries is shared between sessions and not modified
     with container:
 
-        # Filter for player name
-        country.select_and_filter(
+        # Look up the row of the country
+        row = countries.select_row(
             column_name="country",
             label="Country",
             # default_index=rnd,  # randomly select a country for default
@@ -144,7 +135,7 @@ def select_country(container, countries):
 
         # Return data point
 
-        country = country.to_data_point()
+        country = countries.to_data_point(row=row)
 
     return country
 